@@ -0,0 +1,78 @@
+import multiprocessing
+
+import numpy as np
+import torch
+
+from uberduck_ml_dev.data.features import GSTCache, SpectrogramCache
+
+
+class TestSpectrogramCache:
+    def test_roundtrip(self, tmp_path):
+        cache = SpectrogramCache(tmp_path, "config")
+        spec = torch.rand(513, 17)
+        assert cache.get("a.wav") is None
+        cache.put("a.wav", spec)
+        cache.put("b.wav", spec[:, :5])
+        cache.put("a.wav", torch.zeros(513, 3))
+        assert torch.equal(cache.get("a.wav"), spec)
+        assert len(SpectrogramCache(tmp_path, "config")) == 0
+        cache.flush()
+
+        reader = SpectrogramCache(tmp_path, "config")
+        assert len(reader) == 2
+        assert torch.equal(reader.get("b.wav"), spec[:, :5])
+        assert "a.wav" not in SpectrogramCache(tmp_path, "other")
+
+    def test_flush_seconds(self, tmp_path):
+        cache = SpectrogramCache(tmp_path, "config", flush_seconds=0.0)
+        cache.put("a.wav", torch.rand(513, 17))
+        assert len(SpectrogramCache(tmp_path, "config")) == 1
+
+    def test_concurrent_writers(self, tmp_path):
+        keys = [f"{i}.wav" for i in range(40)]
+        context = multiprocessing.get_context("fork")
+        writers = [
+            context.Process(target=_write, args=(tmp_path, keys[start:], seed))
+            for start, seed in [(0, 0), (10, 1)]
+        ]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+            assert writer.exitcode == 0
+
+        reader = SpectrogramCache(tmp_path, "config")
+        assert len(reader) == len(keys)
+        with open(reader.index_path) as f:
+            assert len(f.readlines()) == len(keys)
+        for key in keys:
+            spec = reader.get(key)
+            assert spec.shape == (3, int(key.split(".")[0]) + 1)
+            assert (spec == spec[0, 0]).all()
+
+
+def _write(root, keys, seed):
+    """Put a constant [3, i + 1] spectrogram per key, flushing every few puts."""
+    cache = SpectrogramCache(root, "config", flush_every=3)
+    for key in keys:
+        cache.put(key, torch.full((3, int(key.split(".")[0]) + 1), float(seed)))
+    cache.flush()
+
+
+class TestGSTCache:
+    def test_warm(self, tmp_path):
+        calls = []
+
+        def compute_gst(texts):
+            calls.append(list(texts))
+            return np.array([[len(t), ord(t[0])] for t in texts], dtype=np.float32)
+
+        cache = GSTCache(tmp_path, "config")
+        texts = ["duck", "party", "on", "aisle", "six", "duck"]
+        assert cache.warm(texts, compute_gst, batch_size=2) == 5
+        assert [len(batch) for batch in calls] == [2, 2, 1]
+        assert cache.warm(texts + ["seven"], compute_gst) == 1
+        reader = GSTCache(tmp_path, "config")
+        for text in texts + ["seven"]:
+            assert np.array_equal(reader.get_text(text), compute_gst([text]))
+        assert reader.get_text("missing") is None
@@ -0,0 +1,35 @@
+from scipy.io.wavfile import read
+
+from uberduck_ml_dev.data.lengths import LengthIndex
+from uberduck_ml_dev.utils.utils import load_filepaths_and_text
+
+
+class TestLengthIndex:
+    def test_for_filelist(self, tmp_path):
+        paths = [x[0] for x in load_filepaths_and_text("tests/fixtures/val.txt")]
+        paths += [
+            x[0]
+            for x in load_filepaths_and_text("tests/fixtures/ljtest/list_small.txt")
+        ]
+        filelist = str(tmp_path / "list.txt")
+        index = LengthIndex.for_filelist(filelist, paths[:1])
+        assert len(index) == 1
+        index = LengthIndex.for_filelist(filelist, paths)
+        assert len(index) == len(set(paths))
+        assert len(LengthIndex.load(f"{filelist}.lengths.npz")) == len(set(paths))
+        for path, n_frames, sampling_rate in zip(
+            paths,
+            index.n_frames(paths),
+            index.get(paths, "sampling_rate"),
+        ):
+            sr, data = read(path)
+            assert n_frames == len(data)
+            assert sampling_rate == sr
+
+    def test_save_load(self, tmp_path):
+        paths = ["a.wav", "dir/ü—é.wav", ""]
+        headers = [[1, 22050, 1, 2], [2, 16000, 2, 2], [3, 44100, 1, 4]]
+        LengthIndex(paths, headers).save(str(tmp_path / "index.npz"))
+        index = LengthIndex.load(str(tmp_path / "index.npz"))
+        assert index.paths == paths
+        assert index.n_frames(paths[::-1]).tolist() == [3, 2, 1]
@@ -0,0 +1,18 @@
+import pickle
+
+from uberduck_ml_dev.data.manifest import compile_manifest, load_filelist
+from uberduck_ml_dev.utils.utils import load_filepaths_and_text
+
+
+class TestManifest:
+    def test_roundtrip(self, tmp_path):
+        filelist = "tests/fixtures/ljtest/list_small.txt"
+        rows = [tuple(row) for row in load_filepaths_and_text(filelist)]
+        manifest = load_filelist(compile_manifest(filelist, tmp_path / "list.manifest"))
+        assert len(manifest) == len(rows)
+        assert list(manifest) == rows
+        assert manifest.speaker_ids.tolist() == [int(row[2]) for row in rows]
+
+        subset = manifest.subset([2, 0])[1:]
+        assert list(subset) == [rows[0]]
+        assert list(pickle.loads(pickle.dumps(subset))) == [rows[0]]
@@ -0,0 +1,55 @@
+import torch
+
+from uberduck_ml_dev.data_loader import TextMelDataset
+from uberduck_ml_dev.exec.featurize import run
+from uberduck_ml_dev.trainer.tacotron2 import DEFAULTS, Tacotron2Trainer
+from uberduck_ml_dev.vendor.tfcompat.hparam import HParams
+
+FILELIST = "tests/fixtures/ljtest/list_small.txt"
+
+
+class TestFeaturize:
+    def test_run(self, tmp_path):
+        feature_store = str(tmp_path / "features")
+        spectrogram_cache_dir = str(tmp_path / "spectrograms")
+        config = DEFAULTS.values()
+        config.update(
+            training_audiopaths_and_text=FILELIST,
+            val_audiopaths_and_text=FILELIST,
+            feature_store=feature_store,
+            p_arpabet=0.0,
+            checkpoint_path=str(tmp_path / "checkpoints"),
+            log_dir=str(tmp_path / "logs"),
+        )
+        hparams = HParams(**config)
+
+        first = run(hparams, FILELIST, feature_store, num_workers=2, chunk_size=3)
+        assert first["n_files"] == 4
+        assert first["failures"] == []
+        # NOTE (Sam): only the spectrograms are missing now, so no features are rewritten.
+        with_spectrograms = run(
+            hparams,
+            FILELIST,
+            feature_store,
+            spectrogram_cache_dir=spectrogram_cache_dir,
+            num_workers=2,
+        )
+        assert with_spectrograms["n_files"] == 4
+        second = run(
+            hparams,
+            FILELIST,
+            feature_store,
+            spectrogram_cache_dir=spectrogram_cache_dir,
+            num_workers=2,
+        )
+        assert second["n_files"] == 0
+
+        trainer = Tacotron2Trainer(hparams, rank=0, world_size=1)
+        stored = TextMelDataset(**trainer.training_dataset_args)
+        live = TextMelDataset(**dict(trainer.training_dataset_args, feature_store=None))
+        assert len(stored.feature_store) == len(stored)
+        shards = stored.feature_store._shards
+        assert sum(len(shard.keys) for shard in shards) == len(stored)
+        for i, (path, _, _) in enumerate(stored.audiopaths_and_text):
+            assert "mel" in stored._get_stored_features(path)
+            assert torch.allclose(stored[i]["mel"], live[i]["mel"], atol=1e-5)
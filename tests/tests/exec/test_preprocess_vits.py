@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+from uberduck_ml_dev.exec.preprocess_vits import run
+from uberduck_ml_dev.text import util
+
+
+def _upper(texts):
+    # NOTE (Sam): the line breaks must not end up in the cleaned filelist.
+    return [text.upper().replace(" ", "\n") for text in texts]
+
+
+def _upper_until_stop(texts):
+    if "stop here" in texts:
+        raise RuntimeError("interrupted")
+    return _upper(texts)
+
+
+class TestPreprocessVits:
+    def test_resume(self, tmp_path, monkeypatch):
+        rows = [f"wavs/{i}.wav|word {i}|0" for i in range(7)]
+        rows[4] = "wavs/4.wav|stop here|0"
+        filelist = tmp_path / "list.txt"
+        filelist.write_text("".join(f"{row}\n" for row in rows))
+        monkeypatch.setitem(util.BATCH_CLEANERS, "upper", _upper_until_stop)
+        with pytest.raises(RuntimeError):
+            run(str(filelist), text_cleaners=["upper"], chunk_size=2, num_workers=1)
+        out_path = f"{filelist}.cleaned"
+        assert os.path.exists(f"{out_path}.progress")
+        assert open(out_path).read() == "".join(
+            f"wavs/{i}.wav|WORD {i}|0\n" for i in range(4)
+        )
+
+        monkeypatch.setitem(util.BATCH_CLEANERS, "upper", _upper)
+        with pytest.raises(ValueError):
+            run(str(filelist), text_cleaners=["upper"], chunk_size=3, num_workers=1)
+        result = run(
+            str(filelist), text_cleaners=["upper"], chunk_size=2, num_workers=2
+        )
+        assert result["n_lines"] == 3
+        assert not os.path.exists(f"{out_path}.progress")
+        expected = [row.split("|") for row in rows]
+        for row in expected:
+            row[1] = row[1].upper()
+        assert open(out_path).read() == "".join(
+            "|".join(row) + "\n" for row in expected
+        )
@@ -1,5 +1,15 @@
-from uberduck_ml_dev.models.common import MelSTFT
+from librosa.util import tiny
+import numpy as np
+from uberduck_ml_dev.models.common import (
+    MelSTFT,
+    STFT,
+    clear_stft_cache,
+    get_mel_stft,
+    get_stft,
+)
+from uberduck_ml_dev.utils.utils import window_sumsquare
 import torch
+from torch.nn import functional as F
 
 
 class TestCommon:
@@ -8,3 +18,60 @@ class TestCommon:
         mel = mel_stft.mel_spectrogram(torch.clip(torch.randn(1, 1000), -1, 1))
         assert mel.shape[0] == 1
         assert mel.shape[1] == 80
+
+    def test_stft_backends(self):
+        y = torch.rand(3, 4000) * 2 - 1
+        for padding in [None, (1024 - 256) // 2]:
+            conv = MelSTFT(padding=padding, backend="conv")
+            fft = MelSTFT(padding=padding, backend="fft")
+            tolerance = dict(rtol=1e-3, atol=1e-3)
+            assert torch.allclose(conv.spectrogram(y), fft.spectrogram(y), **tolerance)
+            assert torch.allclose(
+                conv.mel_spectrogram(y), fft.mel_spectrogram(y), **tolerance
+            )
+            magnitude, phase = conv.stft_fn.transform(y)
+            assert torch.allclose(
+                conv.stft_fn.inverse(magnitude, phase),
+                fft.stft_fn.inverse(magnitude, phase),
+                **tolerance,
+            )
+            assert not hasattr(fft.stft_fn, "forward_basis")
+
+    def test_stft_inverse_window_sum_cache(self):
+        stft = STFT()
+        magnitude, phase = stft.transform(torch.rand(2, 4000) * 2 - 1)
+        # NOTE (Sam): the inverse as it was before window sums were cached.
+        window_sum = window_sumsquare(
+            "hann",
+            magnitude.size(-1),
+            hop_length=256,
+            win_length=1024,
+            n_fft=1024,
+            dtype=np.float32,
+        )
+        nonzero = torch.from_numpy(np.where(window_sum > tiny(window_sum))[0])
+        expected = F.conv_transpose1d(
+            torch.cat([magnitude * torch.cos(phase), magnitude * torch.sin(phase)], 1),
+            stft.inverse_basis,
+            stride=256,
+        )
+        expected[:, :, nonzero] /= torch.from_numpy(window_sum)[nonzero]
+        expected = (expected * 4.0)[:, :, 512:-512]
+        for _ in range(2):
+            assert torch.equal(stft.inverse(magnitude, phase), expected)
+        stft.inverse(magnitude[:, :, :5], phase[:, :, :5])
+        assert list(stft._window_sums) == [(magnitude.size(-1), "cpu"), (5, "cpu")]
+
+    def test_shared_stfts(self):
+        clear_stft_cache()
+        mel_stft = get_mel_stft()
+        assert isinstance(mel_stft, MelSTFT)
+        assert get_mel_stft(device=torch.device("cpu")) is mel_stft
+        assert get_mel_stft(n_mel_channels=40) is not mel_stft
+        assert get_mel_stft(n_mel_channels=40).n_mel_channels == 40
+        stft = get_stft(filter_length=1024, hop_length=256)
+        assert isinstance(stft, STFT)
+        assert get_stft(hop_length=256, filter_length=1024) is stft
+        assert get_stft() is not stft
+        clear_stft_cache()
+        assert get_mel_stft() is not mel_stft
@@ -1,7 +1,22 @@
-from uberduck_ml_dev.data_loader import TextMelCollate, TextMelDataset, oversample
+from uberduck_ml_dev.data.manifest import Manifest, compile_manifest
+from uberduck_ml_dev.data_loader import (
+    DistributedBucketSampler,
+    FrameBudgetBatchSampler,
+    TextAudioSpeakerLoader,
+    TextMelCollate,
+    TextMelDataset,
+    WeightedDistributedSampler,
+    oversample,
+    sample_weights,
+)
 from collections import Counter
+import numpy as np
+import pytest
+import torch
 from torch.utils.data import DataLoader
 
+from uberduck_ml_dev.vendor.tfcompat.hparam import HParams
+
 
 class TestTextMelCollation:
     def test_oversample(self):
@@ -18,6 +33,8 @@ class TestTextMelCollation:
             ("speaker1/1.wav", "Test one two", "1"),
             ("speaker1/1.wav", "Test one two", "1"),
         ]
+        assert sample_weights(mock_fts, {"1": 3}).tolist() == [1, 1, 3]
+        assert sample_weights(mock_fts, {}) is None
 
     def test_batch_structure(self):
         ds = TextMelDataset(
@@ -105,3 +122,271 @@ class TestTextMelCollation:
                 "actual shape: ", batch["gate_target"].shape
             )
             assert len(batch) == 7
+
+    def test_feature_store(self, tmp_path):
+        def _dataset(**kwargs):
+            return TextMelDataset(
+                "tests/fixtures/ljtest/list_small.txt",
+                ["english_cleaners"],
+                0.0,
+                80,
+                22050,
+                0,
+                8000,
+                1024,
+                256,
+                padding=None,
+                win_length=1024,
+                include_f0=True,
+                symbol_set="default",
+                **kwargs,
+            )
+
+        live = _dataset()
+        store = _dataset(feature_store=str(tmp_path)).featurize(
+            str(tmp_path), shard_size=2
+        )
+        assert len(store) == len(live)
+        stored = _dataset(feature_store=str(tmp_path))
+        for i in range(len(live)):
+            expected, actual = live[i], stored[i]
+            assert torch.equal(expected["text_sequence"], actual["text_sequence"])
+            assert torch.allclose(expected["mel"], actual["mel"])
+            assert torch.equal(expected["f0"], actual["f0"])
+
+    def test_return_audio(self):
+        def _dataset(**kwargs):
+            return TextMelDataset(
+                "tests/fixtures/ljtest/list_small.txt",
+                ["english_cleaners"],
+                0.0,
+                80,
+                22050,
+                0,
+                8000,
+                1024,
+                256,
+                padding=None,
+                win_length=1024,
+                include_f0=True,
+                symbol_set="default",
+                **kwargs,
+            )
+
+        collate_fn = TextMelCollate(n_frames_per_step=5, include_f0=True)
+        live = _dataset()
+        audio = _dataset(return_audio=True)
+        expected = collate_fn([live[i] for i in range(len(live))])
+        actual = collate_fn([audio[i] for i in range(len(audio))])
+        assert actual["mel_padded"] is None
+        mel = audio.stft.mel_spectrogram(
+            actual["audio_padded"], lengths=actual["audio_lengths"]
+        )
+        assert torch.equal(
+            audio.stft.stft_fn.n_frames(actual["audio_lengths"]),
+            expected["output_lengths"],
+        )
+        assert torch.equal(actual["gate_target"], expected["gate_target"])
+        mel_padded = expected["mel_padded"]
+        assert torch.allclose(mel, mel_padded[:, :, : mel.size(2)], atol=1e-4)
+        assert (mel_padded[:, :, mel.size(2) :] == 0).all()
+
+    def test_lengths(self):
+        ds = TextMelDataset(
+            "tests/fixtures/ljtest/list_small.txt",
+            ["english_cleaners"],
+            0.0,
+            80,
+            22050,
+            0,
+            8000,
+            1024,
+            256,
+            padding=None,
+            win_length=1024,
+            symbol_set="default",
+        )
+        assert ds.lengths == [ds[i]["mel"].size(1) for i in range(len(ds))]
+
+    def test_manifest(self, tmp_path):
+        filelist = "tests/fixtures/ljtest/list_small.txt"
+        manifest = str(compile_manifest(filelist, tmp_path / "list.manifest"))
+
+        def make_dataset(path):
+            return TextMelDataset(
+                path,
+                ["english_cleaners"],
+                0.0,
+                80,
+                22050,
+                0,
+                8000,
+                1024,
+                256,
+                padding=None,
+                win_length=1024,
+                symbol_set="default",
+            )
+
+        expected = make_dataset(filelist)
+        ds = make_dataset(manifest)
+        assert isinstance(ds.audiopaths_and_text, Manifest)
+        assert len(ds) == len(expected)
+        assert ds.lengths == expected.lengths
+        for i in range(len(ds)):
+            assert torch.equal(ds[i]["text_sequence"], expected[i]["text_sequence"])
+            assert torch.equal(ds[i]["mel"], expected[i]["mel"])
+
+
+class _LengthDataset:
+    def __init__(self, lengths, sample_weights=None):
+        self.lengths = lengths
+        self.sample_weights = sample_weights
+
+    def __len__(self):
+        return len(self.lengths)
+
+
+class TestFrameBudgetBatchSampler:
+    def test_batches(self):
+        lengths = [10, 50, 20, 100, 10, 30, 200, 40]
+        samplers = [
+            FrameBudgetBatchSampler(
+                _LengthDataset(lengths), 100, num_replicas=2, rank=rank
+            )
+            for rank in range(2)
+        ]
+        batches = []
+        for sampler in samplers:
+            sampler.set_epoch(3)
+            rank_batches = list(sampler)
+            assert len(rank_batches) == len(sampler) == 3
+            assert list(sampler) == rank_batches
+            batches.extend(rank_batches)
+        assert set(i for batch in batches for i in batch) == set(range(len(lengths)))
+        for batch in batches:
+            assert len(batch) == 1 or len(batch) * max(lengths[i] for i in batch) <= 100
+
+    def test_max_length(self):
+        lengths = [10, 50, 20, 100, 10, 30, 200, 40]
+        sampler = FrameBudgetBatchSampler(
+            _LengthDataset(lengths), 100, num_replicas=1, rank=0, max_length=100
+        )
+        assert sorted(i for batch in sampler for i in batch) == [0, 1, 2, 3, 4, 5, 7]
+        with pytest.raises(ValueError):
+            FrameBudgetBatchSampler(
+                _LengthDataset(lengths), 100, num_replicas=1, rank=0, max_length=5
+            )
+        with pytest.raises(ValueError):
+            FrameBudgetBatchSampler(_LengthDataset([]), 100, num_replicas=1, rank=0)
+
+
+def _bucket_batches(lengths, batch_size, boundaries, num_replicas, rank, epoch):
+    # NOTE (Sam): the original per-sample implementation of DistributedBucketSampler.
+    def _bisect(x, lo=0, hi=None):
+        if hi is None:
+            hi = len(boundaries) - 1
+        if hi > lo:
+            mid = (hi + lo) // 2
+            if boundaries[mid] < x and x <= boundaries[mid + 1]:
+                return mid
+            elif x <= boundaries[mid]:
+                return _bisect(x, lo, mid)
+            else:
+                return _bisect(x, mid + 1, hi)
+        return -1
+
+    buckets = [[] for _ in range(len(boundaries) - 1)]
+    for i, length in enumerate(lengths):
+        idx_bucket = _bisect(length)
+        if idx_bucket != -1:
+            buckets[idx_bucket].append(i)
+    for i in range(len(buckets) - 1, 0, -1):
+        if len(buckets[i]) == 0:
+            buckets.pop(i)
+            boundaries.pop(i + 1)
+
+    g = torch.Generator()
+    g.manual_seed(epoch)
+    indices = [torch.randperm(len(bucket), generator=g).tolist() for bucket in buckets]
+    batches = []
+    total_batch_size = num_replicas * batch_size
+    for bucket, ids_bucket in zip(buckets, indices):
+        len_bucket = len(bucket)
+        rem = (total_batch_size - (len_bucket % total_batch_size)) % total_batch_size
+        ids_bucket = (
+            ids_bucket
+            + ids_bucket * (rem // len_bucket)
+            + ids_bucket[: (rem % len_bucket)]
+        )
+        ids_bucket = ids_bucket[rank::num_replicas]
+        for j in range(len(ids_bucket) // batch_size):
+            ids = ids_bucket[j * batch_size : (j + 1) * batch_size]
+            batches.append([bucket[idx] for idx in ids])
+    batch_ids = torch.randperm(len(batches), generator=g).tolist()
+    return [batches[i] for i in batch_ids]
+
+
+class TestDistributedBucketSampler:
+    def test_matches_per_sample_implementation(self):
+        g = torch.Generator()
+        g.manual_seed(0)
+        lengths = torch.randint(0, 1200, (500,), generator=g).tolist()
+        boundaries = [32, 300, 400, 500, 600, 700, 800, 900, 1000, 2000, 3000]
+        for rank in range(2):
+            sampler = DistributedBucketSampler(
+                _LengthDataset(lengths), 8, boundaries, num_replicas=2, rank=rank
+            )
+            for epoch in range(3):
+                sampler.set_epoch(epoch)
+                assert list(sampler) == _bucket_batches(
+                    lengths, 8, list(boundaries), 2, rank, epoch
+                )
+
+    def test_oversampling(self):
+        dataset = _LengthDataset([50, 60, 70], sample_weights=np.array([1, 3, 2]))
+        sampler = DistributedBucketSampler(dataset, 1, [0, 100], num_replicas=1, rank=0)
+        assert Counter(i for batch in sampler for i in batch) == {0: 1, 1: 3, 2: 2}
+
+
+class TestWeightedDistributedSampler:
+    def test_epoch_size(self):
+        dataset = _LengthDataset([50, 60, 70], sample_weights=np.array([1, 3, 2]))
+        samplers = [
+            WeightedDistributedSampler(dataset, num_replicas=2, rank=rank)
+            for rank in range(2)
+        ]
+        for sampler in samplers:
+            sampler.set_epoch(1)
+            assert len(list(sampler)) == len(sampler) == 3
+            assert list(sampler) == list(sampler)
+        assert Counter(i for sampler in samplers for i in sampler) == {0: 1, 1: 3, 2: 2}
+
+
+class TestTextAudioSpeakerLoader:
+    def test_manifest(self, tmp_path):
+        filelist = "tests/fixtures/ljtest/list_small.txt"
+        manifest = str(compile_manifest(filelist, tmp_path / "list.manifest"))
+        hparams = HParams(
+            oversample_weights=None,
+            text_cleaners=["basic_cleaners"],
+            cleaned_text=True,
+            add_blank=True,
+            max_wav_value=32768.0,
+            sampling_rate=22050,
+            filter_length=1024,
+            hop_length=256,
+            win_length=1024,
+            n_mel_channels=80,
+            mel_fmin=0.0,
+            mel_fmax=None,
+            spectrogram_cache_dir=str(tmp_path / "spectrograms"),
+        )
+        expected = TextAudioSpeakerLoader(filelist, hparams)
+        ds = TextAudioSpeakerLoader(manifest, hparams)
+        assert isinstance(ds.audiopaths_sid_text, Manifest)
+        assert len(ds) == len(expected)
+        assert ds.lengths == expected.lengths
+        for i in range(len(ds)):
+            for actual, item in zip(ds[i], expected[i]):
+                assert torch.equal(actual, item)
@@ -0,0 +1,52 @@
+import subprocess
+import sys
+
+# NOTE (Sam): time allowed on top of importing torch alone, which dominates and varies by machine.
+IMPORT_OVERHEAD_BUDGET_S = 2.5
+CORE_MODULES = [
+    "uberduck_ml_dev.text.util",
+    "uberduck_ml_dev.data_loader",
+    "uberduck_ml_dev.models.tacotron2",
+]
+LAZY_MODULES = [
+    "g2p_en",
+    "phonemizer",
+    "librosa",
+    "sklearn",
+    "emoji",
+    "inflect",
+    "tensorboardX",
+    "uberduck_ml_dev.models.torchmoji",
+    "uberduck_ml_dev.vocoders.hifigan",
+]
+
+
+def _importtime(modules):
+    """Import modules in a fresh interpreter and return its -X importtime rows and loaded modules."""
+    code = "; ".join(
+        [f"import {m}" for m in modules + ["sys"]] + ["print(' '.join(sys.modules))"]
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.strip()))
+    return rows, set(result.stdout.split())
+
+
+class TestImports:
+    def test_core_import_time(self):
+        torch_rows, _ = _importtime(["torch"])
+        rows, loaded = _importtime(CORE_MODULES)
+        assert not loaded & set(LAZY_MODULES), loaded & set(LAZY_MODULES)
+        torch_s = sum(self_us for self_us, _, _ in torch_rows) / 1e6
+        total_s = sum(self_us for self_us, _, _ in rows) / 1e6
+        slowest = sorted(rows, key=lambda row: -row[1])[:10]
+        assert total_s - torch_s < IMPORT_OVERHEAD_BUDGET_S, slowest
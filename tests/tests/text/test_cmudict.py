@@ -0,0 +1,64 @@
+import io
+import os
+import pickle
+
+from uberduck_ml_dev.text.cmudict import CMUDict, _parse_cmudict, compile_cmudict
+
+CMUDICT_TEXT = """;;; # comment
+'BOUT  B AW1 T
+A  AH0
+A(1)  EY1
+ABBE  AE0 B EY1
+AXX  XX1 B
+READ  R EH1 D
+READ(1)  R IY1 D
+ZYWICKI  Z IH0 W IH1 K IY0
+"""
+
+
+class TestCMUDict:
+    def test_index_matches_text(self, tmp_path):
+        path = tmp_path / "cmudict.txt"
+        path.write_text(CMUDICT_TEXT, encoding="latin-1")
+        words = ["'bout", "a", "Abbe", "axx", "read", "zywicki", "missing", "", "é"]
+        words.append("z" * 100)
+        entries = _parse_cmudict(io.StringIO(CMUDICT_TEXT))
+        for keep_ambiguous in [True, False]:
+            reference = {
+                word: pronunciations
+                for word, pronunciations in entries.items()
+                if keep_ambiguous or len(pronunciations) == 1
+            }
+            in_memory = CMUDict(io.StringIO(CMUDICT_TEXT), keep_ambiguous)
+            indexed = CMUDict(str(path), keep_ambiguous)
+            assert os.readlink(f"{path}.index") == os.path.basename(indexed.path)
+            compiled = CMUDict(compile_cmudict(str(path)), keep_ambiguous)
+            unpickled = pickle.loads(pickle.dumps(compiled))
+            for cmudict in [in_memory, indexed, compiled, unpickled]:
+                assert len(cmudict) == len(reference)
+                for word in words:
+                    assert cmudict.lookup(word) == reference.get(word.upper()), word
+        assert CMUDict(str(path)).lookup("read") == ["R EH1 D", "R IY1 D"]
+
+    def test_recompile(self, tmp_path):
+        path = tmp_path / "cmudict.txt"
+        path.write_text(CMUDICT_TEXT, encoding="latin-1")
+        old = CMUDict(str(path))
+        path.write_text(CMUDICT_TEXT + "ZEBRA  Z IY1 B R AH0\n", encoding="latin-1")
+        os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1))
+        new = CMUDict(str(path))
+        assert new.path != old.path
+        assert os.readlink(f"{path}.index") == os.path.basename(new.path)
+        # NOTE (Sam): the old version is kept while a CMUDict still reads it.
+        assert old.lookup("zebra") is None
+        assert new.lookup("zebra") == ["Z IY1 B R AH0"]
+        assert CMUDict(str(path)).path == new.path
+        assert compile_cmudict(str(path)) == f"{path}.index"
+        assert os.path.isdir(old.path)
+        old_path = old.path
+        del old
+        compile_cmudict(str(path))
+        assert not os.path.exists(old_path)
+        assert sorted(os.listdir(tmp_path)) == sorted(
+            ["cmudict.txt", "cmudict.txt.index", os.path.basename(new.path)]
+        )
@@ -0,0 +1,35 @@
+from uberduck_ml_dev.text.lexicon import Lexicon
+
+
+def _convert(text, overrides=None):
+    if overrides:
+        return overrides[text]
+    return f"{{ {text.upper()} }}"
+
+
+class TestLexicon:
+    def test_get(self, tmp_path):
+        lexicon = Lexicon(_convert, path=tmp_path / "lexicon.db", max_size=1)
+        assert lexicon.get("duck") == "{ DUCK }"
+        assert lexicon.get("duck") == "{ DUCK }"
+        assert lexicon.get("party") == "{ PARTY }"
+        # NOTE (Sam): "duck" was evicted from memory by "party", but is still on disk.
+        assert lexicon.get("duck") == "{ DUCK }"
+        assert lexicon.stats == dict(hits=1, disk_hits=1, misses=2)
+        assert lexicon.get("duck", overrides={"duck": "{ D AH1 K }"}) == "{ D AH1 K }"
+
+        reloaded = Lexicon(_convert, path=tmp_path / "lexicon.db")
+        assert reloaded.warm(["duck", "party", "aisle"]) == 1
+        assert reloaded.get("party") == "{ PARTY }"
+        assert reloaded.stats == dict(hits=0, disk_hits=1, misses=1)
+
+    def test_version(self, tmp_path):
+        path = tmp_path / "lexicon.db"
+        lexicon = Lexicon(_convert, path=path, version=lambda: "1")
+        assert lexicon.warm(["duck", "party"]) == 2
+        assert Lexicon(_convert, path=path, version=lambda: "1").warm(["duck"]) == 0
+        # NOTE (Sam): entries written by another converter version are not reused, but kept.
+        assert Lexicon(_convert, path=path, version=lambda: "2").warm(["duck"]) == 1
+        reloaded = Lexicon(_convert, path=path, version=lambda: "2")
+        assert reloaded.warm(["duck", "party"]) == 1
+        assert Lexicon(_convert, path=path, version=lambda: "1").warm(["party"]) == 0
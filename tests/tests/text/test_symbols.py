@@ -1,4 +1,10 @@
-from uberduck_ml_dev.text.symbols import arpabet_to_sequence, symbols_to_sequence
+from uberduck_ml_dev.text import cmudict
+from uberduck_ml_dev.text.symbols import (
+    SYMBOL_SETS,
+    arpabet_to_sequence,
+    symbol_table,
+    symbols_to_sequence,
+)
 
 
 class TestSymbols:
@@ -18,3 +24,20 @@ class TestSymbols:
 
     def test_symbols_to_sequence(self):
         assert len(symbols_to_sequence("C M U Dictionary")) == 16
+
+    def test_symbol_table(self):
+        arpabet = " ".join(cmudict.valid_symbols) + " XX @AH {"
+        for symbol_set, symbols in SYMBOL_SETS.items():
+            text = "".join(s for s in symbols if len(s) == 1) + "~_\U0001f986 ☃"
+            for ignore_symbols in [["_", "~"], []]:
+                table = symbol_table(symbol_set, ignore_symbols)
+                assert table.encode(text).tolist() == symbols_to_sequence(
+                    text, symbol_set, ignore_symbols
+                )
+            phones = ["@" + s for s in arpabet.split()]
+            assert table.encode_arpabet(arpabet).tolist() == symbols_to_sequence(
+                phones, symbol_set
+            )
+            assert arpabet_to_sequence(arpabet, symbol_set) == symbols_to_sequence(
+                phones, symbol_set
+            )
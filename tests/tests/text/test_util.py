@@ -1,9 +1,37 @@
+import random
+
+from uberduck_ml_dev.exec.benchmark_text import reference_english_cleaners
+from uberduck_ml_dev.text import util
 from uberduck_ml_dev.text.util import (
     cleaned_text_to_sequence,
+    english_cleaners,
     text_to_sequence,
+    texts_to_sequences,
+    tokenize_text,
     DEFAULT_SYMBOLS,
     sequence_to_text,
 )
+from uberduck_ml_dev.utils.utils import load_filepaths_and_text
+
+
+def _random_corpus(n, seed=0):
+    rng = random.Random(seed)
+    abbreviations = [regex.pattern[2:-2] for regex, _ in util._abbreviations]
+    tokens = (
+        [a + "." for a in abbreviations]
+        + [a.capitalize() + "." for a in abbreviations]
+        + ["the", "Pen", "is", "blue", "naïve", "café", "Ünïcödé", "—", "ſt."]
+        + ["1,000,000", "$3.50", "$1", "£20", "3.14", "21st", "2nd", "1999", "2005"]
+        + ["2000", "1800", "0", ".", ",", "!", "?", "\t", "  ", "\n", "..", "-"]
+    )
+    separators = ["", " "]
+    return [
+        "".join(
+            rng.choice(tokens) + rng.choice(separators)
+            for _ in range(rng.randint(0, 20))
+        )
+        for _ in range(n)
+    ]
 
 
 class TestTextUtils:
@@ -107,3 +135,45 @@ class TestTextUtils:
             86,
             86,
         ]
+
+    def test_texts_to_sequences(self):
+        texts = [
+            "The pen is blue.",
+            "Not bad bart, not bad at all.",
+            "The pen is blue.",
+        ]
+        for num_workers in [0, 2]:
+            padded, lengths = texts_to_sequences(
+                texts, ["english_cleaners"], num_workers=num_workers, chunk_size=1
+            )
+            assert padded.shape == (3, max(lengths))
+            for i, text in enumerate(texts):
+                sequence = text_to_sequence(text, ["english_cleaners"])
+                assert lengths[i] == len(sequence)
+                assert padded[i, : lengths[i]].tolist() == sequence
+                assert not padded[i, lengths[i] :].any()
+
+    def test_get_lexicon(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(util, "_lexicon", None)
+        monkeypatch.setenv("UBERDUCK_LEXICON_PATH", str(tmp_path / "lexicon.db"))
+        lexicon = util.get_lexicon()
+        assert lexicon.path == str(tmp_path / "lexicon.db")
+        assert util.get_lexicon() is lexicon
+        assert not (tmp_path / "lexicon.db").exists()
+
+    def test_tokenize_text(self):
+        text = "The {P EH1 N} is blue, not bad at all."
+        tokenized = tokenize_text(text, ["english_cleaners"])
+        for p_arpabet in [0.0, 0.5, 1.0]:
+            for seed in range(5):
+                random.seed(seed)
+                expected = text_to_sequence(
+                    text, ["english_cleaners"], p_arpabet=p_arpabet
+                )
+                random.seed(seed)
+                assert tokenized.sample(p_arpabet).tolist() == expected
+
+    def test_english_cleaners_match_reference(self):
+        filelist = load_filepaths_and_text("tests/fixtures/ljtest/list.txt")
+        for text in [row[1] for row in filelist] + _random_corpus(5000):
+            assert english_cleaners(text) == reference_english_cleaners(text), text
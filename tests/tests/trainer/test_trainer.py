@@ -1,6 +1,22 @@
 from uberduck_ml_dev.trainer.base import TTSTrainer
 import torch
 import math
+import pytest
+from uberduck_ml_dev.data_loader import (
+    TextAudioSpeakerCollate,
+    TextAudioSpeakerLoader,
+    TextMelCollate,
+    TextMelDataset,
+    WeightedDistributedSampler,
+)
+from uberduck_ml_dev.models.common import get_mel_stft, get_stft
+from uberduck_ml_dev.models.mellotron import DEFAULTS as MELLOTRON_DEFAULTS
+from uberduck_ml_dev.trainer.mellotron import MellotronTrainer
+from uberduck_ml_dev.trainer.tacotron2 import (
+    DEFAULTS as TACOTRON2_TRAINER_DEFAULTS,
+    Tacotron2Trainer,
+)
+from uberduck_ml_dev.trainer.vits import VITSTrainer
 from uberduck_ml_dev.vendor.tfcompat.hparam import HParams
 from uberduck_ml_dev.trainer.base import DEFAULTS as TRAINER_DEFAULTS
 
@@ -49,3 +65,117 @@ class TestTacotron2Trainer:
         assert math.isclose(
             lj_trainer.loss[2], train_loss_4_datapoints_2_iteration, abs_tol=5e-4
         )
+
+
+class TestComputeMels:
+    @pytest.mark.parametrize("trainer_cls", [Tacotron2Trainer, MellotronTrainer])
+    def test_compute_mels(self, trainer_cls, tmp_path):
+        filelist = "tests/fixtures/ljtest/list_small.txt"
+        config = TACOTRON2_TRAINER_DEFAULTS.values()
+        if trainer_cls is MellotronTrainer:
+            config.update(MELLOTRON_DEFAULTS.values())
+        config.update(
+            training_audiopaths_and_text=filelist,
+            val_audiopaths_and_text=filelist,
+            p_arpabet=0.0,
+            # NOTE (Sam): not the MelSTFT default of filter_length // 2.
+            padding=384,
+            stft_on_device=True,
+            n_frames_per_step_initial=2,
+            cudnn_enabled=False,
+            checkpoint_path=str(tmp_path / "checkpoints"),
+            log_dir=str(tmp_path / "logs"),
+        )
+        trainer = trainer_cls(HParams(**config))
+        train_set, _, _, _, _ = trainer.initialize_loader(
+            include_f0=config["include_f0"], n_frames_per_step=2
+        )
+        live = TextMelDataset(**dict(trainer.training_dataset_args, return_audio=False))
+        collate_fn = TextMelCollate(
+            n_frames_per_step=2, include_f0=config["include_f0"]
+        )
+        expected = collate_fn([live[i] for i in range(len(live))])
+        batch = collate_fn([train_set[i] for i in range(len(train_set))])
+        assert batch["mel_padded"] is None
+        batch = trainer._compute_mels(batch)
+        assert batch["mel_padded"].shape == expected["mel_padded"].shape
+        assert torch.allclose(batch["mel_padded"], expected["mel_padded"], atol=1e-4)
+
+        trainer.mel_stft = get_mel_stft(
+            filter_length=trainer.filter_length,
+            hop_length=trainer.hop_length,
+            win_length=trainer.win_length,
+            n_mel_channels=trainer.n_mel_channels,
+            sampling_rate=trainer.sampling_rate,
+            mel_fmin=trainer.mel_fmin,
+            mel_fmax=trainer.mel_fmax,
+        )
+        batch["mel_padded"] = None
+        with pytest.raises(ValueError):
+            trainer._compute_mels(batch)
+
+
+class TestOversampleWeights:
+    @pytest.mark.parametrize("trainer_cls", [Tacotron2Trainer, MellotronTrainer])
+    def test_initialize_loader(self, trainer_cls, tmp_path):
+        filelist = "tests/fixtures/ljtest/list_small.txt"
+        config = TACOTRON2_TRAINER_DEFAULTS.values()
+        if trainer_cls is MellotronTrainer:
+            config.update(MELLOTRON_DEFAULTS.values())
+        config.update(
+            training_audiopaths_and_text=filelist,
+            val_audiopaths_and_text=filelist,
+            p_arpabet=0.0,
+            oversample_weights={"0": 3},
+            checkpoint_path=str(tmp_path / "checkpoints"),
+            log_dir=str(tmp_path / "logs"),
+        )
+        trainer = trainer_cls(HParams(**config))
+        train_set, val_set, _, sampler, _ = trainer.initialize_loader(
+            include_f0=config["include_f0"]
+        )
+        assert train_set.sample_weights.tolist() == [3] * len(train_set)
+        assert isinstance(sampler, WeightedDistributedSampler)
+        assert val_set.sample_weights is None
+
+
+class TestVITSTrainer:
+    def test_spectrogram(self, tmp_path):
+        config = dict(
+            oversample_weights=None,
+            text_cleaners=["basic_cleaners"],
+            cleaned_text=True,
+            add_blank=True,
+            max_wav_value=32768.0,
+            sampling_rate=22050,
+            filter_length=1024,
+            hop_length=256,
+            win_length=1024,
+            n_mel_channels=80,
+            mel_fmin=0.0,
+            mel_fmax=None,
+            spectrogram_cache_dir=str(tmp_path),
+        )
+        filelist = "tests/fixtures/ljtest/list_small.txt"
+        live = TextAudioSpeakerLoader(filelist, HParams(**config))
+        audio = TextAudioSpeakerLoader(
+            filelist, HParams(**dict(config, stft_on_device=True))
+        )
+        collate_fn = TextAudioSpeakerCollate()
+        expected = collate_fn([live[i] for i in range(len(live))])
+        actual = collate_fn([audio[i] for i in range(len(audio))])
+        assert actual[2] is None and actual[3] is None
+
+        # NOTE (Sam): _spectrogram only needs the trainer's STFT, so skip building a whole trainer.
+        trainer = VITSTrainer.__new__(VITSTrainer)
+        trainer.stft = get_stft(
+            filter_length=1024,
+            hop_length=256,
+            win_length=1024,
+            padding=(1024 - 256) // 2,
+            backend="conv",
+        )
+        spec, spec_lengths = trainer._spectrogram(actual[4], actual[5])
+        spec_padded = expected[2]
+        assert torch.equal(spec_lengths, expected[3])
+        assert torch.allclose(spec[:, :, : spec_padded.size(2)], spec_padded, atol=1e-4)
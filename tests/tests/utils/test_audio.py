@@ -0,0 +1,46 @@
+import numpy as np
+from scipy.io.wavfile import read
+import torch
+
+from uberduck_ml_dev.exec.benchmark_yin import compute_yin_per_frame
+from uberduck_ml_dev.utils.audio import compute_f0_batch, compute_yin
+
+
+class TestAudio:
+    def test_compute_yin(self):
+        sr, audio = read("tests/fixtures/ljtest/wavs/LJ001-0001.wav")
+        audio = audio.astype(np.float32) / 32768
+        # NOTE (Sam): include a stretch of digital silence, where the CMND is undefined.
+        audio[:4000] = 0
+        for kwargs in [
+            dict(),
+            dict(w_len=1024, w_step=256, f0_min=80, f0_max=880, harmo_thresh=0.25),
+            # NOTE (Sam): lags up to the whole window.
+            dict(w_len=441, w_step=147, f0_min=50),
+        ]:
+            expected = compute_yin_per_frame(audio, sr, **kwargs)
+            actual = compute_yin(audio, sr, **kwargs)
+            assert len(actual[0]) > 0
+            for e, a in zip(expected, actual):
+                np.testing.assert_allclose(a, e, rtol=1e-6, atol=1e-9)
+
+    def test_compute_f0_batch(self):
+        audios = [
+            read(f"tests/fixtures/ljtest/wavs/LJ001-000{i}.wav")[1].astype(np.float32)
+            for i in range(1, 4)
+        ]
+        # NOTE (Sam): too short for a single YIN frame.
+        audios.append(np.zeros(500, dtype=np.float32))
+        lengths = torch.LongTensor([len(a) for a in audios])
+        audio_padded = torch.zeros(len(audios), int(lengths.max()))
+        for i, audio in enumerate(audios):
+            audio_padded[i, : len(audio)] = torch.from_numpy(audio)
+
+        f0 = compute_f0_batch(audio_padded, lengths, 22050)
+        assert f0.shape == (len(audios), 1, (int(lengths.max()) - 1025) // 256 + 5)
+        for i, audio in enumerate(audios):
+            # NOTE (Sam): this is what TextMelDataset._get_f0 computes for a single item.
+            expected = compute_yin(audio, 22050, 1024, 256, 80, 880, 0.25)[0]
+            expected = np.array([0.0] * 2 + expected + [0.0] * 2, dtype=np.float32)
+            assert np.array_equal(f0[i, 0, : len(expected)].numpy(), expected)
+            assert (f0[i, 0, len(expected) :] == 0).all()
@@ -1,5 +1,11 @@
 import torch
-from uberduck_ml_dev.utils.utils import get_mask_from_lengths, sequence_mask
+from uberduck_ml_dev.models.common import STFT
+from uberduck_ml_dev.utils.utils import (
+    get_mask_from_lengths,
+    griffin_lim,
+    sequence_mask,
+    spectral_convergence,
+)
 
 
 class TestUtils:
@@ -41,3 +47,36 @@ class TestUtils:
                 ]
             )
         ).all()
+
+    def test_griffin_lim(self):
+        torch.manual_seed(0)
+        stft = STFT(filter_length=256, hop_length=64, win_length=256)
+        y = torch.sin(torch.linspace(0, 400, 4096)).expand(2, -1) * torch.rand(2, 1)
+        magnitudes, _ = stft.transform(y)
+        lengths = torch.LongTensor([magnitudes.size(-1), 20])
+
+        def convergence(momentum):
+            torch.manual_seed(0)
+            signal = griffin_lim(magnitudes, stft, n_iters=10, momentum=momentum)
+            return spectral_convergence(magnitudes, stft.transform(signal)[0])
+
+        assert (convergence(0.99) < convergence(0.0)).all()
+
+        signal = griffin_lim(magnitudes, stft, n_iters=5, lengths=lengths)
+        assert signal.shape == (2, (magnitudes.size(-1) - 1) * 64)
+        assert (signal[1, 20 * 64 :] == 0).all()
+        assert signal[0].abs().sum() > 0
+
+        # NOTE (Sam): both items converge below 0.3 after 3 iterations.
+        torch.manual_seed(0)
+        stopped = griffin_lim(
+            magnitudes, stft, n_iters=100, momentum=0.99, tolerance=0.3
+        )
+        torch.manual_seed(0)
+        assert torch.equal(
+            stopped, griffin_lim(magnitudes, stft, n_iters=3, momentum=0.99)
+        )
+        torch.manual_seed(0)
+        assert not torch.equal(
+            stopped, griffin_lim(magnitudes, stft, n_iters=2, momentum=0.99)
+        )
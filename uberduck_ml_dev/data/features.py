@@ -0,0 +1,468 @@
+__all__ = [
+    "FEATURE_VERSION",
+    "stft_config_hash",
+    "spectrogram_config_hash",
+    "FeatureStoreWriter",
+    "FeatureStore",
+    "SPECTROGRAM_CACHE_LOCATION",
+    "SpectrogramCache",
+    "gst_config_hash",
+    "GST_CACHE_LOCATION",
+    "GSTCache",
+]
+
+
+import hashlib
+import json
+from multiprocessing.util import Finalize
+import os
+from pathlib import Path
+import shutil
+import time
+import uuid
+
+import numpy as np
+import torch
+
+try:
+    import fcntl
+except ImportError:
+    # NOTE (Sam): no advisory locks on Windows; the cache is then only safe for a single writer.
+    fcntl = None
+
+# NOTE (Sam): bump this whenever the way features are computed changes (e.g. audio normalization)
+# so that stores written by older code are never served.
+FEATURE_VERSION = 1
+
+_SHARD_PREFIX = "shard-"
+_TMP_PREFIX = ".tmp-"
+
+
+def stft_config_hash(**config):
+    """Return a short, stable hash of the parameters used to compute features.
+
+    Stores are written into a directory named after this hash, so changing any
+    STFT/mel parameter automatically points readers at a different (possibly empty) store.
+    """
+    config = dict(config, feature_version=FEATURE_VERSION)
+    serialized = json.dumps(config, sort_keys=True, default=str)
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()[:16]
+
+
+def spectrogram_config_hash(
+    filter_length, hop_length, win_length, sampling_rate, padding
+):
+    """Return the config hash of linear spectrograms in a `SpectrogramCache`."""
+    return stft_config_hash(
+        kind="spectrogram",
+        filter_length=filter_length,
+        hop_length=hop_length,
+        win_length=win_length,
+        sampling_rate=sampling_rate,
+        padding=padding,
+    )
+
+
+def _atomic_write_text(path, text):
+    tmp_path = f"{path}{_TMP_PREFIX}{uuid.uuid4().hex}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+class FeatureStoreWriter:
+    """Append items to a sharded feature store.
+
+    Items are buffered in memory and written out as a shard once `shard_size` items have
+    been added. Each shard is a directory holding one `.npy` file per field, the item keys and an
+    offset index. Shards are written into a temporary directory and renamed into place, so a
+    reader never sees a partial shard and several writers (e.g. worker processes) can safely
+    write into the same store.
+
+    2-D arrays are expected as [channels, frames] (e.g. mels) and are stored frame-major, so that
+    an item is a contiguous block of rows in the shard.
+    """
+
+    def __init__(self, root, config_hash, config=None, shard_size=1024, attrs=None):
+        self.path = Path(root) / config_hash
+        self.shard_size = shard_size
+        self.attrs = attrs or {}
+        os.makedirs(self.path, exist_ok=True)
+        config_path = self.path / "config.json"
+        if config is not None and not config_path.exists():
+            _atomic_write_text(
+                config_path, json.dumps(config, sort_keys=True, indent=2)
+            )
+        self._keys = []
+        self._items = []
+
+    def add(self, key, **fields):
+        self._keys.append(key)
+        self._items.append({k: v for k, v in fields.items() if v is not None})
+        if len(self._keys) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        """Write buffered items as a new shard and return its name."""
+        if not self._keys:
+            return None
+        field_names = sorted(set(name for item in self._items for name in item))
+        name = f"{_SHARD_PREFIX}{uuid.uuid4().hex}"
+        tmp_path = self.path / f"{_TMP_PREFIX}{name}"
+        os.makedirs(tmp_path)
+        meta = {"fields": {}, "attrs": self.attrs}
+        for field in field_names:
+            # NOTE (Sam): (start, length) per item, length -1 marks an item without this field.
+            index = np.full((len(self._keys), 2), -1, dtype=np.int64)
+            chunks = []
+            start = 0
+            for i, item in enumerate(self._items):
+                value = item.get(field)
+                if value is None:
+                    continue
+                value = np.asarray(value)
+                if value.ndim == 2:
+                    value = value.T
+                chunks.append(value)
+                index[i] = start, value.shape[0]
+                start += value.shape[0]
+            data = np.ascontiguousarray(np.concatenate(chunks, axis=0))
+            np.save(tmp_path / f"{field}.npy", data)
+            np.save(tmp_path / f"{field}.index.npy", index)
+            meta["fields"][field] = {"ndim": data.ndim, "dtype": str(data.dtype)}
+        with open(tmp_path / "keys.txt", "w", encoding="utf-8") as f:
+            f.writelines(f"{key}\n" for key in self._keys)
+        with open(tmp_path / "meta.json", "w") as f:
+            json.dump(meta, f)
+        os.rename(tmp_path, self.path / name)
+        self._keys = []
+        self._items = []
+        return name
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._keys, self._items = [], []
+
+
+class _Shard:
+    def __init__(self, path):
+        self.path = path
+        with open(path / "meta.json") as f:
+            meta = json.load(f)
+        self.fields = meta["fields"]
+        self.attrs = meta["attrs"]
+        with open(path / "keys.txt", encoding="utf-8") as f:
+            self.keys = [line.rstrip("\n") for line in f]
+        self.index = {
+            field: np.load(path / f"{field}.index.npy") for field in self.fields
+        }
+        self._data = {}
+
+    def data(self, field):
+        if field not in self._data:
+            # NOTE (Sam): copy-on-write maps are writable (so torch.from_numpy doesn't warn) but
+            # never touch the file, and pages are shared between dataloader workers.
+            self._data[field] = np.load(self.path / f"{field}.npy", mmap_mode="c")
+        return self._data[field]
+
+    def get(self, row):
+        item = {}
+        for field, meta in self.fields.items():
+            start, length = self.index[field][row]
+            if length < 0:
+                continue
+            value = self.data(field)[start : start + length]
+            item[field] = value.T if meta["ndim"] == 2 else value
+        return item
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = {}
+        return state
+
+
+class FeatureStore:
+    """Read-only view of the features written by `FeatureStoreWriter` for one config hash.
+
+    Items are returned as numpy views into memory-mapped shards; no data is copied until it
+    is written to.
+    """
+
+    def __init__(self, root, config_hash):
+        self.path = Path(root) / config_hash
+        self.config_hash = config_hash
+        self._shards = []
+        self._lookup = {}
+        self.refresh()
+
+    @property
+    def config(self):
+        config_path = self.path / "config.json"
+        if not config_path.exists():
+            return None
+        with open(config_path) as f:
+            return json.load(f)
+
+    def refresh(self):
+        """Pick up shards written since the store was opened."""
+        if not self.path.exists():
+            return
+        known = set(shard.path.name for shard in self._shards)
+        for name in sorted(os.listdir(self.path)):
+            if not name.startswith(_SHARD_PREFIX) or name in known:
+                continue
+            shard = _Shard(self.path / name)
+            shard_idx = len(self._shards)
+            self._shards.append(shard)
+            for row, key in enumerate(shard.keys):
+                self._lookup[key] = (shard_idx, row)
+
+    def __len__(self):
+        return len(self._lookup)
+
+    def __contains__(self, key):
+        return key in self._lookup
+
+    def keys(self):
+        return self._lookup.keys()
+
+    def get(self, key):
+        """Return a dict of field name -> array for `key`, or None if it is not in the store."""
+        location = self._lookup.get(key)
+        if location is None:
+            return None
+        shard_idx, row = location
+        return self._shards[shard_idx].get(row)
+
+    def attrs(self, key):
+        """Return the attributes the shard holding `key` was written with."""
+        shard_idx, _ = self._lookup[key]
+        return self._shards[shard_idx].attrs
+
+    def clear(self):
+        """Delete every shard of this config hash."""
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self._shards = []
+        self._lookup = {}
+
+
+# Try catch to resolve weirdness in GitHub actions runner.
+try:
+    SPECTROGRAM_CACHE_LOCATION = Path.home() / Path(".cache/uberduck/spectrograms")
+except:
+    SPECTROGRAM_CACHE_LOCATION = None
+
+
+class SpectrogramCache:
+    """Append-only cache of float32 spectrograms for one config hash.
+
+    All spectrograms live in a single `data.bin` file next to a text index with one
+    `key\toffset\trows\tcols` line per entry. Writers take an exclusive lock, append the data and
+    only then the index line, so readers (which only parse complete index lines) never see a
+    partial entry. Reads slice a memory map of `data.bin` and never unpickle anything.
+
+    `put` only buffers in memory, so dataloader workers take the lock once per batch of misses
+    rather than once per spectrogram. The buffer is appended with `put_many` once it holds
+    `flush_every` spectrograms or its oldest one is `flush_seconds` old, by an explicit
+    `flush`, and on a clean process exit. Terminated workers can't flush, so they lose what
+    they buffered since their last flush; those spectrograms are computed again on their next
+    miss.
+    """
+
+    DTYPE = np.float32
+
+    def __init__(self, root, config_hash, flush_every=64, flush_seconds=10.0):
+        self.path = Path(root) / config_hash
+        self.config_hash = config_hash
+        self.flush_every = flush_every
+        self.flush_seconds = flush_seconds
+        os.makedirs(self.path, exist_ok=True)
+        self.data_path = self.path / "data.bin"
+        self.index_path = self.path / "index.tsv"
+        self.lock_path = self.path / "lock"
+        self._index = {}
+        self._index_pos = 0
+        self._data = None
+        self._pending = {}
+        self._pending_since = None
+        self._finalizer_pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None
+        state["_pending"] = {}
+        state["_finalizer_pid"] = None
+        return state
+
+    def _refresh_index(self):
+        if not self.index_path.exists():
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self._index_pos)
+            chunk = f.read()
+        # NOTE (Sam): a line without its newline is still being written.
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].decode("utf-8").splitlines():
+            key, offset, rows, cols = line.rsplit("\t", 3)
+            self._index[key] = (int(offset), int(rows), int(cols))
+        self._index_pos += end
+
+    def _lookup(self, key):
+        if key not in self._index:
+            self._refresh_index()
+        return self._index.get(key)
+
+    def __contains__(self, key):
+        return key in self._pending or self._lookup(key) is not None
+
+    def __len__(self):
+        self._refresh_index()
+        return len(self._index) + sum(key not in self._index for key in self._pending)
+
+    def get(self, key):
+        """Return the cached spectrogram for `key` as a [rows, cols] tensor, or None."""
+        if key in self._pending:
+            return torch.from_numpy(self._pending[key])
+        entry = self._lookup(key)
+        if entry is None:
+            return None
+        offset, rows, cols = entry
+        itemsize = np.dtype(self.DTYPE).itemsize
+        end = offset + rows * cols * itemsize
+        if self._data is None or self._data.size * itemsize < end:
+            # NOTE (Sam): the file grows as other processes append, so remap when an entry is past the end.
+            self._data = np.memmap(self.data_path, dtype=self.DTYPE, mode="c")
+        start = offset // itemsize
+        value = self._data[start : start + rows * cols].reshape(rows, cols)
+        return torch.from_numpy(value)
+
+    def _as_array(self, key, spec):
+        value = np.ascontiguousarray(
+            spec.detach().cpu().numpy() if torch.is_tensor(spec) else spec,
+            dtype=self.DTYPE,
+        )
+        assert value.ndim == 2, "Expected a [freq, frames] spectrogram"
+        assert "\n" not in key
+        return value
+
+    def put(self, key, spec):
+        """Buffer `spec` under `key`, to be appended by the next `flush`."""
+        if key in self._pending or self._lookup(key) is not None:
+            return
+        if self._finalizer_pid != os.getpid():
+            # NOTE (Sam): runs at a clean exit of the main process and of multiprocessing
+            # workers alike, but not when they are terminated.
+            Finalize(self, self.flush, exitpriority=10)
+            self._finalizer_pid = os.getpid()
+        if not self._pending:
+            self._pending_since = time.monotonic()
+        self._pending[key] = self._as_array(key, spec)
+        if (
+            len(self._pending) >= self.flush_every
+            or time.monotonic() - self._pending_since >= self.flush_seconds
+        ):
+            self.flush()
+
+    def flush(self):
+        """Append every buffered spectrogram."""
+        pending, self._pending = self._pending, {}
+        if pending:
+            self.put_many(pending.items())
+
+    def put_many(self, items):
+        """Append (key, spec) pairs that are not cached yet under a single lock."""
+        values = [(key, self._as_array(key, spec)) for key, spec in items]
+        with open(self.lock_path, "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                self._refresh_index()
+                lines = []
+                written = set()
+                with open(self.data_path, "ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    for key, value in values:
+                        if key in self._index or key in written:
+                            continue
+                        f.write(value.tobytes())
+                        rows, cols = value.shape
+                        lines.append((key, offset, rows, cols))
+                        written.add(key)
+                        offset += value.nbytes
+                # NOTE (Sam): the data is written before its index line, so no fsync is needed for
+                # other processes to only ever see complete entries.
+                if lines:
+                    with open(self.index_path, "ab") as f:
+                        f.write(
+                            "".join(
+                                f"{key}\t{offset}\t{rows}\t{cols}\n"
+                                for key, offset, rows, cols in lines
+                            ).encode("utf-8")
+                        )
+                self._refresh_index()
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def clear(self):
+        """Delete every cached spectrogram of this config hash."""
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        os.makedirs(self.path, exist_ok=True)
+        self._index = {}
+        self._index_pos = 0
+        self._data = None
+        self._pending = {}
+
+
+def gst_config_hash(**config):
+    """Return the config hash of the embeddings in a `GSTCache`, e.g. of the TorchMoji files."""
+    return stft_config_hash(kind="gst", **config)
+
+
+# Try catch to resolve weirdness in GitHub actions runner.
+try:
+    GST_CACHE_LOCATION = Path.home() / Path(".cache/uberduck/gsts")
+except:
+    GST_CACHE_LOCATION = None
+
+
+class GSTCache(SpectrogramCache):
+    """`SpectrogramCache` of [1, dim] text embeddings (e.g. TorchMoji GSTs) keyed by text hash.
+
+    `warm` embeds every text that is missing in batches, so readers such as dataloader
+    workers only slice the memory map and never need the model.
+    """
+
+    @staticmethod
+    def text_key(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def get_text(self, text):
+        """Return the [1, dim] embedding of text as a numpy array, or None."""
+        value = self.get(self.text_key(text))
+        return None if value is None else value.numpy()
+
+    def warm(self, texts, compute_gst, batch_size=256):
+        """Embed the texts that are not cached yet with compute_gst and return how many."""
+        missing = sorted(set(text for text in texts if self.text_key(text) not in self))
+        for i in range(0, len(missing), batch_size):
+            batch = missing[i : i + batch_size]
+            embeddings = compute_gst(batch)
+            if torch.is_tensor(embeddings):
+                embeddings = embeddings.detach().cpu().numpy()
+            embeddings = np.asarray(embeddings)
+            self.put_many(
+                (self.text_key(text), embeddings[j : j + 1])
+                for j, text in enumerate(batch)
+            )
+        return len(missing)
@@ -0,0 +1,103 @@
+__all__ = ["LENGTH_INDEX_SUFFIX", "LengthIndex", "read_wav_headers"]
+
+
+from multiprocessing.pool import ThreadPool
+import os
+import uuid
+
+import numpy as np
+
+from ..utils.audio import read_wav_header
+
+LENGTH_INDEX_SUFFIX = ".lengths.npz"
+_FIELDS = ["n_frames", "sampling_rate", "channels", "sample_width"]
+
+
+def read_wav_headers(paths, num_workers=16):
+    """Read the headers of many wav files in parallel.
+
+    Returns an int64 array of shape [len(paths), 4] holding the n_frames, sampling_rate,
+    channels and sample_width of each file (see `read_wav_header`).
+    """
+    if not len(paths):
+        return np.zeros((0, len(_FIELDS)), dtype=np.int64)
+    # NOTE (Sam): reading headers is bound by filesystem latency rather than CPU, so threads are enough.
+    with ThreadPool(num_workers) as pool:
+        headers = pool.map(read_wav_header, paths, chunksize=256)
+    return np.array(headers, dtype=np.int64)
+
+
+class LengthIndex:
+    """Per-file wav header fields for the audio files of a filelist.
+
+    The index is saved next to the filelist (`<filelist>.lengths.npz`) and reused on later runs,
+    so only files that are not in it yet have their headers read. Files that change after they
+    were indexed are not detected; delete the index to rebuild it.
+    """
+
+    def __init__(self, paths, headers):
+        self.paths = list(paths)
+        self.headers = np.asarray(headers, dtype=np.int64).reshape(-1, len(_FIELDS))
+        self._rows = {path: row for row, path in enumerate(self.paths)}
+
+    @classmethod
+    def for_filelist(cls, filelist, paths, num_workers=16):
+        """Return the index of `paths`, loading and updating the one cached next to filelist."""
+        index_path = f"{filelist}{LENGTH_INDEX_SUFFIX}"
+        index = cls([], [])
+        if os.path.exists(index_path):
+            index = cls.load(index_path)
+        missing = sorted(set(paths) - set(index._rows))
+        if missing:
+            index = cls(
+                index.paths + missing,
+                np.concatenate([index.headers, read_wav_headers(missing, num_workers)]),
+            )
+            try:
+                index.save(index_path)
+            except OSError as e:
+                print(f"WARNING! Could not save length index to {index_path}: {e}")
+        return index
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            blob = data["path_bytes"].tobytes()
+            offsets = data["path_offsets"].tolist()
+            paths = [
+                blob[start:end].decode("utf-8")
+                for start, end in zip(offsets[:-1], offsets[1:])
+            ]
+            return cls(paths, data["headers"])
+
+    def save(self, path):
+        # NOTE (Sam): paths are stored as one UTF-8 blob plus offsets, like the string tables of a
+        # Manifest; a fixed-width unicode array would pad every path to the longest one.
+        encoded = [p.encode("utf-8") for p in self.paths]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+        # NOTE (Sam): np.savez appends .npz unless the name already ends with it.
+        tmp_path = f"{path}.tmp-{uuid.uuid4().hex}.npz"
+        np.savez(
+            tmp_path,
+            path_bytes=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            path_offsets=offsets,
+            headers=self.headers,
+        )
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, path):
+        return path in self._rows
+
+    def rows(self, paths):
+        return np.array([self._rows[path] for path in paths], dtype=np.int64)
+
+    def get(self, paths, field):
+        """Return `field` (one of n_frames, sampling_rate, channels, sample_width) for every path."""
+        return self.headers[self.rows(paths), _FIELDS.index(field)]
+
+    def n_frames(self, paths):
+        return self.get(paths, "n_frames")
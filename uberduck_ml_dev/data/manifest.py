@@ -0,0 +1,157 @@
+__all__ = ["MANIFEST_SUFFIX", "Manifest", "compile_manifest", "load_filelist"]
+
+
+import json
+import os
+from pathlib import Path
+import shutil
+import uuid
+
+import numpy as np
+
+from ..utils.utils import load_filepaths_and_text
+from .lengths import LengthIndex
+
+MANIFEST_SUFFIX = ".manifest"
+_MANIFEST_VERSION = 1
+_STRING_COLUMNS = ["paths", "texts"]
+
+
+def _write_string_table(path, strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded], dtype=np.int64)
+    with open(path / "strings.bin", "wb") as f:
+        f.writelines(encoded)
+    np.save(path / "offsets.npy", offsets)
+
+
+def compile_manifest(filelist, out=None, split="|", num_workers=16):
+    """Convert a `path|text|speaker_id` filelist into a manifest directory and return its path.
+
+    The manifest holds a string table each for paths and texts, plus int64 arrays of speaker
+    ids and audio lengths (samples per channel, read from the wav headers).
+    """
+    out = Path(out or f"{filelist}{MANIFEST_SUFFIX}")
+    rows = load_filepaths_and_text(filelist, split=split)
+    assert all(len(row) == 3 for row in rows), "Expected path|text|speaker_id rows"
+    paths = [row[0] for row in rows]
+    tmp_path = out.parent / f".tmp-{out.name}-{uuid.uuid4().hex}"
+    os.makedirs(tmp_path)
+    for name, column in zip(_STRING_COLUMNS, [paths, [row[1] for row in rows]]):
+        os.makedirs(tmp_path / name)
+        _write_string_table(tmp_path / name, column)
+    np.save(
+        tmp_path / "speaker_ids.npy", np.array([int(row[2]) for row in rows], np.int64)
+    )
+    np.save(
+        tmp_path / "n_frames.npy",
+        LengthIndex.for_filelist(filelist, paths, num_workers).n_frames(paths),
+    )
+    with open(tmp_path / "meta.json", "w") as f:
+        json.dump({"version": _MANIFEST_VERSION, "size": len(rows)}, f)
+    if out.exists():
+        shutil.rmtree(out)
+    os.rename(tmp_path, out)
+    return out
+
+
+class _StringTable:
+    def __init__(self, path):
+        self.path = path
+        self._data = None
+        self._offsets = None
+
+    def _load(self):
+        if self._offsets is None:
+            self._offsets = np.load(self.path / "offsets.npy", mmap_mode="r")
+            self._data = np.memmap(self.path / "strings.bin", dtype=np.uint8, mode="r")
+
+    def __getitem__(self, i):
+        self._load()
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return self._data[start:end].tobytes().decode("utf-8")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None
+        state["_offsets"] = None
+        return state
+
+
+class Manifest:
+    """Read-only, memory-mapped view of a manifest written by `compile_manifest`.
+
+    Rows are returned as `(path, text, speaker_id)` string tuples like those of
+    `load_filepaths_and_text`, but nothing is held in Python objects: every DataLoader worker
+    maps the same pages, and pickling a manifest only pickles its path and row selection.
+    `subset` returns a view of some rows (in any order) without copying the data.
+    """
+
+    def __init__(self, path, rows=None):
+        self.path = Path(path)
+        with open(self.path / "meta.json") as f:
+            meta = json.load(f)
+        assert meta["version"] == _MANIFEST_VERSION, f"Unknown manifest version {meta}"
+        self._size = meta["size"]
+        self._rows = None if rows is None else np.asarray(rows, dtype=np.int64)
+        self._paths = _StringTable(self.path / "paths")
+        self._texts = _StringTable(self.path / "texts")
+        self._columns = {}
+
+    def _raw_column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(self.path / f"{name}.npy", mmap_mode="r")
+        return self._columns[name]
+
+    def _column(self, name):
+        column = self._raw_column(name)
+        return column if self._rows is None else column[self._rows]
+
+    @property
+    def speaker_ids(self):
+        return np.asarray(self._column("speaker_ids"))
+
+    @property
+    def n_frames(self):
+        """Audio samples per channel of every row."""
+        return np.asarray(self._column("n_frames"))
+
+    def subset(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if self._rows is not None:
+            rows = self._rows[rows]
+        return Manifest(self.path, rows)
+
+    def __len__(self):
+        return self._size if self._rows is None else len(self._rows)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self.subset(np.arange(len(self))[i])
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        row = i if self._rows is None else self._rows[i]
+        return (
+            self._paths[row],
+            self._texts[row],
+            str(self._raw_column("speaker_ids")[row]),
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_columns"] = {}
+        return state
+
+
+def load_filelist(path, split="|"):
+    """Load a filelist, or a manifest directory written by `compile_manifest`."""
+    if os.path.isdir(path):
+        return Manifest(path)
+    return load_filepaths_and_text(path, split=split)
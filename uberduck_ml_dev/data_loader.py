@@ -2,13 +2,17 @@ __all__ = [
     "pad_sequences",
     "prepare_input_sequence",
     "oversample",
+    "sample_weights",
     "TextMelDataset",
     "TextMelCollate",
     "TextAudioSpeakerLoader",
     "TextAudioSpeakerCollate",
     "DistributedBucketSampler",
+    "FrameBudgetBatchSampler",
+    "WeightedDistributedSampler",
 ]
 
+import math
 import os
 import random
 import re
@@ -28,13 +32,26 @@ from .text.symbols import (
     NVIDIA_TACO2_SYMBOLS,
     GRAD_TTS_SYMBOLS,
 )
-from .text.util import cleaned_text_to_sequence, text_to_sequence
-from .utils.audio import compute_yin, load_wav_to_torch
-from .utils.utils import (
-    load_filepaths_and_text,
-    intersperse,
+from .text.util import (
+    cleaned_text_to_sequence,
+    text_to_sequence,
+    texts_to_sequences,
+    tokenize_text,
+    warm_lexicon,
 )
+from .utils.audio import compute_yin, load_wav_to_torch
+from .utils.utils import intersperse
 from .data.batch import Batch
+from .data.features import (
+    FeatureStore,
+    FeatureStoreWriter,
+    SPECTROGRAM_CACHE_LOCATION,
+    SpectrogramCache,
+    spectrogram_config_hash,
+    stft_config_hash,
+)
+from .data.lengths import LengthIndex
+from .data.manifest import Manifest, load_filelist
 
 
 def pad_sequences(batch):
@@ -58,19 +75,12 @@ def prepare_input_sequence(
     text_cleaner=["english_cleaners"],
 ):
     p_arpabet = float(arpabet)
-    seqs = []
-    for text in texts:
-        seqs.append(
-            torch.IntTensor(
-                text_to_sequence(
-                    text,
-                    text_cleaner,
-                    p_arpabet=p_arpabet,
-                    symbol_set=symbol_set,
-                )[:]
-            )
-        )
-    text_padded, input_lengths = pad_sequences(seqs)
+    text_padded, input_lengths = texts_to_sequences(
+        texts,
+        text_cleaner,
+        p_arpabet=p_arpabet,
+        symbol_set=symbol_set,
+    )
     if not cpu_run:
         text_padded = text_padded.cuda().long()
         input_lengths = input_lengths.cuda().long()
@@ -91,6 +101,50 @@ def oversample(filepaths_text_sid, sid_to_weight):
     return output
 
 
+def sample_weights(filepaths_text_sid, sid_to_weight):
+    """Return how often `oversample` would repeat each row, or None without any weights."""
+    assert all([isinstance(sid, str) for sid in sid_to_weight.keys()])
+    if not sid_to_weight:
+        return None
+    if isinstance(filepaths_text_sid, Manifest):
+        speaker_ids = filepaths_text_sid.speaker_ids
+        weights = np.ones(len(speaker_ids), dtype=np.int64)
+        for sid, weight in sid_to_weight.items():
+            weights[speaker_ids == int(sid)] = weight
+        return weights
+    return np.array(
+        [sid_to_weight.get(fts[2], 1) for fts in filepaths_text_sid], dtype=np.int64
+    )
+
+
+def _take(filepaths_text_sid, indices):
+    if isinstance(filepaths_text_sid, Manifest):
+        return filepaths_text_sid.subset(indices)
+    return [filepaths_text_sid[i] for i in indices]
+
+
+def _n_samples(filelist, filepaths_text_sid):
+    """Audio length in samples of every row, from a manifest or the length index of filelist."""
+    if isinstance(filepaths_text_sid, Manifest):
+        return filepaths_text_sid.n_frames
+    paths = [fts[0] for fts in filepaths_text_sid]
+    return LengthIndex.for_filelist(filelist, paths).n_frames(paths)
+
+
+def _oversampled_indices(dataset, n_items):
+    """Indices of the first n_items of dataset, each repeated by its oversampling weight."""
+    indices = np.arange(n_items)
+    weights = getattr(dataset, "sample_weights", None)
+    if weights is None:
+        return indices
+    return np.repeat(indices, weights[:n_items])
+
+
+def _normalize_audio(audio):
+    """Scale audio to a peak of 0.5, as every loader does before computing spectrograms."""
+    return audio / (np.abs(audio).max() * 2)  # NOTE (Sam): just must be < 1.
+
+
 def _orig_to_dense_speaker_id(speaker_ids):
     speaker_ids = np.asarray(list(set(speaker_ids)), dtype=str)
     id_order = np.argsort(np.asarray(speaker_ids, dtype=int))
@@ -127,15 +181,29 @@ class TextMelDataset(Dataset):
         intersperse_text: bool = False,
         intersperse_token: int = 0,
         compute_gst=None,
+        feature_store: str = None,
+        gst_cache=None,
+        stft_backend: str = "conv",
+        return_audio: bool = False,
+        verbose: bool = True,
     ):
         super().__init__()
         path = audiopaths_and_text
-        oversample_weights = oversample_weights or {}
-        self.audiopaths_and_text = oversample(
-            load_filepaths_and_text(path), oversample_weights
+        self.filelist = path
+        # NOTE (Sam): rows aren't duplicated for oversampling, samplers repeat them by sample_weights instead.
+        self.audiopaths_and_text = load_filelist(path)
+        self.sample_weights = sample_weights(
+            self.audiopaths_and_text, oversample_weights or {}
         )
         self.text_cleaners = text_cleaners
         self.p_arpabet = p_arpabet
+        if p_arpabet > 0:
+            n_converted = warm_lexicon(
+                (transcription for _, transcription, _ in self.audiopaths_and_text),
+                text_cleaners,
+            )
+            if verbose:
+                print(f"Converted {n_converted} new words to ARPAbet")
 
         self.stft = MelSTFT(
             filter_length=filter_length,
@@ -146,19 +214,29 @@ class TextMelDataset(Dataset):
             mel_fmin=mel_fmin,
             mel_fmax=mel_fmax,
             padding=padding,
+            backend=stft_backend,
         )
         self.max_wav_value = max_wav_value
         self.sampling_rate = sampling_rate
         self.filter_length = filter_length
         self.hop_length = hop_length
+        self.win_length = win_length
+        self.n_mel_channels = n_mel_channels
+        self.padding = self.stft.stft_fn.padding
         self.mel_fmin = mel_fmin
         self.mel_fmax = mel_fmax
         self.include_f0 = include_f0
         self.f0_min = f0_min
         self.f0_max = f0_max
         self.harmonic_threshold = harmonic_thresh
+        # NOTE (Sam): with return_audio, items carry normalized audio instead of a mel,
+        # and the trainer computes mels for the whole batch on its device.
+        self.return_audio = return_audio
         # speaker id lookup table
-        speaker_ids = [i[2] for i in self.audiopaths_and_text]
+        if isinstance(self.audiopaths_and_text, Manifest):
+            speaker_ids = np.unique(self.audiopaths_and_text.speaker_ids).astype(str)
+        else:
+            speaker_ids = [i[2] for i in self.audiopaths_and_text]
         self._speaker_id_map = _orig_to_dense_speaker_id(speaker_ids)
         self.debug = debug
         self.debug_dataset_size = debug_dataset_size
@@ -166,6 +244,113 @@ class TextMelDataset(Dataset):
         self.intersperse_text = intersperse_text
         self.intersperse_token = intersperse_token
         self.compute_gst = compute_gst
+        self.gst_cache = gst_cache
+        if gst_cache is not None and compute_gst is not None:
+            n_embedded = gst_cache.warm(
+                (transcription for _, transcription, _ in self.audiopaths_and_text),
+                compute_gst,
+            )
+            if verbose:
+                print(f"Embedded {n_embedded} new transcripts into {gst_cache.path}")
+            # NOTE (Sam): every transcript is cached now, so workers don't need the GST model.
+            self.compute_gst = None
+        self._tokenized = None
+        if not self._deterministic_text:
+            # NOTE (Sam): each transcript is cleaned and converted on first use, after which
+            # epochs only sample words. warm_lexicon above already ran g2p for every word.
+            self._tokenized = {}
+        self._lengths = None
+        self.feature_store = None
+        if feature_store is not None:
+            self.feature_store = FeatureStore(feature_store, self.feature_config_hash)
+            if not len(self.feature_store):
+                print(
+                    f"WARNING! No features found in {self.feature_store.path}, they will be computed on the fly."
+                )
+
+    @property
+    def feature_config(self):
+        """Parameters that determine the precomputed audio features."""
+        return dict(
+            filter_length=self.filter_length,
+            hop_length=self.hop_length,
+            win_length=self.win_length,
+            n_mel_channels=self.n_mel_channels,
+            sampling_rate=self.sampling_rate,
+            mel_fmin=self.mel_fmin,
+            mel_fmax=self.mel_fmax,
+            padding=self.padding,
+            f0_min=self.f0_min,
+            f0_max=self.f0_max,
+            harmonic_thresh=self.harmonic_threshold,
+        )
+
+    @property
+    def feature_config_hash(self):
+        return stft_config_hash(**self.feature_config)
+
+    @property
+    def text_config(self):
+        return dict(
+            text_cleaners=list(self.text_cleaners),
+            symbol_set=self.symbol_set,
+            p_arpabet=float(self.p_arpabet),
+        )
+
+    @property
+    def _deterministic_text(self):
+        # NOTE (Sam): with a fractional p_arpabet every access samples a new sequence, so it can't be precomputed.
+        return self.p_arpabet in (0.0, 1.0)
+
+    def featurize(self, root, shard_size=1024):
+        """Precompute features for every file and write them to a feature store at root.
+
+        Files already in the store are skipped. Returns the store, which is also used by this
+        dataset from now on.
+        """
+        config_hash = self.feature_config_hash
+        store = FeatureStore(root, config_hash)
+        attrs = {"text": self.text_config if self._deterministic_text else None}
+        with FeatureStoreWriter(
+            root,
+            config_hash,
+            config=self.feature_config,
+            shard_size=shard_size,
+            attrs=attrs,
+        ) as writer:
+            seen = set(store.keys())
+            for path, transcription, _ in self.audiopaths_and_text:
+                if path in seen:
+                    continue
+                seen.add(path)
+                writer.add(path, **self.compute_features(path, transcription))
+        self.feature_store = FeatureStore(root, config_hash)
+        return self.feature_store
+
+    def compute_features(self, path, transcription, audio=None):
+        """Compute the features of one file as they are written to a feature store."""
+        if audio is None:
+            audio = self._get_audio(path)
+        text = None
+        if self._deterministic_text:
+            text = self._get_text(transcription).numpy().astype(np.int32)
+        f0 = None
+        if self.include_f0:
+            f0 = self._get_f0(audio.data.cpu().numpy())
+        return dict(mel=self._get_mel(audio).numpy(), f0=f0, text=text)
+
+    def _get_stored_features(self, path):
+        if self.feature_store is None:
+            return {}
+        stored = self.feature_store.get(path)
+        if stored is None:
+            return {}
+        if "text" in stored and not (
+            self._deterministic_text
+            and self.feature_store.attrs(path).get("text") == self.text_config
+        ):
+            del stored["text"]
+        return stored
 
     def _get_f0(self, audio):
         f0, harmonic_rates, argmins, times = compute_yin(
@@ -183,13 +368,22 @@ class TextMelDataset(Dataset):
         return f0
 
     def _get_gst(self, transcription):
+        if self.gst_cache is not None:
+            embedded_gst = self.gst_cache.get_text(transcription[0])
+            if embedded_gst is not None:
+                return embedded_gst
         return self.compute_gst(transcription)
 
-    def _get_data(self, audiopath_and_text):
-        path, transcription, speaker_id = audiopath_and_text
-        speaker_id = self._speaker_id_map[speaker_id]
-        sampling_rate, wav_data = read(path)
-        text_sequence = torch.LongTensor(
+    def _get_text(self, transcription):
+        if self._tokenized is not None:
+            tokenized = self._tokenized.get(transcription)
+            if tokenized is None:
+                tokenized = tokenize_text(
+                    transcription, self.text_cleaners, symbol_set=self.symbol_set
+                )
+                self._tokenized[transcription] = tokenized
+            return torch.from_numpy(tokenized.sample(self.p_arpabet))
+        return torch.LongTensor(
             text_to_sequence(
                 transcription,
                 self.text_cleaners,
@@ -197,17 +391,46 @@ class TextMelDataset(Dataset):
                 symbol_set=self.symbol_set,
             )
         )
+
+    def _get_audio(self, path):
+        sampling_rate, wav_data = read(path)
+        return torch.FloatTensor(wav_data)
+
+    def _normalize_audio(self, audio):
+        return _normalize_audio(audio)
+
+    def _get_mel(self, audio):
+        audio_norm = self._normalize_audio(audio).unsqueeze(0)
+
+        melspec = self.stft.mel_spectrogram(audio_norm)
+        melspec = torch.squeeze(melspec, 0)
+        return melspec
+
+    def _get_data(self, audiopath_and_text):
+        path, transcription, speaker_id = audiopath_and_text
+        speaker_id = self._speaker_id_map[speaker_id]
+        stored = self._get_stored_features(path)
+        if "text" in stored:
+            text_sequence = torch.from_numpy(stored["text"]).long()
+        else:
+            text_sequence = self._get_text(transcription)
         if self.intersperse_text:
             text_sequence = torch.LongTensor(
                 intersperse(text_sequence.numpy(), self.intersperse_token)
             )  # add a blank token, whose id number is len(symbols)
 
-        audio = torch.FloatTensor(wav_data)
-        audio_norm = audio / (np.abs(audio).max() * 2)  # NOTE (Sam): just must be < 1.
-        audio_norm = audio_norm.unsqueeze(0)
-
-        melspec = self.stft.mel_spectrogram(audio_norm)
-        melspec = torch.squeeze(melspec, 0)
+        audio = None
+        melspec = None
+        if self.return_audio:
+            audio = self._get_audio(path)
+            n_frames = int(self.stft.stft_fn.n_frames(audio.size(0)))
+        elif "mel" in stored:
+            melspec = torch.from_numpy(stored["mel"])
+            n_frames = melspec.size(1)
+        else:
+            audio = self._get_audio(path)
+            melspec = self._get_mel(audio)
+            n_frames = melspec.size(1)
         data = {
             "text_sequence": text_sequence,
             "mel": melspec,
@@ -215,15 +438,23 @@ class TextMelDataset(Dataset):
             "embedded_gst": None,
             "f0": None,
         }
+        if self.return_audio:
+            data["audio"] = self._normalize_audio(audio)
+            data["n_frames"] = n_frames
 
-        if self.compute_gst:
+        if self.compute_gst or self.gst_cache is not None:
             embedded_gst = self._get_gst([transcription])
             data["embedded_gst"] = embedded_gst
 
         if self.include_f0:
-            f0 = self._get_f0(audio.data.cpu().numpy())
-            f0 = torch.from_numpy(f0)[None]
-            f0 = f0[:, : melspec.size(1)]
+            if "f0" in stored:
+                f0 = torch.from_numpy(stored["f0"])[None]
+            else:
+                if audio is None:
+                    audio = self._get_audio(path)
+                f0 = self._get_f0(audio.data.cpu().numpy())
+                f0 = torch.from_numpy(f0)[None]
+            f0 = f0[:, :n_frames]
             data["f0"] = f0
 
         return data  # (text_sequence, melspec, speaker_id, f0)
@@ -243,6 +474,20 @@ class TextMelDataset(Dataset):
             return min(self.debug_dataset_size, len(self.audiopaths_and_text))
         return len(self.audiopaths_and_text)
 
+    @property
+    def lengths(self):
+        """Number of mel frames of every item, as used by `DistributedBucketSampler`.
+
+        Lengths are computed from wav headers, so no audio is read.
+        """
+        if self._lengths is None:
+            n_samples = _n_samples(self.filelist, self.audiopaths_and_text[: len(self)])
+            n_frames = (
+                n_samples + 2 * self.padding - self.filter_length
+            ) // self.hop_length + 1
+            self._lengths = n_frames.tolist()
+        return self._lengths
+
     def sample_test_batch(self, size):
         idx = np.random.choice(range(len(self)), size=size, replace=False)
         test_batch = []
@@ -293,9 +538,10 @@ class TextMelCollate:
             text = batch[ids_sorted_decreasing[i]]["text_sequence"]
             text_padded[i, : text.size(0)] = text
 
-        # Right zero-pad mel-spec
-        num_mels = batch[0]["mel"].size(0)
-        max_target_len = max([x["mel"].size(1) for x in batch])
+        # Right zero-pad mel-spec, or the audio of a TextMelDataset with return_audio.
+        return_audio = batch[0]["mel"] is None
+        n_frames = [x["n_frames"] if return_audio else x["mel"].size(1) for x in batch]
+        max_target_len = max(n_frames)
         if max_target_len % self.n_frames_per_step != 0:
             max_target_len += (
                 self.n_frames_per_step - max_target_len % self.n_frames_per_step
@@ -303,8 +549,16 @@ class TextMelCollate:
             assert max_target_len % self.n_frames_per_step == 0
 
         # include mel padded, gate padded and speaker ids
-        mel_padded = torch.FloatTensor(len(batch), num_mels, max_target_len)
-        mel_padded.zero_()
+        mel_padded = None
+        if return_audio:
+            max_audio_len = max([x["audio"].size(0) for x in batch])
+            audio_padded = torch.FloatTensor(len(batch), max_audio_len)
+            audio_padded.zero_()
+            audio_lengths = torch.LongTensor(len(batch))
+        else:
+            num_mels = batch[0]["mel"].size(0)
+            mel_padded = torch.FloatTensor(len(batch), num_mels, max_target_len)
+            mel_padded.zero_()
         gate_padded = torch.FloatTensor(len(batch), max_target_len)
         gate_padded.zero_()
         output_lengths = torch.LongTensor(len(batch))
@@ -314,11 +568,16 @@ class TextMelCollate:
             f0_padded.zero_()
 
         for i in range(len(ids_sorted_decreasing)):
-            mel = batch[ids_sorted_decreasing[i]]["mel"]
-            mel_padded[i, :, : mel.size(1)] = mel
-            gate_padded[i, mel.size(1) - 1 :] = 1
-            output_lengths[i] = mel.size(1)
-            speaker_ids[i] = batch[ids_sorted_decreasing[i]]["speaker_id"]
+            item = batch[ids_sorted_decreasing[i]]
+            item_frames = n_frames[ids_sorted_decreasing[i]]
+            if return_audio:
+                audio_padded[i, : item["audio"].size(0)] = item["audio"]
+                audio_lengths[i] = item["audio"].size(0)
+            else:
+                mel_padded[i, :, :item_frames] = item["mel"]
+            gate_padded[i, item_frames - 1 :] = 1
+            output_lengths[i] = item_frames
+            speaker_ids[i] = item["speaker_id"]
 
         if batch[0]["embedded_gst"] is None:
             embedded_gsts = None
@@ -336,6 +595,9 @@ class TextMelCollate:
             speaker_ids=speaker_ids,
             gst=embedded_gsts,
         )
+        if return_audio:
+            output["audio_padded"] = audio_padded
+            output["audio_lengths"] = audio_lengths
         if self.cudnn_enabled:
             output = output.to_gpu()
         return output
@@ -351,10 +613,9 @@ class TextAudioSpeakerLoader(Dataset):
     def __init__(
         self, audiopaths_sid_text, hparams, debug=False, debug_dataset_size=None
     ):
-        oversample_weights = hparams.oversample_weights or {}
-        self.audiopaths_sid_text = oversample(
-            load_filepaths_and_text(audiopaths_sid_text), oversample_weights
-        )
+        self.oversample_weights = hparams.oversample_weights or {}
+        self.filelist = audiopaths_sid_text
+        self.audiopaths_sid_text = load_filelist(audiopaths_sid_text)
         self.text_cleaners = hparams.text_cleaners
         self.max_wav_value = hparams.max_wav_value
         self.sampling_rate = hparams.sampling_rate
@@ -375,8 +636,27 @@ class TextAudioSpeakerLoader(Dataset):
             mel_fmin=hparams.mel_fmin,
             mel_fmax=hparams.mel_fmax,
             padding=(self.filter_length - self.hop_length) // 2,
+            backend=getattr(hparams, "stft_backend", "conv"),
+        )
+        spectrogram_cache_dir = (
+            getattr(hparams, "spectrogram_cache_dir", None)
+            or SPECTROGRAM_CACHE_LOCATION
+        )
+        self.spectrogram_cache = SpectrogramCache(
+            spectrogram_cache_dir,
+            spectrogram_config_hash(
+                self.filter_length,
+                self.hop_length,
+                self.win_length,
+                self.sampling_rate,
+                self.stft.stft_fn.padding,
+            ),
         )
 
+        # NOTE (Sam): with stft_on_device, items carry no spectrogram and the trainer
+        # computes spectrograms for the whole batch of audio on its device.
+        self.return_audio = getattr(hparams, "stft_on_device", False)
+
         self.cleaned_text = getattr(hparams, "cleaned_text", False)
         # NOTE(zach): Parametrize this later if desired.
         self.symbol_set = IPA_SYMBOLS
@@ -386,7 +666,10 @@ class TextAudioSpeakerLoader(Dataset):
         self.max_text_len = getattr(hparams, "max_text_len", 190)
 
         random.seed(1234)
-        random.shuffle(self.audiopaths_sid_text)
+        # NOTE (Sam): shuffling indices gives the same order as shuffling the rows, and also works for manifests.
+        order = list(range(len(self.audiopaths_sid_text)))
+        random.shuffle(order)
+        self.audiopaths_sid_text = _take(self.audiopaths_sid_text, order)
         self._filter()
 
     def _filter(self):
@@ -394,17 +677,18 @@ class TextAudioSpeakerLoader(Dataset):
         Filter text & store spec lengths
         """
         # Store spectrogram lengths for Bucketing
-        # wav_length ~= file_size / (wav_channels * Bytes per dim) = file_size / (1 * 2)
-        # spec_length = wav_length // hop_length
+        # spec_length = wav_length // hop_length, with wav_length read from the wav headers.
 
-        audiopaths_sid_text_new = []
-        lengths = []
-        for audiopath, sid, text in self.audiopaths_sid_text:
+        keep = []
+        for i, (audiopath, sid, text) in enumerate(self.audiopaths_sid_text):
             if self.min_text_len <= len(text) and len(text) <= self.max_text_len:
-                audiopaths_sid_text_new.append([audiopath, sid, text])
-                lengths.append(os.path.getsize(audiopath) // (2 * self.hop_length))
-        self.audiopaths_sid_text = audiopaths_sid_text_new
-        self.lengths = lengths
+                keep.append(i)
+        self.audiopaths_sid_text = _take(self.audiopaths_sid_text, keep)
+        self.sample_weights = sample_weights(
+            self.audiopaths_sid_text, self.oversample_weights
+        )
+        n_samples = _n_samples(self.filelist, self.audiopaths_sid_text)
+        self.lengths = (n_samples // self.hop_length).tolist()
 
     def get_audio_text_speaker_pair(self, audiopath_sid_text):
         # separate filename, speaker_id and text
@@ -428,16 +712,16 @@ class TextAudioSpeakerLoader(Dataset):
             )
 
         audio = torch.FloatTensor(audio)
-        audio_norm = audio / (np.abs(audio).max() * 2)  # NOTE (Sam): just must be < 1
-        audio_norm = audio_norm.unsqueeze(0)
+        audio_norm = _normalize_audio(audio).unsqueeze(0)
+        if self.return_audio:
+            return None, audio_norm
 
-        spec_filename = filename.replace(".wav", ".uberduck.spec.pt")
-        if os.path.exists(spec_filename):
-            spec = torch.load(spec_filename)
-        else:
+        key = os.path.abspath(filename)
+        spec = self.spectrogram_cache.get(key)
+        if spec is None:
             spec = self.stft.spectrogram(audio_norm)
             spec = torch.squeeze(spec, 0)
-            torch.save(spec, spec_filename)
+            self.spectrogram_cache.put(key, spec)
         return spec, audio_norm
 
     def get_text(self, text):
@@ -477,27 +761,38 @@ class TextAudioSpeakerCollate:
         PARAMS
         ------
         batch: [text_normalized, spec_normalized, wav_normalized, sid]
+
+        spec_normalized is None for a TextAudioSpeakerLoader with stft_on_device, and
+        then so are spec_padded and spec_lengths.
         """
+        return_audio = batch[0][1] is None
         # Right zero-pad all one-hot text sequences to max input length
+        # NOTE (Sam): frames increase with samples, so audio sorts the same way.
         _, ids_sorted_decreasing = torch.sort(
-            torch.LongTensor([x[1].size(1) for x in batch]), dim=0, descending=True
+            torch.LongTensor([x[2 if return_audio else 1].size(1) for x in batch]),
+            dim=0,
+            descending=True,
         )
 
         max_text_len = max([len(x[0]) for x in batch])
-        max_spec_len = max([x[1].size(1) for x in batch])
         max_wav_len = max([x[2].size(1) for x in batch])
 
         text_lengths = torch.LongTensor(len(batch))
-        spec_lengths = torch.LongTensor(len(batch))
         wav_lengths = torch.LongTensor(len(batch))
         sid = torch.LongTensor(len(batch))
 
         text_padded = torch.LongTensor(len(batch), max_text_len)
-        spec_padded = torch.FloatTensor(len(batch), batch[0][1].size(0), max_spec_len)
         wav_padded = torch.FloatTensor(len(batch), 1, max_wav_len)
         text_padded.zero_()
-        spec_padded.zero_()
         wav_padded.zero_()
+        spec_padded, spec_lengths = None, None
+        if not return_audio:
+            max_spec_len = max([x[1].size(1) for x in batch])
+            spec_lengths = torch.LongTensor(len(batch))
+            spec_padded = torch.FloatTensor(
+                len(batch), batch[0][1].size(0), max_spec_len
+            )
+            spec_padded.zero_()
         for i in range(len(ids_sorted_decreasing)):
             row = batch[ids_sorted_decreasing[i]]
 
@@ -505,9 +800,10 @@ class TextAudioSpeakerCollate:
             text_padded[i, : text.size(0)] = text
             text_lengths[i] = text.size(0)
 
-            spec = row[1]
-            spec_padded[i, :, : spec.size(1)] = spec
-            spec_lengths[i] = spec.size(1)
+            if not return_audio:
+                spec = row[1]
+                spec_padded[i, :, : spec.size(1)] = spec
+                spec_lengths[i] = spec.size(1)
 
             wav = row[2]
             wav_padded[i, :, : wav.size(1)] = wav
@@ -558,34 +854,37 @@ class DistributedBucketSampler(DistributedSampler):
     ):
         super().__init__(dataset, num_replicas=num_replicas, rank=rank, shuffle=shuffle)
         self.lengths = dataset.lengths
+        self.indices = _oversampled_indices(dataset, len(self.lengths))
         self.batch_size = batch_size
-        self.boundaries = boundaries
+        # NOTE (Sam): copy since empty buckets are popped, and boundaries often come straight from hparams.
+        self.boundaries = list(boundaries)
 
         self.buckets, self.num_samples_per_bucket = self._create_buckets()
         self.total_size = sum(self.num_samples_per_bucket)
         self.num_samples = self.total_size // self.num_replicas
 
     def _create_buckets(self):
-        buckets = [[] for _ in range(len(self.boundaries) - 1)]
-        for i in range(len(self.lengths)):
-            length = self.lengths[i]
-            idx_bucket = self._bisect(length)
-            if idx_bucket != -1:
-                buckets[idx_bucket].append(i)
+        lengths = np.asarray(self.lengths)[self.indices]
+        boundaries = np.asarray(self.boundaries)
+        # NOTE (Sam): bucket i holds boundaries[i] < length <= boundaries[i + 1].
+        bucket_ids = np.searchsorted(boundaries, lengths, side="left") - 1
+        n_buckets = len(boundaries) - 1
+        valid = (bucket_ids >= 0) & (bucket_ids < n_buckets)
+        indices = self.indices[valid]
+        bucket_ids = bucket_ids[valid]
+        order = np.argsort(bucket_ids, kind="stable")
+        counts = np.bincount(bucket_ids, minlength=n_buckets)
+        buckets = np.split(indices[order], np.cumsum(counts)[:-1])
 
         for i in range(len(buckets) - 1, 0, -1):
             if len(buckets[i]) == 0:
                 buckets.pop(i)
                 self.boundaries.pop(i + 1)
 
-        num_samples_per_bucket = []
-        for i in range(len(buckets)):
-            len_bucket = len(buckets[i])
-            total_batch_size = self.num_replicas * self.batch_size
-            rem = (
-                total_batch_size - (len_bucket % total_batch_size)
-            ) % total_batch_size
-            num_samples_per_bucket.append(len_bucket + rem)
+        len_buckets = np.array([len(bucket) for bucket in buckets], dtype=np.int64)
+        total_batch_size = self.num_replicas * self.batch_size
+        rem = (total_batch_size - (len_buckets % total_batch_size)) % total_batch_size
+        num_samples_per_bucket = (len_buckets + rem).tolist()
         return buckets, num_samples_per_bucket
 
     def __iter__(self):
@@ -593,64 +892,162 @@ class DistributedBucketSampler(DistributedSampler):
         g = torch.Generator()
         g.manual_seed(self.epoch)
 
-        indices = []
-        if self.shuffle:
-            for bucket in self.buckets:
-                indices.append(torch.randperm(len(bucket), generator=g).tolist())
-        else:
-            for bucket in self.buckets:
-                indices.append(list(range(len(bucket))))
-
         batches = []
-        for i in range(len(self.buckets)):
-            bucket = self.buckets[i]
-            len_bucket = len(bucket)
-            ids_bucket = indices[i]
-            num_samples_bucket = self.num_samples_per_bucket[i]
+        for bucket, num_samples_bucket in zip(
+            self.buckets, self.num_samples_per_bucket
+        ):
+            if self.shuffle:
+                ids_bucket = torch.randperm(len(bucket), generator=g).numpy()
+            else:
+                ids_bucket = np.arange(len(bucket))
+            if len(bucket) == 0:
+                continue
 
             # add extra samples to make it evenly divisible
-            rem = num_samples_bucket - len_bucket
-            ids_bucket = (
-                ids_bucket
-                + ids_bucket * (rem // len_bucket)
-                + ids_bucket[: (rem % len_bucket)]
-            )
+            ids_bucket = np.resize(ids_bucket, num_samples_bucket)
 
             # subsample
             ids_bucket = ids_bucket[self.rank :: self.num_replicas]
 
             # batching
-            for j in range(len(ids_bucket) // self.batch_size):
-                batch = [
-                    bucket[idx]
-                    for idx in ids_bucket[
-                        j * self.batch_size : (j + 1) * self.batch_size
-                    ]
-                ]
-                batches.append(batch)
+            num_batches = len(ids_bucket) // self.batch_size
+            batches.append(
+                bucket[ids_bucket[: num_batches * self.batch_size]].reshape(
+                    num_batches, self.batch_size
+                )
+            )
+        batches = (
+            np.concatenate(batches)
+            if batches
+            else np.zeros((0, self.batch_size), dtype=np.int64)
+        )
 
         if self.shuffle:
-            batch_ids = torch.randperm(len(batches), generator=g).tolist()
-            batches = [batches[i] for i in batch_ids]
-        self.batches = batches
+            batch_ids = torch.randperm(len(batches), generator=g).numpy()
+            batches = batches[batch_ids]
+        self.batches = batches.tolist()
 
         assert len(self.batches) * self.batch_size == self.num_samples
         return iter(self.batches)
 
-    def _bisect(self, x, lo=0, hi=None):
-        if hi is None:
-            hi = len(self.boundaries) - 1
+    def __len__(self):
+        return self.num_samples // self.batch_size
+
 
-        if hi > lo:
-            mid = (hi + lo) // 2
-            if self.boundaries[mid] < x and x <= self.boundaries[mid + 1]:
-                return mid
-            elif x <= self.boundaries[mid]:
-                return self._bisect(x, lo, mid)
-            else:
-                return self._bisect(x, mid + 1, hi)
+class FrameBudgetBatchSampler(DistributedSampler):
+    """
+    Batch items of similar length, filling each batch up to a budget of padded frames.
+
+    The size of a batch is its number of items times the length of its longest item, i.e. what
+    it takes up once padded. Lengths are in the units of dataset.lengths (mel or spectrogram
+    frames), so batches of short items hold many items and batches of long items few.
+    Items longer than max_frames get a batch of their own, and items longer than max_length
+    (if set) are dropped, like items past the last boundary of `DistributedBucketSampler`.
+
+    Batch sizes are fixed when the sampler is created, so every epoch has the same number of
+    batches. Each epoch only reshuffles items of equal length and the order of the batches,
+    deterministically based on the epoch.
+    """
+
+    def __init__(
+        self,
+        dataset,
+        max_frames,
+        num_replicas=None,
+        rank=None,
+        shuffle=True,
+        max_batch_size=None,
+        max_length=None,
+    ):
+        super().__init__(dataset, num_replicas=num_replicas, rank=rank, shuffle=shuffle)
+        self.indices = _oversampled_indices(dataset, len(dataset.lengths))
+        self.lengths = np.asarray(dataset.lengths, dtype=np.int64)[self.indices]
+        if max_length is not None:
+            keep = self.lengths <= max_length
+            self.indices = self.indices[keep]
+            self.lengths = self.lengths[keep]
+        if not len(self.lengths):
+            raise ValueError(
+                "FrameBudgetBatchSampler has no items to batch: the dataset is empty "
+                f"or no item is at most max_length={max_length} frames long"
+            )
+        self.max_frames = max_frames
+        self.max_batch_size = max_batch_size
+        self.max_length = max_length
+        self.batch_sizes = self._create_batch_sizes(np.sort(self.lengths))
+        self.num_batches = math.ceil(len(self.batch_sizes) / self.num_replicas)
+        self.total_batches = self.num_batches * self.num_replicas
+
+    def _create_batch_sizes(self, sorted_lengths):
+        batch_sizes = []
+        start = 0
+        while start < len(sorted_lengths):
+            end = start + 1
+            # NOTE (Sam): lengths are ascending, so the newest item is always the longest in the batch.
+            while (
+                end < len(sorted_lengths)
+                and (end + 1 - start) * sorted_lengths[end] <= self.max_frames
+                and (self.max_batch_size is None or end - start < self.max_batch_size)
+            ):
+                end += 1
+            batch_sizes.append(end - start)
+            start = end
+        return batch_sizes
+
+    def __iter__(self):
+        # deterministically shuffle based on epoch
+        g = torch.Generator()
+        g.manual_seed(self.epoch)
+
+        if self.shuffle:
+            tiebreak = torch.randperm(len(self.lengths), generator=g).numpy()
+            order = np.lexsort((tiebreak, self.lengths))
         else:
-            return -1
+            order = np.argsort(self.lengths, kind="stable")
+        order = self.indices[order]
+        ends = np.cumsum(self.batch_sizes)
+        batches = [
+            order[end - size : end].tolist()
+            for size, end in zip(self.batch_sizes, ends)
+        ]
+        if self.shuffle:
+            batch_ids = torch.randperm(len(batches), generator=g).tolist()
+            batches = [batches[i] for i in batch_ids]
+
+        # add extra batches to make it evenly divisible
+        repeats = math.ceil(self.total_batches / len(batches))
+        batches = (batches * repeats)[: self.total_batches]
+
+        # subsample
+        self.batches = batches[self.rank :: self.num_replicas]
+        assert len(self.batches) == self.num_batches
+        return iter(self.batches)
 
     def __len__(self):
-        return self.num_samples // self.batch_size
+        return self.num_batches
+
+
+class WeightedDistributedSampler(DistributedSampler):
+    """
+    Oversample items in proportion to dataset.sample_weights.
+
+    Each epoch yields every row repeated by its weight (see `oversample`), in an order that is
+    shuffled deterministically based on the epoch, and splits them between replicas.
+    """
+
+    def __init__(self, dataset, num_replicas=None, rank=None, seed=0):
+        super().__init__(
+            dataset, num_replicas=num_replicas, rank=rank, shuffle=True, seed=seed
+        )
+        self.indices = _oversampled_indices(dataset, len(dataset))
+        self.num_samples = math.ceil(len(self.indices) / self.num_replicas)
+        self.total_size = self.num_samples * self.num_replicas
+
+    def __iter__(self):
+        rng = np.random.default_rng(self.seed + self.epoch)
+        indices = rng.permutation(self.indices)
+        indices = np.resize(indices, self.total_size)
+        return iter(indices[self.rank :: self.num_replicas].tolist())
+
+    def __len__(self):
+        return self.num_samples
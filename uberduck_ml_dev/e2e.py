@@ -51,7 +51,7 @@ def tts(
 
 from typing import Optional
 
-from .models.common import MelSTFT
+from .models.common import get_mel_stft
 
 
 @torch.no_grad()
@@ -69,7 +69,7 @@ def rhythm_transfer(
     assert len(original_audio.shape) == 1
     cpu_run = device == "cpu"
     # TODO(zach): Support non-default STFT parameters.
-    stft = MelSTFT()
+    stft = get_mel_stft(device=original_audio.device)
     p_arpabet = float(arpabet)
     sequence, input_lengths, _ = prepare_input_sequence(
         [original_text], arpabet=arpabet, cpu_run=cpu_run, symbol_set=symbol_set
@@ -0,0 +1,111 @@
+__all__ = ["run", "parse_args"]
+
+
+import argparse
+import sys
+import time
+
+import torch
+
+from ..models.common import STFT_BACKENDS, MelSTFT
+
+
+def _time(fn, device, n_repeats):
+    fn()  # warmup
+    if device == "cuda":
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(n_repeats):
+        fn()
+    if device == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / n_repeats
+
+
+def run(
+    batch_sizes=(1, 8, 32),
+    seconds=(1.0, 5.0, 10.0),
+    device="cpu",
+    n_repeats=5,
+    **stft_kwargs,
+):
+    """Time spectrogram, mel_spectrogram and inverse for every STFT backend.
+
+    Prints one row per (operation, batch size, clip length) with the seconds per call of each
+    backend, the speedup of "fft" over "conv" and the max absolute difference between them.
+    """
+    stfts = {
+        backend: MelSTFT(device=device, backend=backend, **stft_kwargs)
+        for backend in STFT_BACKENDS
+    }
+    sampling_rate = stfts["conv"].sampling_rate
+    results = []
+    print(
+        f"{'op':<16}{'batch':>6}{'secs':>6}{'conv':>10}{'fft':>10}"
+        f"{'speedup':>9}{'diff':>10}"
+    )
+    for batch_size in batch_sizes:
+        for clip_seconds in seconds:
+            y = torch.rand(batch_size, int(clip_seconds * sampling_rate), device=device)
+            y = y * 2 - 1
+            magnitude, phase = stfts["conv"].stft_fn.transform(y)
+            ops = {
+                "spectrogram": lambda stft: stft.spectrogram(y),
+                "mel_spectrogram": lambda stft: stft.mel_spectrogram(y),
+                "inverse": lambda stft: stft.stft_fn.inverse(magnitude, phase),
+            }
+            for op, fn in ops.items():
+                with torch.no_grad():
+                    outputs = {backend: fn(stft) for backend, stft in stfts.items()}
+                    timings = {
+                        backend: _time(lambda: fn(stft), device, n_repeats)
+                        for backend, stft in stfts.items()
+                    }
+                diff = (outputs["conv"] - outputs["fft"]).abs().max().item()
+                speedup = timings["conv"] / timings["fft"]
+                results.append(
+                    dict(
+                        op=op,
+                        batch_size=batch_size,
+                        seconds=clip_seconds,
+                        max_abs_diff=diff,
+                        speedup=speedup,
+                        **timings,
+                    )
+                )
+                print(
+                    f"{op:<16}{batch_size:>6}{clip_seconds:>6.1f}"
+                    f"{timings['conv']:>10.4f}{timings['fft']:>10.4f}"
+                    f"{speedup:>8.2f}x{diff:>10.2e}"
+                )
+    return results
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch_sizes", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1.0, 5.0, 10.0])
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--n_repeats", type=int, default=5)
+    parser.add_argument("--filter_length", type=int, default=1024)
+    parser.add_argument("--hop_length", type=int, default=256)
+    parser.add_argument("--win_length", type=int, default=1024)
+    return parser.parse_args(args)
+
+
+try:
+    from nbdev.imports import IN_NOTEBOOK
+except:
+    IN_NOTEBOOK = False
+
+if __name__ == "__main__" and not IN_NOTEBOOK:
+    args = parse_args(sys.argv[1:])
+    run(
+        batch_sizes=args.batch_sizes,
+        seconds=args.seconds,
+        device=args.device,
+        n_repeats=args.n_repeats,
+        filter_length=args.filter_length,
+        hop_length=args.hop_length,
+        win_length=args.win_length,
+    )
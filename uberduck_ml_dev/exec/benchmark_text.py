@@ -0,0 +1,159 @@
+__all__ = ["reference_english_cleaners", "run", "parse_args"]
+
+
+import argparse
+import re
+import sys
+import time
+
+from unidecode import unidecode
+
+from ..text import util as text_util
+from ..text.symbols import NVIDIA_TACO2_SYMBOLS
+from ..text.util import clean_text, text_to_sequence, texts_to_sequences
+from ..utils.utils import load_filepaths_and_text
+
+
+def _reference_expand_number(m):
+    num = int(m.group(0))
+    if num > 1000 and num < 3000:
+        if num == 2000:
+            return "two thousand"
+        elif num > 2000 and num < 2010:
+            return "two thousand " + text_util._get_inflect().number_to_words(num % 100)
+        elif num % 100 == 0:
+            return text_util._get_inflect().number_to_words(num // 100) + " hundred"
+        else:
+            return (
+                text_util._get_inflect()
+                .number_to_words(num, andword="", zero="oh", group=2)
+                .replace(", ", " ")
+            )
+    else:
+        return text_util._get_inflect().number_to_words(num, andword="")
+
+
+def reference_english_cleaners(text):
+    """english_cleaners as it was before abbreviations were fused and numbers memoized."""
+    text = unidecode(text)
+    text = text.lower()
+    text = re.sub(text_util._comma_number_re, text_util._remove_commas, text)
+    text = re.sub(text_util._pounds_re, r"\1 pounds", text)
+    text = re.sub(text_util._dollars_re, text_util._expand_dollars, text)
+    text = re.sub(text_util._decimal_number_re, text_util._expand_decimal_point, text)
+    text = re.sub(
+        text_util._ordinal_re,
+        lambda m: text_util._get_inflect().number_to_words(m.group(0)),
+        text,
+    )
+    text = re.sub(text_util._number_re, _reference_expand_number, text)
+    for regex, replacement in text_util._abbreviations:
+        text = re.sub(regex, replacement, text)
+    return re.sub(text_util._whitespace_re, " ", text)
+
+
+def run(
+    filelist,
+    cleaner_names=("english_cleaners",),
+    p_arpabet=0.0,
+    symbol_set=NVIDIA_TACO2_SYMBOLS,
+    num_workers=8,
+    chunk_size=64,
+):
+    """Time cleaning the transcripts of filelist, then converting them one by one against
+    `texts_to_sequences`.
+
+    With only english_cleaners, cleaning is also timed against `reference_english_cleaners`,
+    which must return the same texts.
+    """
+    texts = [row[1] for row in load_filepaths_and_text(filelist)]
+    kwargs = dict(p_arpabet=p_arpabet, symbol_set=symbol_set)
+    # NOTE (Sam): the first number expansion imports inflect, which takes seconds.
+    clean_text("1", list(cleaner_names))
+
+    start = time.perf_counter()
+    for text in texts:
+        clean_text(text, list(cleaner_names))
+    clean_seconds = time.perf_counter() - start
+
+    reference_seconds = None
+    if list(cleaner_names) == ["english_cleaners"]:
+        start = time.perf_counter()
+        expected = [reference_english_cleaners(text) for text in texts]
+        reference_seconds = time.perf_counter() - start
+        assert expected == [clean_text(text, ["english_cleaners"]) for text in texts]
+
+    start = time.perf_counter()
+    sequences = [
+        text_to_sequence(text, list(cleaner_names), **kwargs) for text in texts
+    ]
+    per_string_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    padded, lengths = texts_to_sequences(
+        texts,
+        list(cleaner_names),
+        num_workers=num_workers,
+        chunk_size=chunk_size,
+        **kwargs,
+    )
+    batched_seconds = time.perf_counter() - start
+
+    if p_arpabet in (0.0, 1.0):
+        assert lengths.tolist() == [len(seq) for seq in sequences]
+    print(f"{len(texts)} texts ({len(set(texts))} unique)")
+    print(
+        f"clean_text: {clean_seconds:.3f}s ({len(texts) / clean_seconds:.1f} texts/s, "
+        f"{sum(map(len, texts)) / clean_seconds / 1e6:.2f}M chars/s)"
+    )
+    if reference_seconds is not None:
+        print(
+            f"reference_english_cleaners: {reference_seconds:.3f}s "
+            f"({len(texts) / reference_seconds:.1f} texts/s, "
+            f"clean_text is {reference_seconds / clean_seconds:.2f}x faster)"
+        )
+    print(
+        f"text_to_sequence: {per_string_seconds:.3f}s "
+        f"({len(texts) / per_string_seconds:.1f} texts/s)"
+    )
+    print(
+        f"texts_to_sequences (num_workers={num_workers}): {batched_seconds:.3f}s "
+        f"({len(texts) / batched_seconds:.1f} texts/s, "
+        f"{per_string_seconds / batched_seconds:.2f}x)"
+    )
+    return dict(
+        clean_seconds=clean_seconds,
+        reference_seconds=reference_seconds,
+        per_string_seconds=per_string_seconds,
+        batched_seconds=batched_seconds,
+    )
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--in", dest="input_path", help="Path to input file list", required=True
+    )
+    parser.add_argument("--text_cleaners", nargs="+", default=["english_cleaners"])
+    parser.add_argument("--p_arpabet", type=float, default=0.0)
+    parser.add_argument("--symbol_set", default=NVIDIA_TACO2_SYMBOLS)
+    parser.add_argument("-j", "--num_workers", type=int, default=8)
+    parser.add_argument("--chunk_size", type=int, default=64)
+    return parser.parse_args(args)
+
+
+try:
+    from nbdev.imports import IN_NOTEBOOK
+except:
+    IN_NOTEBOOK = False
+
+if __name__ == "__main__" and not IN_NOTEBOOK:
+    args = parse_args(sys.argv[1:])
+    run(
+        args.input_path,
+        cleaner_names=args.text_cleaners,
+        p_arpabet=args.p_arpabet,
+        symbol_set=args.symbol_set,
+        num_workers=args.num_workers,
+        chunk_size=args.chunk_size,
+    )
@@ -0,0 +1,113 @@
+__all__ = ["run", "parse_args"]
+
+
+import argparse
+import sys
+import time
+
+import numpy as np
+from scipy.io.wavfile import read
+
+from ..utils.audio import (
+    compute_yin,
+    cumulativeMeanNormalizedDifferenceFunction,
+    differenceFunction,
+    getPitch,
+)
+
+# NOTE (Sam): the YIN parameters TextMelDataset._get_f0 uses with the default hparams.
+TRAINER_YIN_KWARGS = dict(
+    w_len=1024, w_step=256, f0_min=80, f0_max=880, harmo_thresh=0.25
+)
+
+
+def compute_yin_per_frame(
+    sig, sr, w_len=512, w_step=256, f0_min=100, f0_max=500, harmo_thresh=0.1
+):
+    """`compute_yin` as it was written before it was vectorized, one frame at a time."""
+    tau_min = int(sr / f0_max)
+    tau_max = int(sr / f0_min)
+    timeScale = range(0, len(sig) - w_len, w_step)
+    pitches, harmonic_rates, argmins = [], [], []
+    for t in timeScale:
+        df = differenceFunction(sig[t : t + w_len], w_len, tau_max)
+        cmdf = cumulativeMeanNormalizedDifferenceFunction(df, tau_max)
+        p = getPitch(cmdf, tau_min, tau_max, harmo_thresh)
+        argmin = np.argmin(cmdf)
+        argmins.append(float(sr / argmin) if argmin > tau_min else 0.0)
+        pitches.append(float(sr / p) if p != 0 else 0.0)
+        harmonic_rates.append(cmdf[p] if p != 0 else min(cmdf))
+    return pitches, harmonic_rates, argmins, [t / float(sr) for t in timeScale]
+
+
+def _time(fn, n_repeats):
+    fn()  # warmup
+    start = time.perf_counter()
+    for _ in range(n_repeats):
+        fn()
+    return (time.perf_counter() - start) / n_repeats
+
+
+def run(wav_path, seconds=(1.0, 5.0, 10.0), n_repeats=5):
+    """Time `compute_yin` against `compute_yin_per_frame` on wav_path, looped to each clip
+    length, with the default and the trainer YIN parameters.
+
+    Prints one row per (parameters, clip length) with the seconds per call of each, the
+    speedup and the max absolute difference between their pitches.
+    """
+    sr, audio = read(wav_path)
+    audio = audio.astype(np.float32) / 32768
+    results = []
+    print(
+        f"{'params':<10}{'secs':>6}{'per_frame':>11}{'yin':>10}{'speedup':>9}{'diff':>10}"
+    )
+    for params, kwargs in [("default", {}), ("trainer", TRAINER_YIN_KWARGS)]:
+        for clip_seconds in seconds:
+            clip = np.resize(audio, int(clip_seconds * sr))
+            expected = compute_yin_per_frame(clip, sr, **kwargs)[0]
+            actual = compute_yin(clip, sr, **kwargs)[0]
+            diff = float(np.abs(np.subtract(expected, actual)).max(initial=0.0))
+            timings = dict(
+                per_frame=_time(
+                    lambda: compute_yin_per_frame(clip, sr, **kwargs), n_repeats
+                ),
+                yin=_time(lambda: compute_yin(clip, sr, **kwargs), n_repeats),
+            )
+            speedup = timings["per_frame"] / timings["yin"]
+            results.append(
+                dict(
+                    params=params,
+                    seconds=clip_seconds,
+                    max_abs_diff=diff,
+                    speedup=speedup,
+                    **timings,
+                )
+            )
+            print(
+                f"{params:<10}{clip_seconds:>6.1f}{timings['per_frame']:>11.4f}"
+                f"{timings['yin']:>10.4f}{speedup:>8.2f}x{diff:>10.2e}"
+            )
+    return results
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--in",
+        dest="wav_path",
+        default="tests/fixtures/ljtest/wavs/LJ001-0001.wav",
+    )
+    parser.add_argument("--seconds", nargs="+", type=float, default=[1.0, 5.0, 10.0])
+    parser.add_argument("--n_repeats", type=int, default=5)
+    return parser.parse_args(args)
+
+
+try:
+    from nbdev.imports import IN_NOTEBOOK
+except:
+    IN_NOTEBOOK = False
+
+if __name__ == "__main__" and not IN_NOTEBOOK:
+    args = parse_args(sys.argv[1:])
+    run(args.wav_path, seconds=args.seconds, n_repeats=args.n_repeats)
@@ -0,0 +1,46 @@
+__all__ = ["run", "parse_args"]
+
+
+import argparse
+import sys
+
+from ..data.manifest import compile_manifest
+
+
+def run(input_path, output_path=None, num_workers=16):
+    """Compile a filelist into a manifest, which can be passed to datasets in its place."""
+    out = compile_manifest(input_path, output_path, num_workers=num_workers)
+    print(f"Wrote manifest to {out}")
+    return out
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--in", dest="input_path", help="Path to input file list", required=True
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        dest="output_path",
+        help="Manifest directory, defaults to <input_path>.manifest",
+        default=None,
+    )
+    parser.add_argument(
+        "-j",
+        "--num_workers",
+        type=int,
+        default=16,
+        help="Threads used to read wav headers",
+    )
+    return parser.parse_args(args)
+
+
+try:
+    from nbdev.imports import IN_NOTEBOOK
+except:
+    IN_NOTEBOOK = False
+
+if __name__ == "__main__" and not IN_NOTEBOOK:
+    args = parse_args(sys.argv[1:])
+    run(args.input_path, args.output_path, num_workers=args.num_workers)
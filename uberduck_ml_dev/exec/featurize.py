@@ -0,0 +1,241 @@
+__all__ = ["featurize_chunk", "run", "parse_args"]
+
+
+import argparse
+import copy
+from multiprocessing import Pool
+import os
+import sys
+import time
+import json
+
+from tqdm import tqdm
+
+from ..data.features import (
+    FeatureStore,
+    FeatureStoreWriter,
+    SpectrogramCache,
+    spectrogram_config_hash,
+)
+from ..data_loader import TextMelDataset
+from ..models.common import STFT
+from ..trainer.tacotron2 import DEFAULTS as TACOTRON2_TRAINER_DEFAULTS
+from ..vendor.tfcompat.hparam import HParams
+
+# NOTE (Sam): set once per worker process by _init_worker, so that the dataset and STFT are only pickled once.
+_WORKER = {}
+
+
+def _init_worker(dataset, spectrogram_stft, spectrogram_cache, feature_root):
+    _WORKER.update(
+        dataset=dataset,
+        spectrogram_stft=spectrogram_stft,
+        spectrogram_cache=spectrogram_cache,
+        feature_root=feature_root,
+    )
+
+
+def featurize_chunk(items):
+    """Featurize (path, transcription, write_features, write_spectrogram) items and write
+    their features as one feature store shard and their spectrograms to the cache.
+
+    Returns the number of files written, their total duration in seconds and a list of
+    (path, error) for files that failed.
+    """
+    dataset = _WORKER["dataset"]
+    spectrogram_stft = _WORKER["spectrogram_stft"]
+    spectrogram_cache = _WORKER["spectrogram_cache"]
+    n_files = 0
+    audio_seconds = 0.0
+    failures = []
+    with FeatureStoreWriter(
+        _WORKER["feature_root"],
+        dataset.feature_config_hash,
+        config=dataset.feature_config,
+        shard_size=len(items) + 1,
+        attrs={"text": dataset.text_config if dataset._deterministic_text else None},
+    ) as writer:
+        for path, transcription, write_features, write_spectrogram in items:
+            try:
+                audio = dataset._get_audio(path)
+                if write_features:
+                    writer.add(
+                        path,
+                        **dataset.compute_features(path, transcription, audio=audio),
+                    )
+                if write_spectrogram:
+                    audio_norm = dataset._normalize_audio(audio)
+                    spec, _ = spectrogram_stft.transform(audio_norm.unsqueeze(0))
+                    spectrogram_cache.put(os.path.abspath(path), spec.data.squeeze(0))
+                n_files += 1
+                audio_seconds += len(audio) / dataset.sampling_rate
+            except Exception as e:
+                failures.append((path, repr(e)))
+    if spectrogram_cache is not None:
+        spectrogram_cache.flush()
+    return n_files, audio_seconds, failures
+
+
+def run(
+    hparams,
+    filelist,
+    feature_store,
+    spectrogram_cache_dir=None,
+    num_workers=None,
+    chunk_size=64,
+):
+    """Compute features for every file in filelist, skipping files that are already done.
+
+    Mels, f0 (if hparams.include_f0) and text sequences (if hparams.p_arpabet is 0 or 1) are written
+    to a feature store at feature_store, which can be passed to TextMelDataset. If
+    spectrogram_cache_dir is set, the linear spectrograms used by TextAudioSpeakerLoader are
+    also written there.
+
+    The dataset reads the same hparams as `Tacotron2Trainer.training_dataset_args`, so the
+    trainer finds the store under the same feature config hash.
+    """
+    dataset = TextMelDataset(
+        audiopaths_and_text=filelist,
+        text_cleaners=hparams.text_cleaners,
+        p_arpabet=hparams.p_arpabet,
+        n_mel_channels=hparams.n_mel_channels,
+        sampling_rate=hparams.sampling_rate,
+        mel_fmin=hparams.mel_fmin,
+        mel_fmax=hparams.mel_fmax,
+        filter_length=hparams.filter_length,
+        hop_length=hparams.hop_length,
+        win_length=hparams.win_length,
+        symbol_set=hparams.symbol_set,
+        padding=hparams.get("padding"),
+        include_f0=hparams.include_f0,
+        f0_min=hparams.get("f0_min", 80),
+        f0_max=hparams.get("f0_max", 880),
+        harmonic_thresh=hparams.get("harmonic_thresh", 0.25),
+        stft_backend=hparams.get("stft_backend", "conv"),
+    )
+    store = FeatureStore(feature_store, dataset.feature_config_hash)
+    spectrogram_stft = None
+    spectrogram_cache = None
+    if spectrogram_cache_dir:
+        # NOTE (Sam): match the padding used by TextAudioSpeakerLoader.
+        padding = (hparams.filter_length - hparams.hop_length) // 2
+        spectrogram_stft = STFT(
+            hparams.filter_length,
+            hparams.hop_length,
+            hparams.win_length,
+            padding=padding,
+        )
+        spectrogram_cache = SpectrogramCache(
+            spectrogram_cache_dir,
+            spectrogram_config_hash(
+                hparams.filter_length,
+                hparams.hop_length,
+                hparams.win_length,
+                hparams.sampling_rate,
+                padding,
+            ),
+        )
+
+    todo = []
+    seen = set()
+    for path, transcription, _ in dataset.audiopaths_and_text:
+        if path in seen:
+            continue
+        seen.add(path)
+        write_features = path not in store
+        write_spectrogram = (
+            spectrogram_cache is not None
+            and os.path.abspath(path) not in spectrogram_cache
+        )
+        if write_features or write_spectrogram:
+            todo.append((path, transcription, write_features, write_spectrogram))
+    print(
+        f"{len(seen) - len(todo)} of {len(seen)} files already featurized in {store.path}"
+    )
+
+    # NOTE (Sam): workers don't need the filelist, so don't pickle it into every process.
+    worker_dataset = copy.copy(dataset)
+    worker_dataset.audiopaths_and_text = []
+    chunks = [todo[i : i + chunk_size] for i in range(0, len(todo), chunk_size)]
+    n_files = 0
+    audio_seconds = 0.0
+    failures = []
+    start = time.perf_counter()
+    with Pool(
+        num_workers,
+        initializer=_init_worker,
+        initargs=(worker_dataset, spectrogram_stft, spectrogram_cache, feature_store),
+    ) as pool, tqdm(total=len(todo), unit="file") as progress:
+        for chunk_files, chunk_seconds, chunk_failures in pool.imap_unordered(
+            featurize_chunk, chunks
+        ):
+            n_files += chunk_files
+            audio_seconds += chunk_seconds
+            failures.extend(chunk_failures)
+            progress.update(chunk_files + len(chunk_failures))
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"Featurized {n_files} files ({audio_seconds:.1f}s of audio) in {elapsed:.1f}s: "
+        f"{n_files / max(elapsed, 1e-9):.2f} files/s, "
+        f"{audio_seconds / max(elapsed, 1e-9):.2f} audio s/s"
+    )
+    if failures:
+        print(f"{len(failures)} files failed:")
+        for path, error in failures:
+            print(f"  {path}: {error}")
+    return dict(
+        n_files=n_files,
+        audio_seconds=audio_seconds,
+        elapsed=elapsed,
+        failures=failures,
+    )
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", "--in", dest="input_path", help="Path to input file list", required=True
+    )
+    parser.add_argument(
+        "-o",
+        "--out",
+        dest="feature_store",
+        help="Feature store directory, as passed to TextMelDataset(feature_store=...)",
+        required=True,
+    )
+    parser.add_argument("--config", help="Path to JSON config")
+    parser.add_argument(
+        "--spectrogram_cache_dir",
+        help="Also write linear spectrograms for VITS to this spectrogram cache",
+        default=None,
+    )
+    parser.add_argument(
+        "-j", "--num_workers", type=int, default=None, help="Defaults to os.cpu_count()"
+    )
+    parser.add_argument("--chunk_size", type=int, default=64)
+    return parser.parse_args(args)
+
+
+try:
+    from nbdev.imports import IN_NOTEBOOK
+except:
+    IN_NOTEBOOK = False
+
+if __name__ == "__main__" and not IN_NOTEBOOK:
+    args = parse_args(sys.argv[1:])
+    config = TACOTRON2_TRAINER_DEFAULTS.values()
+    if args.config:
+        with open(args.config) as f:
+            config.update(json.load(f))
+    hparams = HParams(**config)
+    result = run(
+        hparams,
+        args.input_path,
+        args.feature_store,
+        spectrogram_cache_dir=args.spectrogram_cache_dir,
+        num_workers=args.num_workers,
+        chunk_size=args.chunk_size,
+    )
+    if result["failures"]:
+        sys.exit(1)
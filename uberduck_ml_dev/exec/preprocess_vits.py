@@ -1,11 +1,17 @@
-__all__ = ["batch", "flatten"]
+__all__ = ["batch", "flatten", "clean_chunk", "run", "parse_args"]
 
 
 import argparse
-from functools import reduce
+from itertools import chain, islice
+import json
+from multiprocessing import Pool
+import os
+import sys
+import threading
+import time
 
-from ..text.util import batch_clean_text, clean_text
-from ..utils.utils import load_filepaths_and_text
+from ..text import util
+from ..text.util import batch_clean_text
 
 
 def batch(arr, batch_size):
@@ -18,15 +24,153 @@ def flatten(arr):
 
     Only works for depth of 1.
     """
-    return reduce(lambda a, b: a + b, arr)
+    return list(chain.from_iterable(arr))
 
 
-try:
-    from nbdev.imports import IN_NOTEBOOK
-except:
-    IN_NOTEBOOK = False
+def _read_chunks(filelist, chunk_size, skip_lines=0, split="|"):
+    """Yield the rows of filelist in lists of chunk_size, without loading the whole file."""
+    with open(filelist, encoding="utf-8") as f:
+        lines = islice(f, skip_lines, None)
+        while True:
+            chunk = [line.strip().split(split) for line in islice(lines, chunk_size)]
+            if not chunk:
+                return
+            yield chunk
 
-if __name__ == "__main__" and not IN_NOTEBOOK:
+
+def clean_chunk(rows, text_index, text_cleaners):
+    """Clean the text column of rows and return the number of rows and their filelist lines.
+
+    Line breaks in the cleaned text are replaced with spaces, so every row stays on one line.
+    """
+    texts = batch_clean_text([row[text_index] for row in rows], text_cleaners)
+    assert len(texts) == len(rows), "Cleaners must return one text per row"
+    lines = []
+    for row, text in zip(rows, texts):
+        row = list(row)
+        row[text_index] = text.replace("\r", " ").replace("\n", " ")
+        lines.append("|".join(row) + "\n")
+    return len(rows), "".join(lines)
+
+
+def _clean_chunk(args):
+    return clean_chunk(*args)
+
+
+def _init_worker(text_cleaners):
+    # NOTE (Sam): start espeak when the worker starts rather than on its first chunk.
+    if "english_cleaners_phonemizer" in text_cleaners:
+        util._get_espeak_backend()
+
+
+def _bounded(iterable, in_flight, stop):
+    """Yield from iterable, waiting for in_flight before each item, until stop is set."""
+    for item in iterable:
+        in_flight.acquire()
+        if stop.is_set():
+            return
+        yield item
+
+
+def _load_progress(progress_path, params):
+    with open(progress_path) as f:
+        progress = json.load(f)
+    if progress.get("params") != params:
+        raise ValueError(
+            f"{progress_path} was written with {progress.get('params')}, not {params}; "
+            "rerun with the same arguments or without resuming"
+        )
+    return progress
+
+
+def _save_progress(progress_path, progress):
+    tmp_path = f"{progress_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, progress_path)
+
+
+def run(
+    filelist,
+    out_extension="cleaned",
+    text_index=1,
+    text_cleaners=("english_cleaners_phonemizer",),
+    chunk_size=1000,
+    num_workers=None,
+    resume=True,
+):
+    """Write filelist with its text column cleaned to `<filelist>.<out_extension>`.
+
+    Chunks of chunk_size lines are cleaned in num_workers processes and appended to the output
+    in order as they finish. After each chunk `<output>.progress` records how many lines
+    and bytes are complete, so an interrupted run continues from the last completed chunk
+    (anything written after it is truncated). Resuming with a different filelist, text_index,
+    text_cleaners or chunk_size raises a ValueError. The progress file is removed once the
+    whole filelist is done.
+    """
+    out_path = f"{filelist}.{out_extension}"
+    progress_path = f"{out_path}.progress"
+    params = dict(
+        filelist=os.path.abspath(filelist),
+        text_index=text_index,
+        text_cleaners=list(text_cleaners),
+        chunk_size=chunk_size,
+    )
+    progress = dict(lines=0, bytes=0, params=params)
+    if resume and os.path.exists(out_path) and os.path.exists(progress_path):
+        progress = _load_progress(progress_path, params)
+        print(f"Resuming {out_path} after {progress['lines']} lines")
+    num_workers = num_workers or os.cpu_count()
+    chunks = (
+        (rows, text_index, list(text_cleaners))
+        for rows in _read_chunks(filelist, chunk_size, skip_lines=progress["lines"])
+    )
+    # NOTE (Sam): the pool reads chunks ahead as fast as it can, so only let a few chunks per worker
+    # be in flight at a time, and memory doesn't grow with the filelist.
+    in_flight = threading.Semaphore(2 * num_workers)
+    stop = threading.Event()
+    start = time.perf_counter()
+    n_lines = 0
+    with Pool(
+        num_workers, initializer=_init_worker, initargs=(list(text_cleaners),)
+    ) as pool, open(out_path, "ab") as f:
+        f.truncate(progress["bytes"])
+        try:
+            for chunk_lines, cleaned in pool.imap(
+                _clean_chunk, _bounded(chunks, in_flight, stop)
+            ):
+                in_flight.release()
+                data = cleaned.encode("utf-8")
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                n_lines += chunk_lines
+                progress = dict(
+                    lines=progress["lines"] + chunk_lines,
+                    bytes=progress["bytes"] + len(data),
+                    params=params,
+                )
+                _save_progress(progress_path, progress)
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{progress['lines']} lines done, "
+                    f"{n_lines / max(elapsed, 1e-9):.1f} lines/s"
+                )
+        finally:
+            # NOTE (Sam): wake the pool's task thread if it is waiting, or closing the pool hangs.
+            stop.set()
+            in_flight.release()
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Wrote {out_path}: {n_lines} lines in {elapsed:.1f}s, "
+        f"{n_lines / max(elapsed, 1e-9):.1f} lines/s"
+    )
+    return dict(out_path=out_path, n_lines=n_lines, elapsed=elapsed)
+
+
+def parse_args(args):
     parser = argparse.ArgumentParser()
     parser.add_argument("--out_extension", default="cleaned")
     parser.add_argument("--text_index", default=1, type=int)
@@ -41,20 +185,34 @@ if __name__ == "__main__" and not IN_NOTEBOOK:
     parser.add_argument(
         "--text_cleaners", nargs="+", default=["english_cleaners_phonemizer"]
     )
+    parser.add_argument("--chunk_size", type=int, default=1000)
+    parser.add_argument(
+        "-j", "--num_workers", type=int, default=None, help="Defaults to os.cpu_count()"
+    )
+    parser.add_argument(
+        "--no_resume",
+        dest="resume",
+        action="store_false",
+        help="Start over instead of continuing an interrupted run",
+    )
+    return parser.parse_args(args)
+
 
-    args = parser.parse_args()
+try:
+    from nbdev.imports import IN_NOTEBOOK
+except:
+    IN_NOTEBOOK = False
 
+if __name__ == "__main__" and not IN_NOTEBOOK:
+    args = parse_args(sys.argv[1:])
     for filelist in args.filelists:
         print("START:", filelist)
-        filepaths_and_text = load_filepaths_and_text(filelist)
-        text_batches = batch([fat[args.text_index] for fat in filepaths_and_text], 100)
-        cleaned_text_batch = flatten(
-            [batch_clean_text(batch, args.text_cleaners) for batch in text_batches]
+        run(
+            filelist,
+            out_extension=args.out_extension,
+            text_index=args.text_index,
+            text_cleaners=args.text_cleaners,
+            chunk_size=args.chunk_size,
+            num_workers=args.num_workers,
+            resume=args.resume,
         )
-
-        for i in range(len(filepaths_and_text)):
-            filepaths_and_text[i][args.text_index] = cleaned_text_batch[i]
-
-        new_filelist = filelist + "." + args.out_extension
-        with open(new_filelist, "w", encoding="utf-8") as f:
-            f.writelines(["|".join(x) + "\n" for x in filepaths_and_text])
@@ -5,7 +5,6 @@ import os
 from pathlib import Path
 
 import numpy as np
-from sklearn.model_selection import train_test_split
 
 
 def write_filenames(filenames, output_dir, output_filename):
@@ -27,6 +26,8 @@ def run(
     """Split file in t
     Default behavior only creates a training and validation set (not test set).
     """
+    from sklearn.model_selection import train_test_split
+
     with open(path) as f:
         lines = [l.strip("\n") for l in f.readlines()]
 
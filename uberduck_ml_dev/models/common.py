@@ -3,8 +3,12 @@ __all__ = [
     "LinearNorm",
     "LocationLayer",
     "Attention",
+    "STFT_BACKENDS",
     "STFT",
     "MelSTFT",
+    "get_stft",
+    "get_mel_stft",
+    "clear_stft_cache",
     "ReferenceEncoder",
     "MultiHeadAttention",
     "STL",
@@ -22,6 +26,8 @@ __all__ = [
     "LRELU_SLOPE",
 ]
 
+from collections import OrderedDict
+
 import numpy as np
 from numpy import finfo
 
@@ -32,8 +38,6 @@ from torch import nn
 from torch.nn import functional as F
 from torch.nn.utils import remove_weight_norm, weight_norm
 from torch.nn import init
-from librosa.filters import mel as librosa_mel
-from librosa.util import pad_center, tiny
 
 from ..utils.utils import *
 
@@ -108,6 +112,10 @@ class LocationLayer(nn.Module):
         return processed_attention
 
 
+# NOTE (Sam): "conv" convolves with a dense Fourier basis, "fft" uses torch.stft / torch.fft.irfft.
+STFT_BACKENDS = ["conv", "fft"]
+
+
 # NOTE (Sam): STFTs should get their own file in common folder
 class STFT:
     """adapted from Prem Seetharaman's https://github.com/pseeth/pytorch-stft"""
@@ -121,16 +129,39 @@ class STFT:
         padding=None,
         device="cpu",
         rank=None,
+        backend="conv",
     ):
+        assert backend in STFT_BACKENDS, f"Unknown STFT backend {backend}"
         self.filter_length = filter_length
         self.hop_length = hop_length
         self.win_length = win_length
         self.window = window
+        self.backend = backend
         self.forward_transform = None
-        scale = self.filter_length / self.hop_length
-        fourier_basis = np.fft.fft(np.eye(self.filter_length))
+        self.fft_window = None
 
         self.padding = padding or (filter_length // 2)
+        self._window_sums = OrderedDict()
+
+        if window is not None:
+            assert filter_length >= win_length
+            # get window and zero center pad it to filter_length
+            from librosa.util import pad_center
+
+            fft_window = get_window(window, win_length, fftbins=True)
+            fft_window = pad_center(fft_window, filter_length)
+            fft_window = torch.from_numpy(fft_window).float()
+
+            if device == "cuda":
+                fft_window = fft_window.cuda(rank)
+            self.fft_window = fft_window
+
+        if backend == "conv":
+            self._init_bases(device, rank)
+
+    def _init_bases(self, device, rank):
+        scale = self.filter_length / self.hop_length
+        fourier_basis = np.fft.fft(np.eye(self.filter_length))
 
         cutoff = int((self.filter_length / 2 + 1))
         fourier_basis = np.vstack(
@@ -152,57 +183,161 @@ class STFT:
                 np.linalg.pinv(scale * fourier_basis).T[:, None, :].astype(np.float32)
             )
 
-        if window is not None:
-            assert filter_length >= win_length
-            # get window and zero center pad it to filter_length
-            fft_window = get_window(window, win_length, fftbins=True)
-            fft_window = pad_center(fft_window, filter_length)
-            fft_window = torch.from_numpy(fft_window).float()
-
-            if device == "cuda":
-                fft_window = fft_window.cuda(rank)
-
+        if self.fft_window is not None:
             # window the bases
-            forward_basis *= fft_window
-            inverse_basis *= fft_window
-            self.fft_window = fft_window
+            forward_basis *= self.fft_window
+            inverse_basis *= self.fft_window
 
         self.forward_basis = forward_basis.float()
         self.inverse_basis = inverse_basis.float()
 
-    def transform(self, input_data):
+    # NOTE (Sam): Griffin-Lim and the denoiser invert the same frame counts over and over.
+    _WINDOW_SUM_CACHE_SIZE = 32
+
+    def _window_sum(self, n_frames, device):
+        """The squared window envelope of n_frames, with 1 where it is ~0, as a tensor on device.
+
+        Dividing by it matches dividing only the nonzero samples by the envelope. Envelopes
+        are kept in an LRU keyed by (n_frames, device), so repeated inversions do no NumPy
+        work and no host to device copies.
+        """
+        key = (n_frames, str(device))
+        if key in self._window_sums:
+            self._window_sums.move_to_end(key)
+            return self._window_sums[key]
+        window_sum = window_sumsquare(
+            self.window,
+            n_frames,
+            hop_length=self.hop_length,
+            win_length=self.win_length,
+            n_fft=self.filter_length,
+            dtype=np.float32,
+        )
+        from librosa.util import tiny
+
+        window_sum[window_sum <= tiny(window_sum)] = 1.0
+        window_sum = torch.from_numpy(window_sum).to(device)
+        self._window_sums[key] = window_sum
+        if len(self._window_sums) > self._WINDOW_SUM_CACHE_SIZE:
+            self._window_sums.popitem(last=False)
+        return window_sum
+
+    def _on_device(self, name, device):
+        """Return the tensor attribute name on device, moving it there once if needed."""
+        value = getattr(self, name)
+        if value is not None and value.device != device:
+            value = value.to(device)
+            setattr(self, name, value)
+        return value
+
+    def _fft_transform(self, input_data):
+        """torch.stft of the padded input; the same transform as the conv basis."""
+        forward_transform = torch.stft(
+            input_data.float(),
+            n_fft=self.filter_length,
+            hop_length=self.hop_length,
+            window=self._on_device("fft_window", input_data.device),
+            center=False,
+            return_complex=True,
+        )
+        return forward_transform.abs(), forward_transform.angle()
+
+    def _fft_inverse(self, recombine_magnitude_phase):
+        """Overlap-add the windowed inverse FFT of each frame, like conv_transpose1d with the
+        inverse basis (whose pseudo-inverse of the Fourier basis is exactly irfft)."""
+        cutoff = self.filter_length // 2 + 1
+        spec = torch.complex(
+            recombine_magnitude_phase[:, :cutoff].float(),
+            recombine_magnitude_phase[:, cutoff:].float(),
+        )
+        frames = torch.fft.irfft(spec, n=self.filter_length, dim=1)
+        window = self._on_device("fft_window", frames.device)
+        if window is not None:
+            frames = frames * window[None, :, None]
+        frames = frames * (self.hop_length / self.filter_length)
+        n_frames = frames.size(-1)
+        inverse_transform = F.fold(
+            frames,
+            output_size=(1, (n_frames - 1) * self.hop_length + self.filter_length),
+            kernel_size=(1, self.filter_length),
+            stride=(1, self.hop_length),
+        )
+        return inverse_transform.view(frames.size(0), 1, -1)
+
+    def n_frames(self, n_samples):
+        """Number of frames `transform` returns for n_samples (an int or a tensor)."""
+        return (
+            n_samples + 2 * self.padding - self.filter_length
+        ) // self.hop_length + 1
+
+    def _pad_reflect(self, input_data, lengths):
+        """Reflect-pad every item of a zero-padded [B, T] batch at its own length, as
+        `transform` pads a single unpadded item. Positions past an item's padding are
+        clamped; they only reach frames that are masked."""
+        num_samples = input_data.size(1)
+        positions = torch.arange(
+            -self.padding, num_samples + self.padding, device=input_data.device
+        ).abs()[None]
+        lengths = lengths[:, None]
+        positions = torch.where(
+            positions < lengths, positions, 2 * (lengths - 1) - positions
+        )
+        return input_data.gather(1, positions.clamp(0, num_samples - 1))
+
+    def transform(self, input_data, lengths=None):
+        """Magnitude and phase [B, filter_length // 2 + 1, frames] of a [B, T] batch.
+
+        With lengths, items are zero-padded audio of lengths samples: each is
+        reflect-padded at its own end and frames past its `n_frames` are zero, so every
+        item matches its transform on its own.
+        """
         num_batches = input_data.size(0)
         num_samples = input_data.size(1)
 
         self.num_samples = num_samples
 
-        # similar to librosa, reflect-pad the input
-        input_data = input_data.view(num_batches, 1, num_samples)
-        input_data = F.pad(
-            input_data.unsqueeze(1),
-            (
-                self.padding,
-                self.padding,
-                0,
-                0,
-            ),
-            mode="reflect",
-        )
-        input_data = input_data.squeeze(1)
+        if lengths is None:
+            # similar to librosa, reflect-pad the input
+            input_data = input_data.view(num_batches, 1, num_samples)
+            input_data = F.pad(
+                input_data.unsqueeze(1),
+                (
+                    self.padding,
+                    self.padding,
+                    0,
+                    0,
+                ),
+                mode="reflect",
+            )
+            input_data = input_data.squeeze(1)
+        else:
+            lengths = lengths.to(input_data.device)
+            input_data = self._pad_reflect(input_data, lengths)[:, None, :]
 
-        forward_transform = F.conv1d(
-            input_data,
-            Variable(self.forward_basis, requires_grad=False),
-            stride=self.hop_length,
-            padding=0,
-        )
+        if self.backend == "fft":
+            magnitude, phase = self._fft_transform(input_data.squeeze(1))
+        else:
+            forward_transform = F.conv1d(
+                input_data,
+                Variable(
+                    self._on_device("forward_basis", input_data.device),
+                    requires_grad=False,
+                ),
+                stride=self.hop_length,
+                padding=0,
+            )
 
-        cutoff = self.filter_length // 2 + 1
-        real_part = forward_transform[:, :cutoff, :]
-        imag_part = forward_transform[:, cutoff:, :]
+            cutoff = self.filter_length // 2 + 1
+            real_part = forward_transform[:, :cutoff, :]
+            imag_part = forward_transform[:, cutoff:, :]
+
+            magnitude = torch.sqrt(real_part**2 + imag_part**2)
+            phase = torch.autograd.Variable(torch.atan2(imag_part.data, real_part.data))
 
-        magnitude = torch.sqrt(real_part**2 + imag_part**2)
-        phase = torch.autograd.Variable(torch.atan2(imag_part.data, real_part.data))
+        if lengths is not None:
+            mask = get_mask_from_lengths(self.n_frames(lengths), magnitude.size(-1))
+            magnitude = magnitude * mask[:, None, :]
+            phase = phase * mask[:, None, :]
 
         return magnitude, phase
 
@@ -212,33 +347,24 @@ class STFT:
             dim=1,
         )
 
-        inverse_transform = F.conv_transpose1d(
-            recombine_magnitude_phase,
-            Variable(self.inverse_basis, requires_grad=False),
-            stride=self.hop_length,
-            padding=0,
-        )
+        if self.backend == "fft":
+            inverse_transform = self._fft_inverse(recombine_magnitude_phase)
+        else:
+            inverse_transform = F.conv_transpose1d(
+                recombine_magnitude_phase,
+                Variable(
+                    self._on_device("inverse_basis", magnitude.device),
+                    requires_grad=False,
+                ),
+                stride=self.hop_length,
+                padding=0,
+            )
 
         if self.window is not None:
-            window_sum = window_sumsquare(
-                self.window,
-                magnitude.size(-1),
-                hop_length=self.hop_length,
-                win_length=self.win_length,
-                n_fft=self.filter_length,
-                dtype=np.float32,
-            )
             # remove modulation effects
-            approx_nonzero_indices = torch.from_numpy(
-                np.where(window_sum > tiny(window_sum))[0]
-            )
-            window_sum = torch.autograd.Variable(
-                torch.from_numpy(window_sum), requires_grad=False
+            inverse_transform /= self._window_sum(
+                magnitude.size(-1), inverse_transform.device
             )
-            window_sum = window_sum.cuda() if magnitude.is_cuda else window_sum
-            inverse_transform[:, :, approx_nonzero_indices] /= window_sum[
-                approx_nonzero_indices
-            ]
 
             # scale by hop ratio
             inverse_transform *= float(self.filter_length) / self.hop_length
@@ -267,6 +393,7 @@ class MelSTFT:
         device="cpu",
         padding=None,
         rank=None,
+        backend="conv",
     ):
         self.n_mel_channels = n_mel_channels
         self.sampling_rate = sampling_rate
@@ -280,7 +407,10 @@ class MelSTFT:
             device=device,
             rank=rank,
             padding=padding,
+            backend=backend,
         )
+        from librosa.filters import mel as librosa_mel
+
         mel_basis = librosa_mel(
             sampling_rate, filter_length, n_mel_channels, mel_fmin, mel_fmax
         )
@@ -298,21 +428,26 @@ class MelSTFT:
         return output
 
     def spec_to_mel(self, spec):
+        if self.mel_basis.device != spec.device:
+            self.mel_basis = self.mel_basis.to(spec.device)
         mel_output = torch.matmul(self.mel_basis, spec)
         mel_output = self.spectral_normalize(mel_output)
         return mel_output
 
-    def spectrogram(self, y):
+    def spectrogram(self, y, lengths=None):
+        """Magnitudes of a [B, T] batch; see `STFT.transform` for lengths."""
         assert y.min() >= -1
         assert y.max() <= 1
-        magnitudes, phases = self.stft_fn.transform(y)
+        magnitudes, phases = self.stft_fn.transform(y, lengths)
         return magnitudes.data
 
-    def mel_spectrogram(self, y, ref_level_db=20, magnitude_power=1.5):
+    def mel_spectrogram(self, y, ref_level_db=20, magnitude_power=1.5, lengths=None):
         """Computes mel-spectrograms from a batch of waves
         PARAMS
         ------
         y: Variable(torch.FloatTensor) with shape (B, T) in range [-1, 1]
+        lengths: optional samples of each item of a zero-padded batch, whose frames past
+            `stft_fn.n_frames(lengths)` are then zero
 
         RETURNS
         -------
@@ -321,20 +456,79 @@ class MelSTFT:
         assert y.min() >= -1
         assert y.max() <= 1
 
-        magnitudes, phases = self.stft_fn.transform(y)
+        magnitudes, phases = self.stft_fn.transform(y, lengths)
         magnitudes = magnitudes.data
-        return self.spec_to_mel(magnitudes)
+        mel_output = self.spec_to_mel(magnitudes)
+        if lengths is not None:
+            n_frames = self.stft_fn.n_frames(lengths.to(mel_output.device))
+            mask = get_mask_from_lengths(n_frames, mel_output.size(-1))
+            mel_output = mel_output * mask[:, None, :]
+        return mel_output
 
-    def griffin_lim(self, mel_spectrogram, n_iters=30):
+    def griffin_lim(
+        self, mel_spectrogram, n_iters=10, momentum=0.99, lengths=None, tolerance=None
+    ):
+        """Invert a [n_mels, T] mel (to [1, samples]) or a [B, n_mels, T] batch of mels with
+        optional lengths (to [B, samples]) on their device, using fast Griffin-Lim unless
+        momentum is 0. See `griffin_lim` for the other arguments.
+
+        10 fast iterations reach about the spectral convergence of 30 plain ones; pass
+        momentum=0 with n_iters=30 for the plain Griffin-Lim this used to run."""
+        if mel_spectrogram.dim() == 2:
+            mel_spectrogram = mel_spectrogram.unsqueeze(0)
         mel_dec = self.spectral_de_normalize(mel_spectrogram)
         # Float cast required for fp16 training.
-        mel_dec = mel_dec.transpose(0, 1).cpu().data.float()
-        spec_from_mel = torch.mm(mel_dec, self.mel_basis).transpose(0, 1)
+        mel_dec = mel_dec.detach().float()
+        if self.mel_basis.device != mel_dec.device:
+            self.mel_basis = self.mel_basis.to(mel_dec.device)
+        spec_from_mel = torch.matmul(self.mel_basis.transpose(0, 1), mel_dec)
         spec_from_mel *= 1000
-        out = griffin_lim(spec_from_mel.unsqueeze(0), self.stft_fn, n_iters=n_iters)
+        out = griffin_lim(
+            spec_from_mel,
+            self.stft_fn,
+            n_iters=n_iters,
+            momentum=momentum,
+            lengths=lengths,
+            tolerance=tolerance,
+        )
         return out
 
 
+# NOTE (Sam): building a transform costs a pinv of the Fourier basis (and a librosa mel basis),
+# so sampling, inference and the denoiser share one instance per configuration.
+_TRANSFORMS = {}
+
+
+def _get_transform(cls, device, kwargs):
+    key = (cls.__name__, str(device), tuple(sorted(kwargs.items())))
+    transform = _TRANSFORMS.get(key)
+    if transform is None:
+        transform = cls(device=device, **kwargs)
+        _TRANSFORMS[key] = transform
+    return transform
+
+
+def get_stft(device="cpu", **kwargs):
+    """Return the process-wide STFT for device and the STFT keyword arguments kwargs.
+
+    Instances are created on first use and shared by every later caller with the same
+    arguments, so treat them as read-only. Pass the device of the tensors they will see
+    (e.g. `mel.device`): bases move to the input's device lazily, and a shared instance
+    used from several devices would move them back and forth.
+    """
+    return _get_transform(STFT, device, kwargs)
+
+
+def get_mel_stft(device="cpu", **kwargs):
+    """Return the process-wide MelSTFT for device and kwargs; see `get_stft`."""
+    return _get_transform(MelSTFT, device, kwargs)
+
+
+def clear_stft_cache():
+    """Drop every shared STFT and MelSTFT, e.g. to free device memory."""
+    _TRANSFORMS.clear()
+
+
 class ReferenceEncoder(nn.Module):
     """
     inputs --- [N, Ty/r, n_mels*r]  mels
@@ -1158,6 +1158,7 @@ DEFAULTS = HParams(
     test_size=2,
     n_epochs=10000,
     batch_size=1,
+    max_frames_per_batch=None,
     learning_rate=1e-4,
     seed=37,
     out_size=2 * 22050 // 256,
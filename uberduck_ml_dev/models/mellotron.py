@@ -11,7 +11,8 @@ from torch.cuda.amp import autocast
 from torch.nn import functional as F
 
 from .base import TTSModel
-from .common import Attention, Conv1d, LinearNorm, GST
+from .common import Conv1d, LinearNorm, GST
+from .components.attention import Attention
 from ..text.symbols import symbols
 from ..vendor.tfcompat.hparam import HParams
 from ..utils.utils import to_gpu, get_mask_from_lengths
@@ -1,10 +1,22 @@
-__all__ = ["CMUDict", "valid_symbols"]
+__all__ = ["CMUDICT_INDEX_SUFFIX", "CMUDict", "compile_cmudict", "valid_symbols"]
 
 
 """ from https://github.com/keithito/tacotron """
 
+import hashlib
+import json
+import os
 import re
+import shutil
+import uuid
 
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # NOTE (Sam): no advisory locks on Windows; superseded indexes are then never removed.
+    fcntl = None
 
 valid_symbols = [
     "AA",
@@ -94,27 +106,214 @@ valid_symbols = [
 ]
 
 _valid_symbol_set = set(valid_symbols)
+_symbol_ids = {s: i for i, s in enumerate(valid_symbols)}
+
+CMUDICT_INDEX_SUFFIX = ".index"
+_INDEX_VERSION = 1
+_INDEX_ARRAYS = ["words", "pronunciation_offsets", "phone_offsets", "phones"]
+
+
+def _index_arrays(entries):
+    """Pack {word: [pronunciation, ...]} into sorted words and offset-indexed phone ids."""
+    words = sorted(word.encode("latin-1") for word in entries)
+    pronunciations = [entries[word.decode("latin-1")] for word in words]
+    pronunciation_offsets = np.zeros(len(words) + 1, dtype=np.int64)
+    pronunciation_offsets[1:] = np.cumsum([len(p) for p in pronunciations])
+    phones = [
+        [_symbol_ids[s] for s in pronunciation.split(" ")]
+        for word_pronunciations in pronunciations
+        for pronunciation in word_pronunciations
+    ]
+    phone_offsets = np.zeros(len(phones) + 1, dtype=np.int64)
+    phone_offsets[1:] = np.cumsum([len(p) for p in phones])
+    return dict(
+        # NOTE (Sam): fixed-width bytes so lookups can binary search with np.searchsorted.
+        words=np.array(words, dtype=bytes),
+        pronunciation_offsets=pronunciation_offsets,
+        phone_offsets=phone_offsets,
+        phones=np.array([i for p in phones for i in p], dtype=np.uint8),
+    )
+
+
+def _versioned_index_path(path, out):
+    """Where `compile_cmudict` writes the index of the current contents of the file at path."""
+    stat = os.stat(path)
+    key = f"{_INDEX_VERSION}-{stat.st_size}-{stat.st_mtime_ns}"
+    return f"{out}.{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+
+
+def compile_cmudict(file_or_path, out=None):
+    """Compile a CMUdict text file into an index directory and return its path.
+
+    The index holds the sorted words, offsets into the pronunciations of every word and into
+    the phones of every pronunciation, and the phones as uint8 ids into `valid_symbols`.
+    `CMUDict` memory-maps it, so loading is nearly free and processes share one copy.
+
+    The index is written to a versioned directory next to out (keyed on the size and mtime of
+    the text file), and out is atomically replaced with a symlink to it. Concurrent compiles
+    of the same file (e.g. from every rank) agree on one version. Older versions are removed
+    once no `CMUDict` reads them anymore.
+    """
+    if isinstance(file_or_path, str):
+        out = out or f"{file_or_path}{CMUDICT_INDEX_SUFFIX}"
+        versioned_path = _versioned_index_path(file_or_path, out)
+        if not _is_index(versioned_path):
+            with open(file_or_path, encoding="latin-1") as f:
+                _write_index(_parse_cmudict(f), versioned_path)
+    else:
+        assert out is not None, "out must be set when compiling from a file object"
+        versioned_path = f"{out}.{uuid.uuid4().hex}"
+        _write_index(_parse_cmudict(file_or_path), versioned_path)
+    link_path = f"{out}.tmp-{uuid.uuid4().hex}"
+    os.symlink(os.path.basename(versioned_path), link_path)
+    os.replace(link_path, out)
+    _remove_unused_indexes(out, versioned_path)
+    return out
+
+
+def _remove_unused_indexes(out, keep):
+    """Delete the index directories next to out, other than keep, that no reader locks."""
+    if fcntl is None:
+        return
+    parent = os.path.dirname(os.path.abspath(out))
+    prefix = f"{os.path.basename(out)}."
+    for name in os.listdir(parent):
+        path = os.path.join(parent, name)
+        if (
+            not name.startswith(prefix)
+            or os.path.islink(path)
+            or path == os.path.abspath(keep)
+            or not _is_index(path)
+        ):
+            continue
+        removed_path = os.path.join(parent, f".tmp-{uuid.uuid4().hex}")
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.rename(path, removed_path)
+        except OSError:
+            # NOTE (Sam): a CMUDict still reads it, or another compile removed it first.
+            continue
+        shutil.rmtree(removed_path, ignore_errors=True)
+
+
+def _write_index(entries, path):
+    tmp_path = f"{os.path.dirname(os.path.abspath(path))}/.tmp-{uuid.uuid4().hex}"
+    os.makedirs(tmp_path)
+    for name, array in _index_arrays(entries).items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), array)
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({"version": _INDEX_VERSION}, f)
+    try:
+        os.rename(tmp_path, path)
+    except OSError:
+        # NOTE (Sam): another process wrote the same version first; its index is identical.
+        shutil.rmtree(tmp_path)
+        if not _is_index(path):
+            raise
+
+
+def _is_index(path):
+    return os.path.isfile(os.path.join(path, "meta.json"))
+
+
+def _open_index(path):
+    """Open the meta.json of the index at path, with a shared lock that keeps
+    `compile_cmudict` from removing the index while the file is open."""
+    f = open(os.path.join(path, "meta.json"))
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_SH)
+    return f
 
 
 class CMUDict:
-    """Thin wrapper around CMUDict data. http://www.speech.cs.cmu.edu/cgi-bin/cmudict"""
+    """Thin wrapper around CMUDict data. http://www.speech.cs.cmu.edu/cgi-bin/cmudict
+
+    file_or_path may be a CMUdict text file (or file object), or an index written by
+    `compile_cmudict`, which is memory-mapped instead of parsed. For a text file path, the
+    index next to it (`<path>.index`) is used if it matches the current file and compiled
+    otherwise.
+    """
 
     def __init__(self, file_or_path, keep_ambiguous=True):
-        if isinstance(file_or_path, str):
-            with open(file_or_path, encoding="latin-1") as f:
-                entries = _parse_cmudict(f)
+        self.keep_ambiguous = keep_ambiguous
+        self.path = None
+        self._arrays = None
+        self._meta_file = None
+        if not isinstance(file_or_path, str):
+            self._arrays = _index_arrays(_parse_cmudict(file_or_path))
+        elif os.path.isdir(file_or_path) and _is_index(file_or_path):
+            self.path = file_or_path
         else:
-            entries = _parse_cmudict(file_or_path)
-        if not keep_ambiguous:
-            entries = {word: pron for word, pron in entries.items() if len(pron) == 1}
-        self._entries = entries
+            index_path = f"{file_or_path}{CMUDICT_INDEX_SUFFIX}"
+            # NOTE (Sam): read the versioned directory rather than the symlink, which a recompile
+            # of a changed file may repoint while workers still load this version lazily.
+            versioned_path = _versioned_index_path(file_or_path, index_path)
+            if not _is_index(versioned_path):
+                try:
+                    compile_cmudict(file_or_path, index_path)
+                except OSError as e:
+                    print(
+                        f"WARNING! Could not write CMUdict index to {index_path}: {e}"
+                    )
+                    with open(file_or_path, encoding="latin-1") as f:
+                        self._arrays = _index_arrays(_parse_cmudict(f))
+            if self._arrays is None:
+                self.path = versioned_path
+        if self.path is not None:
+            self._meta_file = _open_index(self.path)
+            meta = json.load(self._meta_file)
+            assert meta["version"] == _INDEX_VERSION, f"Unknown CMUdict index {meta}"
+
+    def _load(self):
+        if self._arrays is None:
+            if self._meta_file is None:
+                self._meta_file = _open_index(self.path)
+            self._arrays = {
+                name: np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+                for name in _INDEX_ARRAYS
+            }
+        return self._arrays
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state["_arrays"] = None
+        state["_meta_file"] = None
+        return state
 
     def __len__(self):
-        return len(self._entries)
+        n_pronunciations = np.diff(self._load()["pronunciation_offsets"])
+        if not self.keep_ambiguous:
+            return int(np.count_nonzero(n_pronunciations == 1))
+        return len(n_pronunciations)
 
     def lookup(self, word):
         """Returns list of ARPAbet pronunciations of the given word."""
-        return self._entries.get(word.upper())
+        arrays = self._load()
+        words = arrays["words"]
+        try:
+            key = word.upper().encode("latin-1")
+        except UnicodeEncodeError:
+            return None
+        # NOTE (Sam): searchsorted would truncate keys longer than the words to their width.
+        if not key or len(key) > words.dtype.itemsize:
+            return None
+        i = int(np.searchsorted(words, key))
+        if i == len(words) or words[i] != key:
+            return None
+        start, end = arrays["pronunciation_offsets"][i : i + 2]
+        if not self.keep_ambiguous and end - start != 1:
+            return None
+        phone_offsets = arrays["phone_offsets"]
+        phones = arrays["phones"]
+        return [
+            " ".join(
+                valid_symbols[p]
+                for p in phones[phone_offsets[j] : phone_offsets[j + 1]].tolist()
+            )
+            for j in range(start, end)
+        ]
 
 
 _alt_re = re.compile(r"\([0-9]+\)")
@@ -0,0 +1,129 @@
+__all__ = ["LEXICON_CACHE_LOCATION", "Lexicon"]
+
+
+from collections import OrderedDict
+import os
+from pathlib import Path
+import sqlite3
+
+# Try catch to resolve weirdness in GitHub actions runner.
+try:
+    LEXICON_CACHE_LOCATION = Path.home() / Path(".cache/uberduck/lexicon.db")
+except:
+    LEXICON_CACHE_LOCATION = None
+
+
+class Lexicon:
+    """Cache of text -> ARPAbet conversions in front of a slow converter such as g2p.
+
+    Lookups go through an in-memory LRU, then a sqlite store at path that persists across runs
+    and is shared between processes, and only then call convert. Texts that appear in the
+    overrides of a lookup are always converted with them and never cached. `hits`,
+    `disk_hits` and `misses` count the lookups served by each level.
+
+    `version` is an optional function returning a string that identifies convert (e.g. the
+    g2p model and dictionary behind it). Rows in the sqlite store are keyed by it, so
+    lexicons with different versions can share a store without seeing each other's entries.
+    """
+
+    def __init__(
+        self, convert, path=LEXICON_CACHE_LOCATION, max_size=100000, version=None
+    ):
+        self.convert = convert
+        self.path = path
+        self.max_size = max_size
+        self.version = version
+        self._version = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._conn = None
+        self._conn_pid = None
+
+    def _connection(self):
+        if self.path is None:
+            return None
+        # NOTE (Sam): sqlite connections must not be shared with forked DataLoader workers.
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(Path(self.path).parent, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.path), timeout=60)
+            with self._conn:
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS lexicon "
+                    "(version TEXT, text TEXT, arpabet TEXT, PRIMARY KEY (version, text))"
+                )
+            self._conn_pid = os.getpid()
+        if self._version is None:
+            self._version = "" if self.version is None else self.version()
+        return self._conn
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conn"] = None
+        state["_conn_pid"] = None
+        return state
+
+    def _remember(self, text, arpabet):
+        self._memory[text] = arpabet
+        self._memory.move_to_end(text)
+        if len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+
+    def _read(self, texts):
+        conn = self._connection()
+        if conn is None or not texts:
+            return {}
+        found = {}
+        texts = list(texts)
+        # NOTE (Sam): stay below sqlite's limit on the number of query parameters.
+        for i in range(0, len(texts), 500):
+            chunk = texts[i : i + 500]
+            query = (
+                "SELECT text, arpabet FROM lexicon WHERE version = ? AND text IN (%s)"
+                % ",".join("?" * len(chunk))
+            )
+            found.update(conn.execute(query, [self._version] + chunk).fetchall())
+        return found
+
+    def _write(self, items):
+        conn = self._connection()
+        if conn is None or not items:
+            return
+        with conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO lexicon (version, text, arpabet) VALUES (?, ?, ?)",
+                [(self._version, text, arpabet) for text, arpabet in items],
+            )
+
+    def get(self, text, overrides=None):
+        if overrides and text in overrides:
+            return self.convert(text, overrides=overrides)
+        if text in self._memory:
+            self.hits += 1
+            self._memory.move_to_end(text)
+            return self._memory[text]
+        arpabet = self._read([text]).get(text)
+        if arpabet is None:
+            self.misses += 1
+            arpabet = self.convert(text)
+            self._write([(text, arpabet)])
+        else:
+            self.disk_hits += 1
+        self._remember(text, arpabet)
+        return arpabet
+
+    def warm(self, texts):
+        """Convert every text missing from the store, writing them in a single transaction."""
+        texts = set(texts)
+        missing = texts - set(self._read(texts))
+        items = [(text, self.convert(text)) for text in sorted(missing)]
+        self.misses += len(items)
+        self._write(items)
+        for text, arpabet in items[: self.max_size]:
+            self._remember(text, arpabet)
+        return len(items)
+
+    @property
+    def stats(self):
+        return dict(hits=self.hits, disk_hits=self.disk_hits, misses=self.misses)
@@ -27,6 +27,8 @@ __all__ = [
     "symbols_to_sequence",
     "arpabet_to_sequence",
     "should_keep_symbol",
+    "SymbolTable",
+    "symbol_table",
     "symbol_to_id",
     "id_to_symbol",
     "curly_re",
@@ -40,6 +42,8 @@ __all__ = [
 Defines the set of symbols used in text input to the model.
 The default is a set of ASCII characters that works well for English or text that has been run through Unidecode. For other data, you can modify _characters. See TRAINING_DATA.md for details. """
 
+import numpy as np
+
 from . import cmudict
 
 _pad = "_"
@@ -263,8 +267,59 @@ def symbols_to_sequence(symbols, symbol_set=DEFAULT_SYMBOLS, ignore_symbols=["_"
 
 
 def arpabet_to_sequence(text, symbol_set=DEFAULT_SYMBOLS):
-    return symbols_to_sequence(["@" + s for s in text.split()], symbol_set=symbol_set)
+    phone_to_id = symbol_table(symbol_set).phone_to_id
+    return [phone_to_id[s] for s in text.split() if s in phone_to_id]
 
 
 def should_keep_symbol(s, symbol_set=DEFAULT_SYMBOLS, ignore_symbols=["_", "~"]):
     return s in symbol_to_id[symbol_set] and s not in ignore_symbols
+
+
+class SymbolTable:
+    """Lookup arrays for converting whole strings of a symbol set to ids at once.
+
+    `codepoint_to_id[ord(c)]` is the id of the single-character symbol c, or -1 when c is not
+    in the symbol set or is ignored; the last entry is -1 and stands for every codepoint past
+    the table. `phone_to_id` maps ARPAbet phones (without the "@" prefix) to their ids.
+    `encode` and `encode_arpabet` return the same ids as `symbols_to_sequence` and
+    `arpabet_to_sequence`.
+    """
+
+    def __init__(self, symbol_set=DEFAULT_SYMBOLS, ignore_symbols=("_", "~")):
+        ids = symbol_to_id[symbol_set]
+        chars = {
+            s: i for s, i in ids.items() if len(s) == 1 and s not in ignore_symbols
+        }
+        self.codepoint_to_id = np.full(
+            max(map(ord, chars), default=-1) + 2, -1, dtype=np.int64
+        )
+        self.codepoint_to_id[[ord(c) for c in chars]] = list(chars.values())
+        # NOTE (Sam): arpabet_to_sequence never ignores phones since ignore_symbols have no "@".
+        self.phone_to_id = {
+            s[1:]: i for s, i in ids.items() if len(s) > 1 and s.startswith("@")
+        }
+
+    def encode(self, text):
+        codepoints = np.frombuffer(
+            text.encode("utf-32-le", "surrogatepass"), dtype=np.uint32
+        )
+        codepoints = np.minimum(codepoints, len(self.codepoint_to_id) - 1)
+        ids = self.codepoint_to_id[codepoints]
+        return ids[ids >= 0]
+
+    def encode_arpabet(self, text):
+        phone_to_id = self.phone_to_id
+        return np.array(
+            [phone_to_id[s] for s in text.split() if s in phone_to_id], dtype=np.int64
+        )
+
+
+_symbol_tables = {}
+
+
+def symbol_table(symbol_set=DEFAULT_SYMBOLS, ignore_symbols=("_", "~")):
+    """Return the (cached) SymbolTable of symbol_set."""
+    key = (symbol_set, tuple(ignore_symbols))
+    if key not in _symbol_tables:
+        _symbol_tables[key] = SymbolTable(symbol_set, ignore_symbols)
+    return _symbol_tables[key]
@@ -6,6 +6,8 @@ __all__ = [
     "collapse_whitespace",
     "convert_to_ascii",
     "convert_to_arpabet",
+    "get_lexicon",
+    "warm_lexicon",
     "basic_cleaners",
     "turkish_cleaners",
     "transliteration_cleaners",
@@ -18,6 +20,9 @@ __all__ = [
     "english_to_arpabet",
     "cleaned_text_to_sequence",
     "text_to_sequence",
+    "texts_to_sequences",
+    "TokenizedText",
+    "tokenize_text",
     "sequence_to_text",
     "BATCH_CLEANERS",
     "CLEANERS",
@@ -41,16 +46,40 @@ hyperparameter. Some cleaners are English-specific. You'll typically want to use
 """
 
 
+from functools import lru_cache, partial
+import hashlib
+from importlib import metadata
+import json
+from multiprocessing import Pool
+import os
 import re
 from typing import List
 
-from g2p_en import G2p
-from phonemizer import phonemize
+import numpy as np
+import torch
 from unidecode import unidecode
 
+from .lexicon import LEXICON_CACHE_LOCATION, Lexicon
 from .symbols import curly_re, words_re, symbols_to_sequence
 
-g2p = G2p()
+_g2p = None
+
+
+def _get_g2p():
+    # NOTE (Sam): G2p loads model weights, so build it the first time a word needs converting.
+    global _g2p
+    if _g2p is None:
+        from g2p_en import G2p
+
+        _g2p = G2p()
+    return _g2p
+
+
+def __getattr__(name):
+    if name == "g2p":
+        return _get_g2p()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Regular expression matching whitespace:
 _whitespace_re = re.compile(r"\s+")
@@ -79,18 +108,39 @@ _abbreviations = [
         ("ft", "fort"),
     ]
 ]
+# NOTE (Sam): one alternation finds every abbreviation in a single scan; the matching group says which.
+_abbreviations_re = re.compile(
+    "\\b(?:%s)\\."
+    % "|".join("(%s)" % regex.pattern[2:-2] for regex, _ in _abbreviations),
+    re.IGNORECASE,
+)
 
-import inflect
 import re
 
 
-_inflect = inflect.engine()
+_inflect = None
 _comma_number_re = re.compile(r"([0-9][0-9\,]+[0-9])")
 _decimal_number_re = re.compile(r"([0-9]+\.[0-9]+)")
 _pounds_re = re.compile(r"£([0-9\,]*[0-9]+)")
 _dollars_re = re.compile(r"\$([0-9\.\,]*[0-9]+)")
 _ordinal_re = re.compile(r"[0-9]+(st|nd|rd|th)")
 _number_re = re.compile(r"[0-9]+")
+_digit_re = re.compile(r"[0-9]")
+
+
+def _get_inflect():
+    # NOTE (Sam): importing inflect takes seconds, so do it the first time a number is expanded.
+    global _inflect
+    if _inflect is None:
+        import inflect
+
+        _inflect = inflect.engine()
+    return _inflect
+
+
+@lru_cache(maxsize=100000)
+def _number_to_words(num, **kwargs):
+    return _get_inflect().number_to_words(num, **kwargs)
 
 
 def _remove_commas(m):
@@ -123,7 +173,7 @@ def _expand_dollars(m):
 
 
 def _expand_ordinal(m):
-    return _inflect.number_to_words(m.group(0))
+    return _number_to_words(m.group(0))
 
 
 def _expand_number(m):
@@ -132,18 +182,20 @@ def _expand_number(m):
         if num == 2000:
             return "two thousand"
         elif num > 2000 and num < 2010:
-            return "two thousand " + _inflect.number_to_words(num % 100)
+            return "two thousand " + _number_to_words(num % 100)
         elif num % 100 == 0:
-            return _inflect.number_to_words(num // 100) + " hundred"
+            return _number_to_words(num // 100) + " hundred"
         else:
-            return _inflect.number_to_words(
-                num, andword="", zero="oh", group=2
-            ).replace(", ", " ")
+            return _number_to_words(num, andword="", zero="oh", group=2).replace(
+                ", ", " "
+            )
     else:
-        return _inflect.number_to_words(num, andword="")
+        return _number_to_words(num, andword="")
 
 
 def normalize_numbers(text):
+    if not _digit_re.search(text):
+        return text
     text = re.sub(_comma_number_re, _remove_commas, text)
     text = re.sub(_pounds_re, r"\1 pounds", text)
     text = re.sub(_dollars_re, _expand_dollars, text)
@@ -154,9 +206,23 @@ def normalize_numbers(text):
 
 
 def expand_abbreviations(text):
-    for regex, replacement in _abbreviations:
-        text = re.sub(regex, replacement, text)
-    return text
+    matches = list(_abbreviations_re.finditer(text))
+    if not matches:
+        return text
+    # NOTE (Sam): applying the patterns one after another removes the word boundary in front of
+    # an abbreviation that directly follows an expanded one (e.g. "mr.st."), so keep doing that.
+    if any(a.end() == b.start() for a, b in zip(matches, matches[1:])):
+        for regex, replacement in _abbreviations:
+            text = re.sub(regex, replacement, text)
+        return text
+    pieces = []
+    end = 0
+    for m in matches:
+        pieces.append(text[end : m.start()])
+        pieces.append(_abbreviations[m.lastindex - 1][1])
+        end = m.end()
+    pieces.append(text[end:])
+    return "".join(pieces)
 
 
 def expand_numbers(text):
@@ -172,18 +238,61 @@ def collapse_whitespace(text):
 
 
 def convert_to_ascii(text):
+    # NOTE (Sam): unidecode leaves ASCII unchanged.
+    if text.isascii():
+        return text
     return unidecode(text)
 
 
-def convert_to_arpabet(text, overrides=None):
+def _g2p_to_arpabet(text, overrides=None):
     return " ".join(
         [
             f"{{ {s.strip()} }}" if s.strip() not in ",." else s.strip()
-            for s in " ".join(g2p(text, overrides=overrides)).split("  ")
+            for s in " ".join(_get_g2p()(text, overrides=overrides)).split("  ")
         ]
     )
 
 
+def _cmudict_mtime():
+    """Modification time of the NLTK CMUdict that g2p reads, or None if it isn't installed."""
+    try:
+        import nltk
+
+        pointer = nltk.data.find("corpora/cmudict")
+    except (ImportError, LookupError):
+        return None
+    if hasattr(pointer, "zipfile"):
+        return os.path.getmtime(pointer.zipfile.filename)
+    return os.path.getmtime(pointer.path)
+
+
+def _g2p_version():
+    """Hash of the g2p_en version and CMUdict behind `_g2p_to_arpabet`."""
+    try:
+        g2p_version = metadata.version("g2p_en")
+    except metadata.PackageNotFoundError:
+        g2p_version = None
+    config = dict(g2p_en=g2p_version, cmudict_mtime=_cmudict_mtime())
+    serialized = json.dumps(config, sort_keys=True)
+    return hashlib.sha1(serialized.encode("utf-8")).hexdigest()[:16]
+
+
+_lexicon = None
+
+
+def get_lexicon():
+    """The `Lexicon` in front of g2p, stored at $UBERDUCK_LEXICON_PATH if it is set."""
+    global _lexicon
+    path = os.environ.get("UBERDUCK_LEXICON_PATH", LEXICON_CACHE_LOCATION)
+    if _lexicon is None or _lexicon.path != path:
+        _lexicon = Lexicon(_g2p_to_arpabet, path=path, version=_g2p_version)
+    return _lexicon
+
+
+def convert_to_arpabet(text, overrides=None):
+    return get_lexicon().get(text, overrides=overrides)
+
+
 def basic_cleaners(text):
     """Basic pipeline that lowercases and collapses whitespace without transliteration."""
     text = lowercase(text)
@@ -216,20 +325,28 @@ def english_cleaners(text):
     return text
 
 
+_espeak_backend = None
+
+
+def _get_espeak_backend():
+    # NOTE (Sam): starting espeak is slow, so every phonemizer call in a process shares one.
+    global _espeak_backend
+    if _espeak_backend is None:
+        from phonemizer.backend import EspeakBackend
+
+        _espeak_backend = EspeakBackend(
+            "en-us", preserve_punctuation=True, with_stress=True
+        )
+    return _espeak_backend
+
+
 def english_cleaners_phonemizer(text):
     """Pipeline for English text to phonemization, including number and abbreviation expansion."""
     text = convert_to_ascii(text)
     text = lowercase(text)
     text = expand_numbers(text)
     text = expand_abbreviations(text)
-    text = phonemize(
-        text,
-        language="en-us",
-        backend="espeak",
-        strip=True,
-        preserve_punctuation=True,
-        with_stress=True,
-    )
+    text = _get_espeak_backend().phonemize([text], strip=True)[0]
     text = collapse_whitespace(text)
     return text
 
@@ -242,14 +359,7 @@ def batch_english_cleaners_phonemizer(text: List[str]):
         t = expand_numbers(t)
         t = expand_abbreviations(t)
         batch.append(t)
-    batch = phonemize(
-        batch,
-        language="en-us",
-        backend="espeak",
-        strip=True,
-        preserve_punctuation=True,
-        with_stress=True,
-    )
+    batch = _get_espeak_backend().phonemize(batch, strip=True)
     batch = [collapse_whitespace(t) for t in batch]
     return batch
 
@@ -264,6 +374,7 @@ from .symbols import (
     id_to_symbol,
     symbols_to_sequence,
     arpabet_to_sequence,
+    symbol_table,
 )
 
 BATCH_CLEANERS = {
@@ -294,11 +405,37 @@ def clean_text(text, cleaner_names):
 
 
 def english_to_arpabet(english_text):
-    arpabet_symbols = g2p(english_text)
+    arpabet_symbols = _get_g2p()(english_text)
+
+
+def _arpabet_words(text, cleaner_names):
+    """The words of text that text_to_sequence may convert to ARPAbet."""
+    words = set()
+    while len(text):
+        m = curly_re.match(text)
+        if not m:
+            cleaned = clean_text(text, cleaner_names)
+            words.update(w for w, _ in words_re.findall(cleaned) if w)
+            break
+        cleaned = clean_text(m.group(1), cleaner_names)
+        words.update(_arpabet_words(cleaned, cleaner_names))
+        text = m.group(3)
+    return words
+
+
+def warm_lexicon(texts, cleaner_names):
+    """Add every word of texts to the lexicon, so g2p doesn't run while training.
+
+    Returns the number of words that were converted.
+    """
+    words = set()
+    for text in texts:
+        words.update(_arpabet_words(text, cleaner_names))
+    return get_lexicon().warm(words)
 
 
 def cleaned_text_to_sequence(cleaned_text, symbol_set):
-    return symbols_to_sequence(cleaned_text, symbol_set=symbol_set, ignore_symbols=[])
+    return symbol_table(symbol_set, ignore_symbols=()).encode(cleaned_text).tolist()
 
 
 def text_to_sequence(
@@ -349,6 +486,142 @@ def text_to_sequence(
     return sequence
 
 
+class TokenizedText:
+    """A transcript split into tokens that each have a grapheme and an ARPAbet ID sequence.
+
+    Built once by `tokenize_text`, after which `sample` draws sequences with the same
+    distribution as `text_to_sequence` without running cleaners or g2p.
+    """
+
+    def __init__(self, graphemes, arpabet, is_word):
+        lengths = [len(seq) for pair in zip(graphemes, arpabet) for seq in pair]
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths, dtype=np.int64)
+        self.ids = np.array(
+            [i for pair in zip(graphemes, arpabet) for seq in pair for i in seq],
+            dtype=np.int64,
+        )
+        self.starts = offsets[:-1].reshape(-1, 2)
+        self.lengths = np.diff(offsets).reshape(-1, 2)
+        self.is_word = np.asarray(is_word, dtype=bool).reshape(-1)
+        self.n_words = int(self.is_word.sum())
+
+    def sample(self, p_arpabet):
+        """Return an ID sequence with each word in ARPAbet with probability p_arpabet."""
+        use_arpabet = np.zeros(len(self.is_word), dtype=np.int64)
+        if self.n_words:
+            # NOTE (Sam): draw from `random` like text_to_sequence does, which DataLoader seeds per worker.
+            draws = np.fromiter(
+                (random.random() for _ in range(self.n_words)), np.float64, self.n_words
+            )
+            use_arpabet[self.is_word] = draws < p_arpabet
+        rows = np.arange(len(self.is_word))
+        starts = self.starts[rows, use_arpabet]
+        lengths = self.lengths[rows, use_arpabet]
+        ends = np.cumsum(lengths)
+        index = np.arange(ends[-1] if len(ends) else 0) + np.repeat(
+            starts - ends + lengths, lengths
+        )
+        return self.ids[index]
+
+
+def _tokens(text, cleaner_names, symbol_set, arpabet_overrides):
+    tokens = []
+    while len(text):
+        m = curly_re.match(text)
+        if not m:
+            cleaned = clean_text(text, cleaner_names)
+            for w, nw in words_re.findall(cleaned):
+                if w:
+                    arpabet = convert_to_arpabet(w, overrides=arpabet_overrides)
+                    tokens.append(
+                        (
+                            symbols_to_sequence(w, symbol_set),
+                            arpabet_to_sequence(arpabet, symbol_set),
+                            True,
+                        )
+                    )
+                else:
+                    tokens.append((symbols_to_sequence(nw, symbol_set), [], False))
+            break
+        cleaned = clean_text(m.group(1), cleaner_names)
+        tokens += _tokens(cleaned, cleaner_names, symbol_set, None)
+        tokens.append((arpabet_to_sequence(m.group(2), symbol_set), [], False))
+        text = m.group(3)
+    return tokens
+
+
+def tokenize_text(
+    text, cleaner_names, symbol_set=DEFAULT_SYMBOLS, arpabet_overrides=None
+):
+    """Split text into a `TokenizedText` the way `text_to_sequence` processes it."""
+    tokens = _tokens(text, cleaner_names, symbol_set, arpabet_overrides)
+    if not tokens:
+        return TokenizedText([], [], [])
+    graphemes, arpabet, is_word = zip(*tokens)
+    return TokenizedText(graphemes, arpabet, is_word)
+
+
+def _texts_to_sequences_chunk(texts, **kwargs):
+    return [text_to_sequence(text, **kwargs) for text in texts]
+
+
+def texts_to_sequences(
+    texts,
+    cleaner_names,
+    p_arpabet=0.0,
+    symbol_set=DEFAULT_SYMBOLS,
+    arpabet_overrides=None,
+    num_workers=0,
+    chunk_size=64,
+):
+    """Converts a batch of strings with `text_to_sequence`.
+
+    Args:
+      texts: strings to convert
+      num_workers: size of the process pool used for batches larger than chunk_size; 0 converts
+        the batch in this process
+      chunk_size: number of strings each pool task converts
+    Returns:
+      A [len(texts), max_length] LongTensor of IDs, zero-padded, and a LongTensor of lengths
+    """
+    kwargs = dict(
+        cleaner_names=cleaner_names,
+        p_arpabet=p_arpabet,
+        symbol_set=symbol_set,
+        arpabet_overrides=arpabet_overrides,
+    )
+    # NOTE (Sam): with a fractional p_arpabet, repeated strings must still be sampled independently.
+    if p_arpabet in (0.0, 1.0):
+        unique_texts = list(dict.fromkeys(texts))
+    else:
+        unique_texts = list(texts)
+    if num_workers and len(unique_texts) > chunk_size:
+        chunks = [
+            unique_texts[i : i + chunk_size]
+            for i in range(0, len(unique_texts), chunk_size)
+        ]
+        with Pool(num_workers) as pool:
+            chunk_sequences = pool.map(
+                partial(_texts_to_sequences_chunk, **kwargs), chunks
+            )
+        unique_sequences = [seq for sequences in chunk_sequences for seq in sequences]
+    else:
+        unique_sequences = _texts_to_sequences_chunk(unique_texts, **kwargs)
+
+    if len(unique_texts) == len(texts):
+        sequences = unique_sequences
+    else:
+        text_to_index = {text: i for i, text in enumerate(unique_texts)}
+        sequences = [unique_sequences[text_to_index[text]] for text in texts]
+    lengths = torch.LongTensor([len(seq) for seq in sequences])
+    max_length = max(lengths.tolist(), default=0)
+    padded = torch.zeros(len(sequences), max_length, dtype=torch.long)
+    for i, seq in enumerate(sequences):
+        padded[i, : len(seq)] = torch.LongTensor(seq)
+    return padded, lengths
+
+
 def sequence_to_text(sequence, symbol_set=DEFAULT_SYMBOLS):
     """Converts a sequence of IDs back to a string"""
     result = ""
@@ -7,12 +7,10 @@ from pprint import pprint
 
 import torch
 import torch.distributed as dist
-from tensorboardX import SummaryWriter
 import numpy as np
 import time
 
-from ..models.common import MelSTFT
-from ..vocoders.hifigan import HiFiGanGenerator
+from ..models.common import get_mel_stft
 from ..models.base import DEFAULTS as MODEL_DEFAULTS
 from ..vendor.tfcompat.hparam import HParams
 
@@ -65,6 +63,8 @@ class TTSTrainer:
             self.device = "cuda"
         else:
             self.device = "cpu"
+        from tensorboardX import SummaryWriter
+
         self.writer = SummaryWriter(self.log_dir)
         if not hasattr(self, "debug"):
             self.debug = False
@@ -130,17 +130,19 @@ class TTSTrainer:
     def sample(self, mel, algorithm="griffin-lim", **kwargs):
         """Invert the mel spectrogram and return the resulting audio.
 
-        audio -> (1, N)
+        audio -> (1, N), or (B, N) for a [B, n_mels, T] batch of mels with griffin-lim
         """
         if self.rank is not None and self.rank != 0:
             return
         if algorithm == "griffin-lim":
-            mel_stft = MelSTFT()
-            audio = mel_stft.griffin_lim(mel)
+            mel_stft = get_mel_stft(device=mel.device)
+            audio = mel_stft.griffin_lim(mel, **kwargs).cpu()
         elif algorithm == "hifigan":
             assert kwargs["hifigan_config"], "hifigan_config must be set"
             assert kwargs["hifigan_checkpoint"], "hifigan_checkpoint must be set"
             cudnn_enabled = bool(kwargs["cudnn_enabled"])
+            from ..vocoders.hifigan import HiFiGanGenerator
+
             hifigan = HiFiGanGenerator(
                 config=kwargs["hifigan_config"],
                 checkpoint=kwargs["hifigan_checkpoint"],
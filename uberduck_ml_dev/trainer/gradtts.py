@@ -14,7 +14,6 @@ from torch.nn import functional as F
 from torch.nn.parallel import DistributedDataParallel as DDP
 from torch.optim.lr_scheduler import ExponentialLR
 from torch.utils.data import DataLoader
-from tensorboardX import SummaryWriter
 import time
 
 from ..models.common import MelSTFT
@@ -32,7 +31,9 @@ from ..data_loader import (
     TextAudioSpeakerLoader,
     TextMelCollate,
     DistributedBucketSampler,
+    FrameBudgetBatchSampler,
     TextMelDataset,
+    WeightedDistributedSampler,
 )
 from ..vendor.tfcompat.hparam import HParams
 from ..utils.plot import save_figure_to_numpy, plot_spectrogram
@@ -114,17 +115,41 @@ class GradTTSTrainer(TTSTrainer):
             intersperse_text=self.hparams.intersperse_text,
             intersperse_token=(len(SYMBOL_SETS[self.hparams.symbol_set])),
             symbol_set=self.hparams.symbol_set,
+            oversample_weights=self.hparams.oversample_weights,
         )
         collate_fn = TextMelCollate()
 
-        loader = DataLoader(
-            dataset=train_dataset,
-            batch_size=self.hparams.batch_size,
-            collate_fn=collate_fn,
-            drop_last=True,
-            num_workers=0,
-            shuffle=False,
-        )
+        sampler = None
+        if self.hparams.max_frames_per_batch:
+            sampler = FrameBudgetBatchSampler(
+                train_dataset,
+                self.hparams.max_frames_per_batch,
+                num_replicas=self.world_size if self.distributed_run else 1,
+                rank=self.rank if self.distributed_run else 0,
+                shuffle=True,
+            )
+            loader = DataLoader(
+                dataset=train_dataset,
+                batch_sampler=sampler,
+                collate_fn=collate_fn,
+                num_workers=0,
+            )
+        else:
+            if train_dataset.sample_weights is not None:
+                sampler = WeightedDistributedSampler(
+                    train_dataset,
+                    num_replicas=self.world_size if self.distributed_run else 1,
+                    rank=self.rank if self.distributed_run else 0,
+                )
+            loader = DataLoader(
+                dataset=train_dataset,
+                sampler=sampler,
+                batch_size=self.hparams.batch_size,
+                collate_fn=collate_fn,
+                drop_last=True,
+                num_workers=0,
+                shuffle=False,
+            )
 
         test_dataset = TextMelDataset(
             self.hparams.test_audiopaths_and_text,
@@ -171,6 +196,8 @@ class GradTTSTrainer(TTSTrainer):
         iteration = 0
         last_time = time.time()
         for epoch in range(0, self.hparams.n_epochs):
+            if sampler is not None:
+                sampler.set_epoch(epoch)
             model.train()
             dur_losses = []
             prior_losses = []
@@ -9,7 +9,6 @@ import torch
 from torch.cuda.amp import autocast, GradScaler
 import torch.distributed as dist
 from torch.nn.parallel import DistributedDataParallel as DDP
-from tensorboardX import SummaryWriter
 import time
 from torch.utils.data import DataLoader
 from random import choice
@@ -41,6 +40,9 @@ class MellotronTrainer(Tacotron2Trainer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.include_f0 = self.hparams.include_f0
+        self.n_frames_per_step_initial = self.hparams.n_frames_per_step_initial
+        self.reduction_window_schedule = self.hparams.get("reduction_window_schedule")
         self.n_frames_per_step_current = self.n_frames_per_step_initial
         self.reduction_window_idx = 0
 
@@ -70,7 +72,7 @@ class MellotronTrainer(Tacotron2Trainer):
         model.set_current_frames_per_step(fps)
         self.n_frames_per_step_current = fps
         _, _, train_loader, sampler, collate_fn = self.initialize_loader(
-            n_frames_per_step_current=self.n_frames_per_step_current,
+            n_frames_per_step=self.n_frames_per_step_current,
             include_f0=self.include_f0,
         )
         return train_loader, sampler, collate_fn
@@ -103,6 +105,7 @@ class MellotronTrainer(Tacotron2Trainer):
             )
             for batch in val_loader:
                 total_steps += 1
+                batch = self._compute_mels(batch)
                 if self.distributed_run:
                     X, y = model.module.parse_batch(batch)
                     speakers_val.append(X[5])
@@ -197,23 +200,7 @@ class MellotronTrainer(Tacotron2Trainer):
 
     @property
     def training_dataset_args(self):
-        return [
-            *super().training_dataset_args,
-            # self.training_audiopaths_and_text,
-            # self.text_cleaners,
-            # self.p_arpabet,
-            # audio params
-            # self.n_mel_channels,
-            # self.sampling_rate,
-            # self.mel_fmin,
-            # self.mel_fmax,
-            # self.filter_length,
-            # self.hop_length,
-            # self.win_length,
-            # self.max_wav_value,
-            self.include_f0,
-            # self.pos_weight,
-        ]
+        return dict(super().training_dataset_args, include_f0=self.include_f0)
 
     #     def warm_start(self, model, optimizer, start_epoch=0):
 
@@ -244,7 +231,8 @@ class MellotronTrainer(Tacotron2Trainer):
     def train(self):
         print("start train", time.perf_counter())
         train_set, val_set, train_loader, sampler, collate_fn = self.initialize_loader(
-            include_f0=self.include_f0
+            include_f0=self.include_f0,
+            n_frames_per_step=self.n_frames_per_step_current,
         )
         criterion = Tacotron2Loss(
             pos_weight=self.pos_weight
@@ -274,12 +262,13 @@ class MellotronTrainer(Tacotron2Trainer):
             train_loader, sampler, collate_fn = self.adjust_frames_per_step(
                 model, train_loader, sampler, collate_fn
             )
-            if self.distributed_run:
+            if sampler is not None:
                 sampler.set_epoch(epoch)
             for batch in train_loader:
                 start_time = time.perf_counter()
                 self.global_step += 1
                 model.zero_grad()
+                batch = self._compute_mels(batch)
                 if self.distributed_run:
                     X, y = model.module.parse_batch(batch)
                 else:
@@ -1,5 +1,6 @@
 __all__ = ["Tacotron2Loss", "Tacotron2Trainer", "config", "DEFAULTS"]
 
+import os
 from random import randint
 import time
 from typing import List
@@ -16,14 +17,15 @@ from torch.nn.parallel import DistributedDataParallel as DDP
 
 from ..data_loader import TextMelDataset, TextMelCollate
 from ..models.tacotron2 import Tacotron2
+from ..models.common import get_mel_stft
 from ..utils.plot import save_figure_to_numpy
-from ..utils.utils import reduce_tensor
+from ..utils.utils import padding_efficiency, reduce_tensor
 from ..monitoring.statistics import get_alignment_metrics
 from ..data.batch import Batch
+from ..data.features import GST_CACHE_LOCATION, GSTCache, gst_config_hash
 from ..vendor.tfcompat.hparam import HParams
 from .base import DEFAULTS as TRAINER_DEFAULTS
 from ..models.tacotron2 import DEFAULTS as TACOTRON2_DEFAULTS, INFERENCE
-from ..models.torchmoji import TorchMojiInterface
 from ..utils.plot import (
     plot_attention,
     plot_gate_outputs,
@@ -31,7 +33,13 @@ from ..utils.plot import (
 )
 from ..text.util import text_to_sequence, random_utterance
 from .base import TTSTrainer
-from ..data_loader import TextMelDataset, TextMelCollate
+from ..data_loader import (
+    DistributedBucketSampler,
+    FrameBudgetBatchSampler,
+    TextMelDataset,
+    TextMelCollate,
+    WeightedDistributedSampler,
+)
 
 
 # NOTE (Sam): This should get its own file, and loss should get its own class.
@@ -95,6 +103,8 @@ class Tacotron2Trainer(TTSTrainer):
         self.lr_decay_start = self.hparams.lr_decay_start
         self.lr_decay_rate = self.hparams.lr_decay_rate
         self.lr_decay_min = self.hparams.lr_decay_min
+        self.bucket_boundaries = self.hparams.get("bucket_boundaries")
+        self.max_frames_per_batch = self.hparams.get("max_frames_per_batch")
 
         # NOTE (Sam): its not clear we should lambdafy models here rather than the data_loader or some other helper function.
         if self.hparams.get("gst_type") == "torchmoji":
@@ -105,6 +115,7 @@ class Tacotron2Trainer(TTSTrainer):
                 "torchmoji_model_file"
             ), "torchmoji_model_file must be set"
             assert self.hparams.get("gst_dim"), "gst_dim must be set"
+            from ..models.torchmoji import TorchMojiInterface
 
             self.torchmoji = TorchMojiInterface(
                 self.hparams.get("torchmoji_vocabulary_file"),
@@ -112,12 +123,68 @@ class Tacotron2Trainer(TTSTrainer):
             )
             # TODO (Sam): rename gst to gsts[0].
             self.compute_gst = lambda texts: self.torchmoji.encode_texts(texts)
+            model_file = self.hparams.get("torchmoji_model_file")
+            self.gst_cache = GSTCache(
+                self.hparams.get("gst_cache_dir") or GST_CACHE_LOCATION,
+                gst_config_hash(
+                    torchmoji_model_file=os.path.abspath(model_file),
+                    torchmoji_model_mtime=os.path.getmtime(model_file),
+                    torchmoji_vocabulary_file=os.path.abspath(
+                        self.hparams.get("torchmoji_vocabulary_file")
+                    ),
+                    maxlen=self.torchmoji.st.fixed_length,
+                ),
+            )
         else:
             self.compute_gst = None
+            self.gst_cache = None
 
         if not self.sample_inference_speaker_ids:
             self.sample_inference_speaker_ids = list(range(self.n_speakers))
 
+        self.mel_stft = None
+        if self.hparams.get("stft_on_device", False):
+            self.mel_stft = get_mel_stft(
+                device=self.device,
+                filter_length=self.filter_length,
+                hop_length=self.hop_length,
+                win_length=self.win_length,
+                n_mel_channels=self.n_mel_channels,
+                sampling_rate=self.sampling_rate,
+                mel_fmin=self.mel_fmin,
+                mel_fmax=self.mel_fmax,
+                padding=self.hparams.get("padding"),
+                backend=self.hparams.get("stft_backend", "conv"),
+            )
+
+    def _compute_mels(self, batch):
+        """Fill in mel_padded of a batch collated from audio (stft_on_device), computing
+        the mels of the whole batch on the device of its audio."""
+        if batch["mel_padded"] is not None:
+            return batch
+        n_frames = self.mel_stft.stft_fn.n_frames(batch["audio_lengths"])
+        if not torch.equal(n_frames.cpu(), batch["output_lengths"].cpu()):
+            raise ValueError(
+                "On-device mels have different frame counts than the dataset, so the "
+                "trainer and TextMelDataset disagree on the STFT parameters (e.g. padding)"
+            )
+        with torch.no_grad():
+            mel = self.mel_stft.mel_spectrogram(
+                batch["audio_padded"], lengths=batch["audio_lengths"]
+            )
+        # NOTE (Sam): the collate rounds frames up to a multiple of n_frames_per_step.
+        batch["mel_padded"] = nn.functional.pad(
+            mel, (0, batch["gate_target"].size(1) - mel.size(2))
+        )
+        return batch
+
+    def _sample_pair(self, mel, mel_target):
+        """Invert a teacher-forced mel and its target in one batched griffin-lim call."""
+        audio = self.sample(mel=torch.stack([mel, mel_target]))
+        if audio is None:
+            return None, None
+        return audio[:1], audio[1:]
+
     def log_training(
         self,
         model,
@@ -142,6 +209,11 @@ class Tacotron2Trainer(TTSTrainer):
             self.global_step,
             scalar=step_duration_seconds,
         )
+        self.log(
+            "PaddingEfficiency/train",
+            self.global_step,
+            scalar=padding_efficiency(X["output_lengths"]),
+        )
 
         batch_levels = X["speaker_ids"]
         batch_levels_unique = torch.unique(batch_levels)
@@ -170,8 +242,9 @@ class Tacotron2Trainer(TTSTrainer):
             alignment_diagonalness = alignment_metrics["diagonalness"]
             alignment_max = alignment_metrics["max"]
             sample_idx = randint(0, y_pred["mel_outputs_postnet"].size(0) - 1)
-            audio = self.sample(mel=y_pred["mel_outputs_postnet"][sample_idx])
-            audio_target = self.sample(mel=mel_target[sample_idx])
+            audio, audio_target = self._sample_pair(
+                y_pred["mel_outputs_postnet"][sample_idx], mel_target[sample_idx]
+            )
             self.log(
                 "AlignmentDiagonalness/train",
                 self.global_step,
@@ -352,8 +425,9 @@ class Tacotron2Trainer(TTSTrainer):
         alignment_diagonalness = alignment_metrics["diagonalness"]
         alignment_max = alignment_metrics["max"]
         sample_idx = randint(0, self.batch_size)
-        audio = self.sample(mel=y_pred["mel_outputs_postnet"][sample_idx])
-        audio_target = self.sample(mel=X["mel_padded"][sample_idx])
+        audio, audio_target = self._sample_pair(
+            y_pred["mel_outputs_postnet"][sample_idx], X["mel_padded"][sample_idx]
+        )
         self.log(
             "AlignmentDiagonalness/val", self.global_step, scalar=alignment_diagonalness
         )
@@ -417,14 +491,45 @@ class Tacotron2Trainer(TTSTrainer):
         sampler = None
         if self.distributed_run:
             self.init_distributed()
-            sampler = DistributedSampler(train_set, rank=self.rank)
-        train_loader = DataLoader(
-            train_set,
-            batch_size=self.batch_size,
-            shuffle=(sampler is None),
-            sampler=sampler,
-            collate_fn=collate_fn,
-        )
+        num_replicas = self.world_size if self.distributed_run else 1
+        rank = self.rank if self.distributed_run else 0
+        if self.max_frames_per_batch:
+            sampler = FrameBudgetBatchSampler(
+                train_set,
+                self.max_frames_per_batch,
+                num_replicas=num_replicas,
+                rank=rank,
+                shuffle=True,
+            )
+        elif self.bucket_boundaries:
+            sampler = DistributedBucketSampler(
+                train_set,
+                self.batch_size,
+                self.bucket_boundaries,
+                num_replicas=num_replicas,
+                rank=rank,
+                shuffle=True,
+            )
+        if sampler is not None:
+            train_loader = DataLoader(
+                train_set,
+                batch_sampler=sampler,
+                collate_fn=collate_fn,
+            )
+        else:
+            if train_set.sample_weights is not None:
+                sampler = WeightedDistributedSampler(
+                    train_set, num_replicas=num_replicas, rank=rank
+                )
+            elif self.distributed_run:
+                sampler = DistributedSampler(train_set, rank=self.rank)
+            train_loader = DataLoader(
+                train_set,
+                batch_size=self.batch_size,
+                shuffle=(sampler is None),
+                sampler=sampler,
+                collate_fn=collate_fn,
+            )
         return train_set, val_set, train_loader, sampler, collate_fn
 
     def train(
@@ -471,10 +576,11 @@ class Tacotron2Trainer(TTSTrainer):
             #             train_loader, sampler, collate_fn = self.adjust_frames_per_step(
             #                 model, train_loader, sampler, collate_fn
             #             )
-            if self.distributed_run:
+            if sampler is not None:
                 sampler.set_epoch(epoch)
             for batch_idx, batch in enumerate(train_loader):
                 self.global_step += 1
+                batch = self._compute_mels(batch)
 
                 # Learning Rate decay, can be disabled if lr_decay_start is == 0 or None
                 if (self.global_step > self.lr_decay_start) and (
@@ -620,6 +726,7 @@ class Tacotron2Trainer(TTSTrainer):
             )
             # NOTE (Sam): train loop should be in base trainer
             for step_counter, batch in enumerate(val_loader):
+                batch = self._compute_mels(batch)
 
                 # NOTE (Sam): Could call subsets directly in function arguments since model_input is only reused in logging
                 model_input = batch.subset(
@@ -700,6 +807,7 @@ class Tacotron2Trainer(TTSTrainer):
 
         args = dict(**self.training_dataset_args)
         args["audiopaths_and_text"] = self.val_audiopaths_and_text
+        args["oversample_weights"] = None
         return args
 
     @property
@@ -716,13 +824,38 @@ class Tacotron2Trainer(TTSTrainer):
             "hop_length": self.hop_length,
             "win_length": self.win_length,
             "symbol_set": self.symbol_set,
+            "padding": self.hparams.get("padding"),
+            "f0_min": self.hparams.get("f0_min", 80),
+            "f0_max": self.hparams.get("f0_max", 880),
+            "harmonic_thresh": self.hparams.get("harmonic_thresh", 0.25),
             "max_wav_value": self.max_wav_value,
             "pos_weight": self.pos_weight,
             "compute_gst": self.compute_gst,
+            "feature_store": self.hparams.get("feature_store"),
+            "gst_cache": self.gst_cache,
+            "stft_backend": self.hparams.get("stft_backend", "conv"),
+            "return_audio": self.hparams.get("stft_on_device", False),
+            "oversample_weights": self.hparams.get("oversample_weights"),
+            "verbose": self.rank is None or self.rank == 0,
         }
 
 
 config = TRAINER_DEFAULTS.values()
 config.update(TACOTRON2_DEFAULTS.values())
 config.update({"sample_inference_text": "Duck party on aisle 6."})
+# NOTE (Sam): path to a feature store written by TextMelDataset.featurize, None computes features on the fly.
+config.update({"feature_store": None})
+# NOTE (Sam): mel frame boundaries for DistributedBucketSampler, e.g. [0, 200, 400, 600, 800, 1000].
+# Items outside of the boundaries are dropped. None samples batches uniformly.
+config.update({"bucket_boundaries": None})
+# NOTE (Sam): padded mel frames per batch for FrameBudgetBatchSampler, which then replaces batch_size.
+config.update({"max_frames_per_batch": None})
+# NOTE (Sam): where TorchMoji GSTs of the transcripts are cached, None uses ~/.cache/uberduck/gsts.
+config.update({"gst_cache_dir": None})
+# NOTE (Sam): "conv" or "fft", see STFT_BACKENDS and exec/benchmark_stft.py.
+config.update({"stft_backend": "conv"})
+# NOTE (Sam): compute mels of each batch of raw audio on the training device instead of in loader workers.
+config.update({"stft_on_device": False})
+# NOTE (Sam): {speaker id: weight} to sample the items of those speakers weight times as often.
+config.update({"oversample_weights": None})
 DEFAULTS = HParams(**config)
@@ -19,10 +19,9 @@ from torch.nn import functional as F
 from torch.nn.parallel import DistributedDataParallel as DDP
 from torch.optim.lr_scheduler import ExponentialLR
 from torch.utils.data import DataLoader
-from tensorboardX import SummaryWriter
 import time
 
-from ..models.common import MelSTFT
+from ..models.common import get_mel_stft, get_stft
 from ..utils.plot import (
     plot_attention,
     plot_gate_outputs,
@@ -41,6 +40,7 @@ from ..data_loader import (
     TextAudioSpeakerLoader,
     TextAudioSpeakerCollate,
     DistributedBucketSampler,
+    FrameBudgetBatchSampler,
 )
 from ..vendor.tfcompat.hparam import HParams
 from ..utils.plot import save_figure_to_numpy, plot_spectrogram
@@ -124,11 +124,23 @@ class VITSTrainer(TTSTrainer):
         for param in self.REQUIRED_HPARAMS:
             if not hasattr(self, param):
                 raise Exception(f"VITSTrainer missing a required param: {param}")
-        self.mel_stft = MelSTFT(
+        self.mel_stft = get_mel_stft(
             device=self.device,
             rank=self.rank,
             padding=(self.filter_length - self.hop_length) // 2,
+            backend=self.hparams.get("stft_backend", "conv"),
         )
+        self.stft = None
+        if self.hparams.get("stft_on_device", False):
+            self.stft = get_stft(
+                device=self.device,
+                rank=self.rank,
+                filter_length=self.filter_length,
+                hop_length=self.hop_length,
+                win_length=self.win_length,
+                padding=(self.filter_length - self.hop_length) // 2,
+                backend=self.hparams.get("stft_backend", "conv"),
+            )
 
     def init_distributed(self):
         if not self.distributed_run:
@@ -201,12 +213,19 @@ class VITSTrainer(TTSTrainer):
         ret = []
         if self.device == "cuda":
             for arg in args:
-                arg = arg.cuda(self.rank, non_blocking=True)
+                if arg is not None:
+                    arg = arg.cuda(self.rank, non_blocking=True)
                 ret.append(arg)
             return ret
         else:
             return args
 
+    def _spectrogram(self, y, y_lengths):
+        """Spectrograms and lengths of a [B, 1, T] batch of audio (stft_on_device)."""
+        with torch.no_grad():
+            spec, _ = self.stft.transform(y.squeeze(1), y_lengths)
+        return spec, self.stft.n_frames(y_lengths)
+
     def _evaluate(self, generator, val_loader):
         print("Validation ...")
         generator.eval()
@@ -221,6 +240,8 @@ class VITSTrainer(TTSTrainer):
                     y_lengths,
                     speakers,
                 ) = self._batch_to_device(*batch)
+                if spec is None:
+                    spec, spec_lengths = self._spectrogram(y, y_lengths)
                 x = x[:1]
                 x_lengths = x_lengths[:1]
                 spec = spec[:1]
@@ -280,6 +301,8 @@ class VITSTrainer(TTSTrainer):
                 y_lengths,
                 speakers,
             ) = self._batch_to_device(*batch)
+            if spec is None:
+                spec, spec_lengths = self._spectrogram(y, y_lengths)
 
             with autocast(enabled=self.fp16_run):
                 (
@@ -371,14 +394,27 @@ class VITSTrainer(TTSTrainer):
             debug=self.debug,
             debug_dataset_size=self.debug_dataset_size,
         )
-        train_sampler = DistributedBucketSampler(
-            train_dataset,
-            self.batch_size,
-            [32, 300, 400, 500, 600, 700, 800, 900, 1000],
-            num_replicas=self.world_size,
-            rank=self.rank,
-            shuffle=True,
-        )
+        max_frames_per_batch = self.hparams.get("max_frames_per_batch")
+        bucket_boundaries = [32, 300, 400, 500, 600, 700, 800, 900, 1000]
+        if max_frames_per_batch:
+            train_sampler = FrameBudgetBatchSampler(
+                train_dataset,
+                max_frames_per_batch,
+                num_replicas=self.world_size,
+                rank=self.rank,
+                shuffle=True,
+                # NOTE (Sam): drop the same long clips as the bucket sampler, which could OOM.
+                max_length=bucket_boundaries[-1],
+            )
+        else:
+            train_sampler = DistributedBucketSampler(
+                train_dataset,
+                self.batch_size,
+                bucket_boundaries,
+                num_replicas=self.world_size,
+                rank=self.rank,
+                shuffle=True,
+            )
         collate_fn = TextAudioSpeakerCollate()
         train_loader = DataLoader(
             train_dataset,
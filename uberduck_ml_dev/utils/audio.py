@@ -4,6 +4,7 @@ __all__ = [
     "cumulativeMeanNormalizedDifferenceFunction",
     "getPitch",
     "compute_yin",
+    "compute_f0_batch",
     "convert_to_wav",
     "match_target_amplitude",
     "modify_leading_silence",
@@ -12,6 +13,7 @@ __all__ = [
     "trim_audio",
     "MAX_WAV_INT16",
     "load_wav_to_torch",
+    "read_wav_header",
     "overlay_mono",
     "overlay_stereo",
     "mono_to_stereo",
@@ -55,12 +57,12 @@ OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 
-from ..models.common import MelSTFT
+from ..models.common import get_mel_stft
 
 
 def mel_to_audio(mel, algorithm="griffin-lim", **kwargs):
     if algorithm == "griffin-lim":
-        mel_stft = MelSTFT()
+        mel_stft = get_mel_stft(device=mel.device)
         audio = mel_stft.griffin_lim(mel)
     else:
         raise NotImplemented
@@ -70,8 +72,10 @@ def mel_to_audio(mel, algorithm="griffin-lim", **kwargs):
 # adapted from https://github.com/patriceguyot/Yin
 
 import numpy as np
+from scipy.fft import dct
 from scipy.io.wavfile import read
 import torch
+from torch.nn import functional as F
 
 
 def differenceFunction(x, N, tau_max):
@@ -163,38 +167,169 @@ def compute_yin(
     """
 
     tau_min = int(sr / f0_max)
-    tau_max = int(sr / f0_min)
+    tau_max = min(int(sr / f0_min), w_len)
 
     timeScale = range(
         0, len(sig) - w_len, w_step
     )  # time values for each analysis window
     times = [t / float(sr) for t in timeScale]
-    frames = [sig[t : t + w_len] for t in timeScale]
-
-    pitches = [0.0] * len(timeScale)
-    harmonic_rates = [0.0] * len(timeScale)
-    argmins = [0.0] * len(timeScale)
-
-    for i, frame in enumerate(frames):
-        # Compute YIN
-        df = differenceFunction(frame, w_len, tau_max)
-        cmdf = cumulativeMeanNormalizedDifferenceFunction(df, tau_max)
-        p = getPitch(cmdf, tau_min, tau_max, harmo_thresh)
-
-        # Get results
-        if np.argmin(cmdf) > tau_min:
-            argmins[i] = float(sr / np.argmin(cmdf))
-        if p != 0:  # A pitch was found
-            pitches[i] = float(sr / p)
-            harmonic_rates[i] = cmdf[p]
-        else:  # No pitch, but we compute a value of the harmonic rate
-            harmonic_rates[i] = min(cmdf)
-
+    if len(timeScale) == 0:
+        return [], [], [], times
+
+    # NOTE (Sam): all frames are processed at once; this matches calling differenceFunction,
+    # cumulativeMeanNormalizedDifferenceFunction and getPitch on each frame in turn.
+    sig = np.asarray(sig, np.float64)
+    starts = np.asarray(timeScale)
+    windows = np.lib.stride_tricks.sliding_window_view(sig[: starts[-1] + w_len], w_len)
+    frames = windows[::w_step]
+
+    # Difference function (equation (6) in [1]), with the frame energies taken from a single
+    # cumulative sum over the whole signal.
+    sig_cumsum = np.concatenate(([0.0], (sig * sig).cumsum()))
+    lags = np.arange(tau_max)
+    cumsum_windows = np.lib.stride_tricks.sliding_window_view(sig_cumsum, w_len + 1)
+    cumsum_windows = cumsum_windows[::w_step][: len(starts)]
+    energy = (
+        cumsum_windows[:, w_len : w_len - tau_max : -1] - cumsum_windows[:, :tau_max]
+    )
+    energy += (cumsum_windows[:, w_len] - cumsum_windows[:, 0])[:, None]
+    size = w_len + tau_max
+    p2 = (size // 32).bit_length()
+    nice_numbers = (16, 18, 20, 24, 25, 27, 30, 32)
+    size_pad = min(x * 2**p2 for x in nice_numbers if x * 2**p2 >= size)
+    fc = np.fft.rfft(frames, size_pad, axis=1)
+    if size_pad % 2 == 0:
+        # NOTE (Sam): the power spectrum is real and even, so its inverse FFT is a (cheaper) DCT-I.
+        power = np.square(fc.real)
+        power += np.square(fc.imag)
+        conv = dct(power, type=1, axis=1, overwrite_x=True)[:, :tau_max] / size_pad
+    else:
+        conv = np.fft.irfft(fc * fc.conjugate(), axis=1)[:, :tau_max]
+    df = energy - 2 * conv
+
+    # Cumulative mean normalized difference function (equation (8) in [1]).
+    cmdf = np.ones_like(df)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.divide(df[:, 1:] * lags[1:], np.cumsum(df[:, 1:], axis=1), out=cmdf[:, 1:])
+
+    # First tau under the threshold, then follow the CMND down to its local minimum.
+    below = cmdf[:, tau_min:tau_max] < harmo_thresh
+    voiced = below.any(axis=1)
+    first = np.argmax(below, axis=1) + tau_min
+    stop = np.ones_like(cmdf, dtype=bool)
+    stop[:, :-1] = ~(cmdf[:, 1:] < cmdf[:, :-1])
+    p = np.argmax(stop & (lags >= first[:, None]), axis=1)
+    p = np.where(voiced, p, 0)
+
+    rows = np.arange(len(frames))
+    argmin = np.argmin(cmdf, axis=1)
+    pitches = np.where(p != 0, sr / np.maximum(p, 1), 0.0)
+    argmins = np.where(argmin > tau_min, sr / np.maximum(argmin, 1), 0.0)
+    harmonic_rates = np.where(p != 0, cmdf[rows, p], np.nanmin(cmdf, axis=1))
+
+    pitches = pitches.tolist()
+    harmonic_rates = harmonic_rates.tolist()
+    argmins = argmins.tolist()
     return pitches, harmonic_rates, argmins, times
 
 
+def compute_f0_batch(
+    audio,
+    lengths,
+    sr,
+    filter_length=1024,
+    hop_length=256,
+    f0_min=80,
+    f0_max=880,
+    harmo_thresh=0.25,
+    n_frames=None,
+    dtype=torch.float64,
+):
+    """
+    Compute YIN f0 for a batch of zero padded audio with torch ops.
+
+    Each item matches `compute_yin(audio[i, :lengths[i]], sr, filter_length, hop_length, ...)`
+    padded with `int((filter_length / hop_length) / 2)` zeros on either side, as done in
+    `TextMelDataset._get_f0`, so that frames line up with `MelSTFT` frames.
+
+    :param audio: [B, T] tensor of audio, zero padded past each item's length
+    :param lengths: [B] tensor of audio lengths (samples)
+    :param n_frames: number of output frames, e.g. the padded mel length. Defaults to the longest item.
+    :param dtype: dtype to compute in; float64 matches `compute_yin` exactly
+    :returns: [B, 1, n_frames] tensor of fundamental frequencies (0 where unvoiced or padded)
+    """
+    w_len, w_step = filter_length, hop_length
+    tau_min = int(sr / f0_max)
+    tau_max = min(int(sr / f0_min), w_len)
+    pad = int((filter_length / hop_length) / 2)
+    device = audio.device
+    lengths = torch.as_tensor(lengths, device=device)
+    audio = audio.to(dtype)
+    batch_size, max_len = audio.shape
+
+    # NOTE (Sam): compute_yin uses frames starting at range(0, len(sig) - w_len, w_step).
+    n_yin = torch.clamp(
+        torch.div(lengths - w_len - 1, w_step, rounding_mode="floor") + 1, min=0
+    )
+    max_yin = int(n_yin.max()) if batch_size else 0
+    if n_frames is None:
+        n_frames = max_yin + 2 * pad
+    f0 = torch.zeros(batch_size, 1, n_frames, dtype=torch.float32, device=device)
+    if max_yin == 0:
+        return f0
+    frames = audio.unfold(1, w_len, w_step)[:, :max_yin]
+    starts = torch.arange(max_yin, device=device) * w_step
+
+    # Difference function (equation (6) in [1]).
+    audio_cumsum = F.pad(torch.cumsum(audio * audio, dim=1), (1, 0))
+    lags = torch.arange(tau_max, device=device)
+    no_tau = torch.tensor(tau_max, device=device)
+
+    def _energy(offsets):
+        index = (starts[:, None] + offsets).reshape(1, -1).expand(batch_size, -1)
+        return torch.gather(audio_cumsum, 1, index).reshape(batch_size, max_yin, -1)
+
+    energy = (
+        _energy(w_len - lags)
+        - _energy(lags)
+        + (_energy(lags[:1] + w_len) - _energy(lags[:1]))
+    )
+    size = w_len + tau_max
+    p2 = (size // 32).bit_length()
+    nice_numbers = (16, 18, 20, 24, 25, 27, 30, 32)
+    size_pad = min(x * 2**p2 for x in nice_numbers if x * 2**p2 >= size)
+    fc = torch.fft.rfft(frames, size_pad, dim=-1)
+    conv = torch.fft.irfft(fc.real**2 + fc.imag**2, size_pad, dim=-1)[..., :tau_max]
+    df = energy - 2 * conv
+
+    # Cumulative mean normalized difference function (equation (8) in [1]).
+    cmdf = torch.ones_like(df)
+    cmdf[..., 1:] = df[..., 1:] * lags[1:] / torch.cumsum(df[..., 1:], dim=-1)
+
+    # First tau under the threshold, then follow the CMND down to its local minimum.
+    below = cmdf < harmo_thresh
+    below[..., :tau_min] = False
+    voiced = below.any(dim=-1)
+    first = torch.where(below, lags, no_tau).min(dim=-1).values
+    stop = torch.ones_like(below)
+    stop[..., :-1] = ~(cmdf[..., 1:] < cmdf[..., :-1])
+    stop &= lags >= first[..., None]
+    p = torch.where(stop, lags, no_tau).min(dim=-1).values
+
+    valid = torch.arange(max_yin, device=device) < n_yin[:, None]
+    voiced &= valid & (p != 0)
+    pitches = torch.where(
+        voiced, sr / torch.clamp(p, min=1).to(dtype), torch.zeros_like(df[..., 0])
+    )
+    n_copy = min(max_yin, n_frames - pad)
+    if n_copy > 0:
+        f0[:, 0, pad : pad + n_copy] = pitches[:, :n_copy].to(f0.dtype)
+    return f0
+
+
 import os
 import shlex
+import struct
 import subprocess
 
 
@@ -226,8 +361,6 @@ def convert_to_wav(filename, output, sr=22050):
     return output
 
 
-import librosa
-from pydub import AudioSegment, silence
 from scipy.io.wavfile import write
 
 MAX_WAV_INT16 = 32768
@@ -239,6 +372,8 @@ def match_target_amplitude(audio_segment, target_dbfs):
 
 
 def modify_leading_silence(audio, desired_silence):
+    from pydub import AudioSegment, silence
+
     leading_silence = silence.detect_leading_silence(audio)
     if leading_silence > desired_silence:
         audio = audio[leading_silence - desired_silence :]
@@ -264,6 +399,8 @@ def normalize_audio_segment(audio):
 def normalize_audio(path, new_path):
     assert path.endswith(".wav")
     assert new_path.endswith(".wav")
+    from pydub import AudioSegment
+
     audio_segment = AudioSegment.from_wav(path)
     audio_segment = normalize_audio_segment(audio_segment)
     audio_segment.export(new_path, format="wav")
@@ -274,6 +411,8 @@ def trim_audio(path, new_path, top_db=20):
 
     Similar functionality to normalize_audio_segment, but uses librosa instead of pydub.
     """
+    import librosa
+
     signal, sr = librosa.load(path)
     trimmed, _ = librosa.effects.trim(signal, top_db=top_db)
     trimmed = (MAX_WAV_INT16 * trimmed).astype(np.int16)
@@ -285,6 +424,44 @@ def load_wav_to_torch(path):
     return torch.FloatTensor(data.astype(np.float32)), sr
 
 
+def read_wav_header(path):
+    """Read the RIFF header of a wav file without reading its samples.
+
+    Returns (n_frames, sampling_rate, channels, sample_width) where n_frames is the number of
+    samples per channel and sample_width is in bytes.
+    """
+    with open(path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff not in (b"RIFF", b"RF64") or wave != b"WAVE":
+            raise ValueError(f"{path} is not a RIFF/WAVE file")
+        fmt = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"{path} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", header)
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                f.seek(chunk_size - 16 + chunk_size % 2, 1)
+            elif chunk_id == b"data":
+                break
+            else:
+                # NOTE (Sam): chunks are padded to an even number of bytes.
+                f.seek(chunk_size + chunk_size % 2, 1)
+        if fmt is None:
+            raise ValueError(f"{path} has no fmt chunk before its data chunk")
+        _, channels, sampling_rate, _, block_align, bits_per_sample = fmt
+        if chunk_size == 0xFFFFFFFF or chunk_size == 0:
+            # NOTE (Sam): streamed or RF64 files don't have a usable data size, so use the file size.
+            chunk_size = os.fstat(f.fileno()).st_size - f.tell()
+    return (
+        chunk_size // block_align,
+        sampling_rate,
+        channels,
+        (bits_per_sample + 7) // 8,
+    )
+
+
 from scipy import signal
 
 
@@ -322,6 +499,8 @@ def stereo_to_mono(audio):
     """
     Convert stereo audio data to mean mono audio data.
     """
+    import librosa
+
     return librosa.to_mono(audio)
 
 
@@ -329,6 +508,8 @@ def resample(audio, source_sr, target_sr):
     """
     Change the sampling rate of a mono np audio array
     """
+    import librosa
+
     resampled_audio = librosa.resample(audio, source_sr, target_sr)
     return resampled_audio
 
@@ -21,7 +21,7 @@ audio_denoised = audio_denoised * normalize
 
 import sys
 import torch
-from ..models.common import STFT
+from ..models.common import get_stft
 
 
 class Denoiser(torch.nn.Module):
@@ -31,7 +31,7 @@ class Denoiser(torch.nn.Module):
         self, hifigan, filter_length=1024, n_overlap=4, win_length=1024, mode="zeros"
     ):
         super(Denoiser, self).__init__()
-        self.stft = STFT(
+        self.stft = get_stft(
             filter_length=filter_length,
             hop_length=int(filter_length / n_overlap),
             win_length=win_length,
@@ -1,11 +1,13 @@
 __all__ = [
     "load_filepaths_and_text",
     "window_sumsquare",
+    "spectral_convergence",
     "griffin_lim",
     "dynamic_range_compression",
     "dynamic_range_decompression",
     "to_gpu",
     "get_mask_from_lengths",
+    "padding_efficiency",
     "reduce_tensor",
     "subsequent_mask",
     "convert_pad_shape",
@@ -22,12 +24,9 @@ __all__ = [
 ]
 
 
-import soundfile as sf
-import pandas as pd
 import torch
 import numpy as np
 from scipy.signal import get_window
-import librosa.util as librosa_util
 from torch.nn import functional as F
 import torch.distributed as dist
 
@@ -86,6 +85,8 @@ def window_sumsquare(
     x = np.zeros(n, dtype=dtype)
 
     # Compute the squared window at the desired length
+    import librosa.util as librosa_util
+
     win_sq = get_window(window, win_length, fftbins=True)
     win_sq = librosa_util.normalize(win_sq, norm=norm) ** 2
     win_sq = librosa_util.pad_center(win_sq, n_fft)
@@ -97,22 +98,56 @@ def window_sumsquare(
     return x
 
 
-def griffin_lim(magnitudes, stft_fn, n_iters=30):
+def spectral_convergence(magnitudes, rebuilt, lengths=None):
+    """||magnitudes - rebuilt|| / ||magnitudes|| of every item of a [B, n_freq, T] batch."""
+    if lengths is not None:
+        mask = get_mask_from_lengths(lengths, magnitudes.size(-1))[:, None, :]
+        magnitudes = magnitudes * mask
+        rebuilt = rebuilt * mask
+    error = torch.linalg.norm((magnitudes - rebuilt).flatten(1), dim=1)
+    return error / torch.linalg.norm(magnitudes.flatten(1), dim=1).clamp(min=1e-8)
+
+
+def griffin_lim(
+    magnitudes, stft_fn, n_iters=30, momentum=0.0, lengths=None, tolerance=None
+):
     """
     PARAMS
     ------
-    magnitudes: spectrogram magnitudes
+    magnitudes: [B, n_freq, T] spectrogram magnitudes
     stft_fn: STFT class with transform (STFT) and inverse (ISTFT) methods
-    """
+    momentum: 0 is plain Griffin-Lim, ~0.99 the fast Griffin-Lim of Perraudin et al. (2013),
+        which needs far fewer iterations for the same spectral convergence
+    lengths: valid frames of each item; later frames and samples are zeroed
+    tolerance: stop once the spectral convergence of every item is below it
 
-    angles = np.angle(np.exp(2j * np.pi * np.random.rand(*magnitudes.size())))
-    angles = angles.astype(np.float32)
-    angles = torch.autograd.Variable(torch.from_numpy(angles))
+    RETURNS
+    -------
+    signal: [B, (T - 1) * hop_length] on the device of magnitudes
+    """
+    if lengths is not None:
+        lengths = lengths.to(magnitudes.device)
+        mask = get_mask_from_lengths(lengths, magnitudes.size(-1))
+        magnitudes = magnitudes * mask[:, None, :]
+    angles = 2 * np.pi * torch.rand(magnitudes.size(), device=magnitudes.device)
     signal = stft_fn.inverse(magnitudes, angles).squeeze(1)
-
+    previous = None
     for i in range(n_iters):
-        _, angles = stft_fn.transform(signal)
+        rebuilt_magnitudes, phases = stft_fn.transform(signal)
+        if tolerance is not None:
+            convergence = spectral_convergence(magnitudes, rebuilt_magnitudes, lengths)
+            if convergence.max() < tolerance:
+                break
+        rebuilt = torch.polar(rebuilt_magnitudes, phases)
+        if momentum and previous is not None:
+            angles = torch.angle(rebuilt - (momentum / (1 + momentum)) * previous)
+        else:
+            angles = phases
+        previous = rebuilt
         signal = stft_fn.inverse(magnitudes, angles).squeeze(1)
+    if lengths is not None:
+        samples = lengths * stft_fn.hop_length
+        signal = signal * get_mask_from_lengths(samples, signal.size(-1))
     return signal
 
 
@@ -155,6 +190,11 @@ def get_mask_from_lengths(lengths: torch.Tensor, max_len: int = 0):
     return mask
 
 
+def padding_efficiency(lengths: torch.Tensor):
+    """Fraction of a batch padded to its longest item that is not padding."""
+    return (lengths.sum() / (len(lengths) * lengths.max())).item()
+
+
 def reduce_tensor(tensor, n_gpus):
     rt = tensor.clone()
     dist.all_reduce(rt, op=dist.ReduceOp.SUM)